@@ -0,0 +1,217 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# ============================================
+# PER-STAGE CONCURRENCY LIMITS (BACKPRESSURE)
+# ============================================
+
+EXTRACT = 'extract'
+SERVE = 'serve'
+# Antriannya dikelola komponen lain (JobManager, PostprocessPool), lihat QueueStage
+DOWNLOAD = 'download'
+POSTPROCESS = 'postprocess'
+
+# (batas bersamaan, panjang antrian tunggu, maksimum lama menunggu dalam detik)
+STAGE_SETTINGS = {
+    EXTRACT: (
+        int(os.environ.get('EXTRACT_CONCURRENCY', 8)),
+        int(os.environ.get('EXTRACT_QUEUE', 32)),
+        float(os.environ.get('EXTRACT_MAX_WAIT', 10)),
+    ),
+    SERVE: (
+        int(os.environ.get('SERVE_CONCURRENCY', 64)),
+        int(os.environ.get('SERVE_QUEUE', 128)),
+        float(os.environ.get('SERVE_MAX_WAIT', 5)),
+    ),
+}
+DEFAULT_RETRY_AFTER = 5
+SERVICE_TIME_WEIGHT = 0.2  # bobot EWMA lama satu slot dipakai
+
+
+class StageBusy(Exception):
+    """Raised when a stage's wait queue is full or the wait timed out"""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f'{stage} stage is busy')
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('event', 'granted')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Stage:
+    """Counting semaphore with a bounded FIFO wait queue
+
+    A released slot is handed straight to the oldest waiter, so waiters
+    are served in arrival order and nobody can barge in. When max_queue
+    callers are already waiting, acquire() fails at once instead of
+    piling up more work; a waiter that gets no slot within max_wait
+    gives up. Both raise StageBusy with an estimated Retry-After.
+    """
+
+    def __init__(self, name, limit, max_queue, max_wait):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.queued = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.service_time = None
+
+    def acquire(self):
+        """Take a slot, waiting in line if needed; return seconds waited"""
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                self.admitted += 1
+                return 0.0
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise StageBusy(self.name, self._retry_after())
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+            self.queued += 1
+
+        started = time.monotonic()
+        waiter.event.wait(self.max_wait)
+        waited = time.monotonic() - started
+        with self._lock:
+            # Slot bisa diberikan tepat saat timeout habis: tetap dipakai
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                self.timeouts += 1
+                raise StageBusy(self.name, self._retry_after())
+            self.admitted += 1
+            self.waited += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return waited
+
+    def release(self, held=None):
+        """Free a slot; held is how long it was used (for Retry-After estimates)"""
+        with self._lock:
+            if held is not None:
+                self.service_time = held if self.service_time is None else (
+                    SERVICE_TIME_WEIGHT * held + (1 - SERVICE_TIME_WEIGHT) * self.service_time
+                )
+            if self._waiters:
+                # Slot langsung berpindah ke penunggu terlama, _active tidak berubah
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self._active -= 1
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the block; yields the seconds waited for it"""
+        waited = self.acquire()
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - started)
+
+    def _retry_after(self):
+        # Dipanggil dengan self._lock terkunci
+        if self.service_time is None:
+            return DEFAULT_RETRY_AFTER
+        return max(1, math.ceil((len(self._waiters) + 1) / self.limit * self.service_time))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'active': self._active,
+                'waiting': len(self._waiters),
+                'max_queue': self.max_queue,
+                'queued': self.queued,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'avg_wait': round(self.wait_total / self.waited, 3) if self.waited else None,
+                'max_wait': round(self.wait_max, 3),
+                'avg_service_time': round(self.service_time, 3) if self.service_time is not None else None,
+            }
+
+
+class QueueStage:
+    """Admission for a stage whose wait queue lives in another component
+
+    Download jobs wait in the JobManager and ffmpeg steps in the
+    PostprocessPool; here new work is only checked against their queue.
+    check() raises StageBusy when it is full, and stats() has the same
+    fields as Stage.stats(). The owner provides saturated(),
+    retry_after() and queue_stats().
+    """
+
+    def __init__(self, name, owner):
+        self.name = name
+        self.owner = owner
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+
+    def check(self):
+        """Raise StageBusy if the owner's queue has no room for more work"""
+        busy = self.owner.saturated()
+        with self._lock:
+            if busy:
+                self.rejected += 1
+            else:
+                self.admitted += 1
+        if busy:
+            raise StageBusy(self.name, self.owner.retry_after() or DEFAULT_RETRY_AFTER)
+
+    def stats(self):
+        data = self.owner.queue_stats()
+        with self._lock:
+            data.update(admitted=self.admitted, rejected=self.rejected, timeouts=0)
+        return data
+
+
+class AdmissionController:
+    """Server-wide concurrency limits per pipeline stage"""
+
+    def __init__(self, settings=None):
+        settings = settings if settings is not None else STAGE_SETTINGS
+        self.stages = {
+            name: Stage(name, limit, max_queue, max_wait)
+            for name, (limit, max_queue, max_wait) in settings.items()
+        }
+
+    def slot(self, name):
+        """Context manager holding one slot of a stage; raises StageBusy"""
+        return self.stages[name].slot()
+
+    def add_queue(self, name, owner):
+        """Expose another component's queue as stage `name` (see QueueStage)"""
+        self.stages[name] = QueueStage(name, owner)
+
+    def check(self, name):
+        """Raise StageBusy if queue stage `name` cannot take more work"""
+        self.stages[name].check()
+
+    def stage(self, name):
+        return self.stages[name]
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
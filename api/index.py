@@ -1,15 +1,32 @@
 from flask import Flask, render_template, request, jsonify, send_file
 import yt_dlp
 import os
+import copy
 import uuid
 from pathlib import Path
 import json
 import sys
+import logging
 from datetime import datetime
-import time
-from collections import defaultdict
 from functools import wraps
 
+# Modul bersama (cache, dll) ada di root project
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import InfoCache, InfoTokenStore, INFO_TOKEN_MAX_ENTRIES, create_backend
+import httppool
+import postprocess
+import ratelimit
+import slideshow
+import ytdl
+
+# Configure logging: filesystem Vercel read-only kecuali /tmp, jadi log cukup ke stdout
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__,
             template_folder='../templates',
             static_folder='../static')
@@ -18,21 +35,37 @@ app = Flask(__name__,
 # ANTI-SCRAPING & RATE LIMITING
 # ============================================
 
-# Track requests per IP
-request_tracker = defaultdict(list)
-blocked_ips = set()
-
-# Rate limiting configuration
-RATE_LIMIT_WINDOW = 60  # seconds
-MAX_REQUESTS_PER_WINDOW = 10  # max requests per IP in window
-MAX_REQUESTS_PER_HOUR = 50  # max requests per IP per hour
-DOWNLOAD_LIMIT_PER_HOUR = 20  # max downloads per IP per hour
-BLOCK_DURATION = 300  # 5 minutes block for abusers
+# Budget per IP per endpoint (info/download/file), lihat ratelimit.py.
+# Tiap instance serverless punya /tmp sendiri: pakai RATE_LIMIT_BACKEND=redis untuk batas global
+rate_limiter = ratelimit.RateLimiter(ratelimit.create_state(
+    kind=os.environ.get('RATE_LIMIT_BACKEND', 'sqlite'),
+    path=os.environ.get('RATE_LIMIT_PATH', '/tmp/vtmu_ratelimit.sqlite3'),
+))
 
 # Use /tmp for serverless environment (Vercel)
 DOWNLOAD_FOLDER = '/tmp/downloads'
 Path(DOWNLOAD_FOLDER).mkdir(exist_ok=True)
 
+# Cache metadata di /tmp supaya dipakai bersama oleh invocation yang masih warm
+info_cache = InfoCache(create_backend(
+    kind=os.environ.get('INFO_CACHE_BACKEND', 'sqlite'),
+    path=os.environ.get('INFO_CACHE_PATH', '/tmp/vtmu_info_cache.sqlite3'),
+))
+
+# Info dict lengkap dari get-info, dipakai ulang oleh /api/download.
+# Di /tmp juga, supaya token dari cache yang masih warm tetap berlaku.
+info_tokens = InfoTokenStore(create_backend(
+    kind=os.environ.get('INFO_CACHE_BACKEND', 'sqlite'),
+    path=os.environ.get('INFO_TOKEN_PATH', '/tmp/vtmu_info_tokens.sqlite3'),
+    max_entries=INFO_TOKEN_MAX_ENTRIES
+))
+
+# Koneksi HTTP dan DNS di-cache selama instance serverless masih warm
+httppool.install()
+
+# Instance YoutubeDL dipakai ulang selama instance serverless masih warm
+ydl_pool = ytdl.YtdlPool()
+
 def get_client_ip():
     """Get real client IP even behind proxy"""
     if request.headers.get('X-Forwarded-For'):
@@ -64,67 +97,43 @@ def is_suspicious_request():
 
     return False
 
-def rate_limit_decorator(max_per_window=MAX_REQUESTS_PER_WINDOW):
+def rate_limit_response(decision):
+    """429 response for a denied rate-limit decision"""
+    if decision.blocked:
+        message = 'Terlalu banyak permintaan. Anda telah diblokir sementara.'
+    elif decision.limit is not None and decision.limit.window >= 3600:
+        message = 'Batas permintaan per jam tercapai. Silakan coba lagi nanti.'
+    else:
+        message = 'Terlalu banyak permintaan. Silakan coba lagi nanti.'
+    retry_after = ratelimit.retry_after_header(decision.retry_after)
+    response = jsonify({'error': message, 'retry_after': int(retry_after)})
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after
+    return response
+
+def rate_limit_decorator(endpoint=ratelimit.INFO):
     """Rate limiting decorator"""
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
             ip = get_client_ip()
-            current_time = time.time()
-
-            # Check if IP is blocked
-            if ip in blocked_ips:
-                return jsonify({
-                    'error': 'Terlalu banyak permintaan. Silakan coba lagi nanti.',
-                    'retry_after': BLOCK_DURATION
-                }), 429
-
-            # Clean old requests (older than window)
-            request_tracker[ip] = [
-                req_time for req_time in request_tracker[ip]
-                if current_time - req_time < RATE_LIMIT_WINDOW
-            ]
-
-            # Check rate limit
-            if len(request_tracker[ip]) >= max_per_window:
-                # Block IP temporarily
-                blocked_ips.add(ip)
-                return jsonify({
-                    'error': 'Terlalu banyak permintaan. Anda telah diblokir sementara.',
-                    'retry_after': BLOCK_DURATION
-                }), 429
-
-            # Check hourly limit
-            hourly_requests = [
-                req_time for req_time in request_tracker[ip]
-                if current_time - req_time < 3600
-            ]
-            if len(hourly_requests) >= MAX_REQUESTS_PER_HOUR:
-                return jsonify({
-                    'error': 'Batas permintaan per jam tercapai. Silakan coba lagi nanti.',
-                    'retry_after': 3600
-                }), 429
 
-            # Check for suspicious behavior
+            # Cek request mencurigakan dulu: yang ditolak 403 tidak memakai budget
             if is_suspicious_request():
+                logger.warning("Suspicious request from IP: %s", ip)
                 return jsonify({
                     'error': 'Request tidak valid. Gunakan browser normal.'
                 }), 403
 
-            # Add current request
-            request_tracker[ip].append(current_time)
+            decision = rate_limiter.hit(ip, endpoint)
+            if not decision.allowed:
+                logger.warning("Rate limit exceeded for IP: %s (%s, retry in %.0fs)", ip, endpoint, decision.retry_after)
+                return rate_limit_response(decision)
 
             return f(*args, **kwargs)
         return wrapped
     return decorator
 
-# Cleanup blocked IPs periodically
-def cleanup_blocked_ips():
-    """This should be called periodically to unblock IPs"""
-    global blocked_ips
-    if len(blocked_ips) > 100:  # Prevent memory issues
-        blocked_ips.clear()
-
 # Security headers
 @app.after_request
 def add_security_headers(response):
@@ -187,7 +196,7 @@ def downloading_page():
     return render_template('download.html')
 
 @app.route('/api/get-info', methods=['POST'])
-@rate_limit_decorator()
+@rate_limit_decorator(ratelimit.INFO)
 def get_video_info():
     """Mendapatkan informasi video tanpa download"""
     try:
@@ -205,12 +214,6 @@ def get_video_info():
         if 'facebook.com' in url or 'fb.watch' in url or 'fb.com' in url:
             return jsonify({'error': 'Maaf, Facebook sementara tidak didukung. Silakan gunakan platform lain seperti Instagram, TikTok, atau YouTube.'}), 400
 
-        # Handle TikTok photo/slideshow URLs
-        if 'tiktok.com' in url and '/photo/' in url:
-            if '?' in url:
-                url = url.split('?')[0]
-            url = url.replace('/photo/', '/video/')
-
         # Determine platform
         platform = 'unknown'
         if 'instagram.com' in url:
@@ -220,51 +223,67 @@ def get_video_info():
         elif 'youtube.com' in url or 'youtu.be' in url:
             platform = 'youtube'
 
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'ignoreerrors': False,
-            'no_color': True,
-            'source_address': '0.0.0.0',
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                'Accept': '*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-            },
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['android', 'web', 'ios'],
-                    'skip': ['hls', 'dash'],
-                },
-                'tiktok': {
-                    'api_hostname': 'api16-normal-c-useast1a.tiktokv.com',
-                    'app_version': '34.1.2',
-                    'manifest_app_version': '341',
-                    'webpage_download': True,
-                },
-                'instagram': {
-                    'api': 'graphql',
-                },
-            },
-            'retries': 15,
-            'fragment_retries': 15,
-            'socket_timeout': 30,
-            'nocheckcertificate': True,
-        }
+        # Token di entry cache harus masih hidup; setiap hit memperpanjang umurnya
+        ttl = info_cache.ttl(platform)
+        cached_info = info_cache.get(url, valid=lambda value: info_tokens.touch(value.get('info_token'), ttl))
+        if cached_info is not None:
+            response = jsonify(cached_info)
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+        if slideshow.is_photo_url(url):
+            # Slideshow foto TikTok: data post disimpan di token untuk /api/download
+            with ydl_pool.session(platform, ytdl.INFO) as ydl:
+                slides = slideshow.extract(ydl, url)
+            video_info = {
+                'title': slides['title'],
+                'thumbnail': slides['images'][0],
+                'duration': slides['duration'],
+                'uploader': slides['uploader'],
+                'view_count': slides['view_count'],
+                'platform': 'TikTok',
+                'info_token': info_tokens.put(url, slides, ttl),
+                'slideshow': True,
+                'image_count': len(slides['images']),
+                'formats': [
+                    {
+                        'quality': 'Slideshow Video',
+                        'ext': 'mp4',
+                        'filesize': 0,
+                        'format_id': slideshow.VIDEO,
+                        'description': 'Video dari foto + musik'
+                    },
+                    {
+                        'quality': 'Foto (ZIP)',
+                        'ext': 'zip',
+                        'filesize': 0,
+                        'format_id': slideshow.IMAGES,
+                        'description': 'Semua foto dalam satu ZIP'
+                    },
+                    {
+                        'quality': 'Audio Only (MP3)',
+                        'ext': 'mp3',
+                        'filesize': 0,
+                        'format_id': slideshow.AUDIO,
+                        'description': 'MP3 Audio'
+                    }
+                ]
+            }
+            info_cache.set(url, video_info, platform)
 
-        if platform == 'instagram':
-            ydl_opts['http_headers']['Referer'] = 'https://www.instagram.com/'
-            ydl_opts['http_headers']['X-IG-App-ID'] = '936619743392459'
+            response = jsonify(video_info)
+            response.headers['X-Cache'] = 'MISS'
+            return response
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with ydl_pool.session(platform, ytdl.INFO) as ydl:
             info = ydl.extract_info(url, download=False)
 
             if not info:
                 return jsonify({'error': 'Tidak dapat mengambil informasi video. URL mungkin tidak valid atau tidak didukung.'}), 400
 
+            # Simpan info lengkap supaya /api/download tidak perlu ekstraksi ulang
+            info_token = info_tokens.put(url, ydl.sanitize_info(info), ttl)
+
             video_info = {
                 'title': info.get('title', 'Unknown'),
                 'thumbnail': info.get('thumbnail', '') or info.get('thumbnails', [{}])[0].get('url', ''),
@@ -272,6 +291,7 @@ def get_video_info():
                 'uploader': info.get('uploader', info.get('uploader_id', 'Unknown')),
                 'view_count': info.get('view_count', 0) or info.get('like_count', 0),
                 'platform': info.get('extractor', 'Unknown'),
+                'info_token': info_token,
                 'formats': [
                     {
                         'quality': 'Best Quality',
@@ -311,13 +331,17 @@ def get_video_info():
                 ]
             }
 
-            return jsonify(video_info)
+            info_cache.set(url, video_info, platform)
+
+            response = jsonify(video_info)
+            response.headers['X-Cache'] = 'MISS'
+            return response
 
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/download', methods=['POST'])
-@rate_limit_decorator()
+@rate_limit_decorator(ratelimit.DOWNLOAD)
 def download_video():
     """Download video dengan kualitas yang dipilih"""
     try:
@@ -325,6 +349,7 @@ def download_video():
         url = data.get('url')
         quality = data.get('quality', 'Best Quality')
         format_id = data.get('format_id', 'best')
+        info_token = data.get('info_token')
 
         if not url:
             return jsonify({'error': 'URL tidak boleh kosong'}), 400
@@ -335,12 +360,6 @@ def download_video():
         if 'facebook.com' in url or 'fb.watch' in url or 'fb.com' in url:
             return jsonify({'error': 'Maaf, Facebook sementara tidak didukung. Silakan gunakan platform lain seperti Instagram, TikTok, atau YouTube.'}), 400
 
-        # Handle TikTok photo/slideshow URLs
-        if 'tiktok.com' in url and '/photo/' in url:
-            if '?' in url:
-                url = url.split('?')[0]
-            url = url.replace('/photo/', '/video/')
-
         # Determine platform
         platform = 'unknown'
         if 'instagram.com' in url:
@@ -354,111 +373,63 @@ def download_video():
         unique_id = str(uuid.uuid4())[:8]
         output_template = os.path.join(DOWNLOAD_FOLDER, f'{unique_id}.%(ext)s')
 
-        ydl_opts = {
-            'format': format_id,
-            'outtmpl': output_template,
-            'quiet': True,
-            'no_warnings': True,
-            'ignoreerrors': False,
-            'merge_output_format': 'mp4',
-            'postprocessor_args': ['-ar', '44100'],
-            'source_address': '0.0.0.0',
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                'Accept': '*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-            },
-            'restrictfilenames': True,
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['android', 'web', 'ios'],
-                    'skip': ['hls', 'dash']
-                },
-                'tiktok': {
-                    'api_hostname': 'api16-normal-c-useast1a.tiktokv.com',
-                    'app_version': '34.1.2',
-                    'manifest_app_version': '341',
-                    'webpage_download': True,
-                },
-                'instagram': {
-                    'api': 'graphql',
-                },
-            },
-            'retries': 15,
-            'fragment_retries': 15,
-            'socket_timeout': 30,
-            'skip_unavailable_fragments': True,
-            'nocheckcertificate': True,
-            'geo_bypass': True,
-        }
-
-        if platform == 'instagram':
-            ydl_opts['http_headers']['Referer'] = 'https://www.instagram.com/'
-            ydl_opts['http_headers']['X-IG-App-ID'] = '936619743392459'
-
-        # Adjust format based on quality
-        if quality == 'Audio Only (MP3)':
-            ydl_opts['format'] = 'bestaudio/best'
-            ydl_opts['postprocessors'] = [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }]
-        else:
-            ydl_opts['format'] = format_id
-            ydl_opts['postprocessors'] = [{
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': 'mp4',
-            }]
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        # Ekstraksi MP3 dan konversi MP4 dijalankan setelah download (lihat postprocess.plan)
+        selector = 'bestaudio/best' if quality == 'Audio Only (MP3)' else format_id
+
+        cached_info = info_tokens.get(info_token, url)
+
+        if slideshow.is_photo_url(url):
+            if quality == 'Audio Only (MP3)' or format_id == slideshow.AUDIO:
+                kind = slideshow.AUDIO
+            elif format_id == slideshow.IMAGES:
+                kind = slideshow.IMAGES
+            else:
+                kind = slideshow.VIDEO
+            with ydl_pool.session(platform, ytdl.DOWNLOAD) as ydl:
+                slides = cached_info if cached_info and 'images' in cached_info else slideshow.extract(ydl, url)
+                try:
+                    filename, _ = slideshow.build(ydl, slides, kind, os.path.join(DOWNLOAD_FOLDER, unique_id))
+                except (slideshow.SlideshowError, postprocess.PostprocessError) as e:
+                    return jsonify({'error': f'Gagal membuat slideshow: {str(e)}'}), 400
+            return jsonify({
+                'success': True,
+                'filename': os.path.basename(filename),
+                'download_url': f'/download/{os.path.basename(filename)}',
+                'filesize': os.path.getsize(filename)
+            })
+
+        with ydl_pool.session(platform, ytdl.DOWNLOAD, format=selector,
+                              outtmpl=output_template) as ydl:
             try:
-                info = ydl.extract_info(url, download=True)
+                info = None
+                if cached_info is not None:
+                    try:
+                        # Lewati extractor, langsung format selection + download
+                        info = ydl.process_ie_result(copy.deepcopy(cached_info), download=True)
+                    except yt_dlp.utils.DownloadError:
+                        # URL media di info lama mungkin sudah kadaluarsa
+                        info = None
+                if info is None:
+                    info = ydl.extract_info(url, download=True)
             except Exception as extract_error:
-                # Try to find downloaded files
-                if 'tiktok' in url.lower():
-                    downloaded_files = [f for f in os.listdir(DOWNLOAD_FOLDER) if f.startswith(unique_id)]
-                    if downloaded_files:
-                        filename = os.path.join(DOWNLOAD_FOLDER, downloaded_files[0])
-                        actual_size = os.path.getsize(filename) if os.path.exists(filename) else 0
-
-                        return jsonify({
-                            'success': True,
-                            'filename': os.path.basename(filename),
-                            'download_url': f'/download/{os.path.basename(filename)}',
-                            'filesize': actual_size
-                        })
-
                 return jsonify({'error': f'Gagal mendownload: {str(extract_error)}'}), 400
 
             # Check if download was successful
             if not info:
-                downloaded_files = [f for f in os.listdir(DOWNLOAD_FOLDER) if f.startswith(unique_id)]
-                if downloaded_files:
-                    filename = os.path.join(DOWNLOAD_FOLDER, downloaded_files[0])
-                    actual_size = os.path.getsize(filename) if os.path.exists(filename) else 0
-
-                    return jsonify({
-                        'success': True,
-                        'filename': os.path.basename(filename),
-                        'download_url': f'/download/{os.path.basename(filename)}',
-                        'filesize': actual_size
-                    })
-                else:
-                    return jsonify({'error': 'Gagal mendownload video. URL mungkin tidak valid atau tidak didukung.'}), 400
-
-            filename = ydl.prepare_filename(info)
-
-            # If audio, file extension changes to .mp3
-            if quality == 'Audio Only (MP3)':
-                filename = filename.rsplit('.', 1)[0] + '.mp3'
-
-            # Get actual file size
-            actual_size = 0
-            if os.path.exists(filename):
-                actual_size = os.path.getsize(filename)
+                return jsonify({'error': 'Gagal mendownload video. URL mungkin tidak valid atau tidak didukung.'}), 400
+
+            # Path final setelah postprocessor (merge/convert) jika berbeda
+            filename = ytdl.downloaded_path(ydl, info)
+            if filename is None:
+                return jsonify({'error': 'Gagal mendownload video. File hasil download tidak ditemukan.'}), 400
+
+            target = postprocess.AUDIO_EXT if quality == 'Audio Only (MP3)' else postprocess.TARGET_EXT
+            try:
+                filename = postprocess.apply(filename, postprocess.plan_for_file(filename, info, target))
+            except postprocess.PostprocessError as e:
+                return jsonify({'error': f'Gagal mengonversi video: {str(e)}'}), 400
+
+            actual_size = os.path.getsize(filename)
 
         return jsonify({
             'success': True,
@@ -514,7 +485,8 @@ def health_check():
                 'ytdlp': ytdlp_version,
                 'flask': '3.0.0'
             },
-            'environment': 'serverless'
+            'environment': 'serverless',
+            'info_cache': info_cache.stats()
         }
 
         return jsonify(health_data)
@@ -1,27 +1,51 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, redirect, has_request_context, g
 import yt_dlp
 import os
-import uuid
+import copy
+import mimetypes
+import zipfile
 from pathlib import Path
 import json
 import subprocess
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 import time
-from collections import defaultdict
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from functools import wraps
+from werkzeug.wsgi import ClosingIterator
+from cache import InfoCache, InfoTokenStore, INFO_TOKEN_MAX_ENTRIES, create_backend, normalize_url
+from store import DownloadStore, make_key
+from eviction import Evictor
+import admission
+import applog
+import httppool
+import metrics
+import postprocess
+import profiler
+import ratelimit
+import slideshow
+import tracing
+import ytdl
+from jobs import JobManager, JobError, QueueFullError, PP_QUEUED, FINISHED as JOB_FINISHED, FAILED as JOB_FAILED
 
 app = Flask(__name__)
 
-# Configure logging
-logging.basicConfig(
+def log_context():
+    """ip/endpoint of the current request, added to every structured log record"""
+    if not has_request_context():
+        return None
+    return {'ip': get_client_ip(), 'endpoint': request.path}
+
+# Configure logging: app.log berisi JSON lines (dirotasi + index), stdout tetap teks biasa.
+# Request thread hanya memasukkan record ke antrian; thread log-writer yang menulis.
+log_stdout_handler = applog.BatchStreamHandler(sys.stdout)
+log_stdout_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_writer = applog.install(
+    [applog.JsonFileHandler(), log_stdout_handler],
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
+    context=log_context
 )
 logger = logging.getLogger(__name__)
 
@@ -29,16 +53,9 @@ logger = logging.getLogger(__name__)
 # ANTI-SCRAPING & RATE LIMITING
 # ============================================
 
-# Track requests per IP
-request_tracker = defaultdict(list)
-blocked_ips = set()
-
-# Rate limiting configuration
-RATE_LIMIT_WINDOW = 60  # seconds
-MAX_REQUESTS_PER_WINDOW = 10  # max requests per IP in window
-MAX_REQUESTS_PER_HOUR = 50  # max requests per IP per hour
-DOWNLOAD_LIMIT_PER_HOUR = 20  # max downloads per IP per hour
-BLOCK_DURATION = 300  # 5 minutes block for abusers
+# Budget per IP per endpoint (info/download/file), lihat ratelimit.py.
+# State diatur via RATE_LIMIT_BACKEND: sqlite/redis supaya semua worker berbagi batas yang sama
+rate_limiter = ratelimit.RateLimiter(ratelimit.create_state())
 
 def get_client_ip():
     """Get real client IP even behind proxy"""
@@ -63,7 +80,7 @@ def is_suspicious_request():
         if signature in user_agent:
             # Allow some legitimate bots but log them
             if signature not in ['googlebot', 'bingbot']:
-                logger.warning(f"Suspicious user agent detected: {user_agent}")
+                logger.warning("Suspicious user agent detected: %s", user_agent)
                 return True
 
     # Check for missing common headers
@@ -72,74 +89,119 @@ def is_suspicious_request():
 
     return False
 
-def rate_limit_decorator(max_per_window=MAX_REQUESTS_PER_WINDOW):
-    """Rate limiting decorator"""
+def rate_limit_response(decision):
+    """429 response for a denied rate-limit decision"""
+    if decision.blocked:
+        message = 'Terlalu banyak permintaan. Anda telah diblokir sementara.'
+    elif decision.limit is not None and decision.limit.window >= 3600:
+        message = 'Batas permintaan per jam tercapai. Silakan coba lagi nanti.'
+    else:
+        message = 'Terlalu banyak permintaan. Silakan coba lagi nanti.'
+    retry_after = ratelimit.retry_after_header(decision.retry_after)
+    response = jsonify({'error': message, 'retry_after': int(retry_after)})
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after
+    return response
+
+def busy_response(retry_after=None, reason='busy'):
+    """503 response when the server has no capacity for the request"""
+    metrics.BUSY.inc(reason)
+    retry_after = ratelimit.retry_after_header(retry_after or BUSY_RETRY_AFTER)
+    response = jsonify({'error': 'Server sedang sibuk. Silakan coba lagi sebentar lagi.',
+                        'retry_after': int(retry_after)})
+    response.status_code = 503
+    response.headers['Retry-After'] = retry_after
+    return response
+
+def rate_limit_decorator(endpoint=ratelimit.INFO, cost=None, check_suspicious=True):
+    """Rate limiting decorator
+
+    cost() is called inside the request and returns its weight in budget
+    units (default 1). Download requests are shed with 503 when the
+    download queue is close to full.
+    """
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
             ip = get_client_ip()
-            current_time = time.time()
 
-            # Check if IP is blocked
-            if ip in blocked_ips:
-                logger.warning(f"Blocked IP attempted access: {ip}")
-                return jsonify({
-                    'error': 'Terlalu banyak permintaan. Silakan coba lagi nanti.',
-                    'retry_after': BLOCK_DURATION
-                }), 429
-
-            # Clean old requests (older than window)
-            request_tracker[ip] = [
-                req_time for req_time in request_tracker[ip]
-                if current_time - req_time < RATE_LIMIT_WINDOW
-            ]
-
-            # Check rate limit
-            if len(request_tracker[ip]) >= max_per_window:
-                logger.warning(f"Rate limit exceeded for IP: {ip}")
-                # Block IP temporarily
-                blocked_ips.add(ip)
-                # Schedule unblock after BLOCK_DURATION
-                return jsonify({
-                    'error': 'Terlalu banyak permintaan. Anda telah diblokir sementara.',
-                    'retry_after': BLOCK_DURATION
-                }), 429
-
-            # Check hourly limit
-            hourly_requests = [
-                req_time for req_time in request_tracker[ip]
-                if current_time - req_time < 3600
-            ]
-            if len(hourly_requests) >= MAX_REQUESTS_PER_HOUR:
-                logger.warning(f"Hourly limit exceeded for IP: {ip}")
-                return jsonify({
-                    'error': 'Batas permintaan per jam tercapai. Silakan coba lagi nanti.',
-                    'retry_after': 3600
-                }), 429
-
-            # Check for suspicious behavior
-            if is_suspicious_request():
-                logger.warning(f"Suspicious request from IP: {ip}")
+            # Cek request mencurigakan dulu: yang ditolak 403 tidak memakai budget
+            if check_suspicious and is_suspicious_request():
+                logger.warning("Suspicious request from IP: %s", ip)
                 return jsonify({
                     'error': 'Request tidak valid. Gunakan browser normal.'
                 }), 403
 
-            # Add current request
-            request_tracker[ip].append(current_time)
+            weight = cost() if cost is not None else 1
+
+            # Antrian hampir penuh: tolak request mahal sebelum budget terpakai
+            if endpoint == ratelimit.DOWNLOAD and shed_load(weight):
+                logger.warning("Shedding download request from IP: %s (cost %s)", ip, weight)
+                return busy_response(reason='shed')
+
+            decision = rate_limiter.hit(ip, endpoint, weight)
+            if not decision.allowed:
+                logger.warning("Rate limit exceeded for IP: %s (%s %s, cost %s, retry in %.0fs)",
+                               ip, endpoint, decision.scope, weight, decision.retry_after)
+                if decision.scope == ratelimit.GLOBAL:
+                    return busy_response(decision.retry_after, 'global_limit')
+                return rate_limit_response(decision)
 
             return f(*args, **kwargs)
         return wrapped
     return decorator
 
-# Cleanup blocked IPs periodically
-def cleanup_blocked_ips():
-    """This should be called periodically to unblock IPs"""
-    current_time = time.time()
-    # In production, you'd use a proper scheduler
-    # For now, we'll just clear all blocks after some time
-    global blocked_ips
-    if len(blocked_ips) > 100:  # Prevent memory issues
-        blocked_ips.clear()
+# Bobot request dalam unit budget: get-info = 1, download = 1 + porsi durasi/ukuran + kerja ffmpeg
+DOWNLOAD_COST_SECONDS = int(os.environ.get('DOWNLOAD_COST_SECONDS', 600))  # +1 unit per 10 menit video
+DOWNLOAD_COST_BYTES = int(os.environ.get('DOWNLOAD_COST_BYTES', 100 * 1024 * 1024))  # +1 unit per 100 MB
+CONVERT_COST = float(os.environ.get('CONVERT_COST', 1))  # MP3 / render slideshow
+BATCH_ITEM_COST = float(os.environ.get('BATCH_ITEM_COST', 0.1))  # per URL di /api/get-info/batch
+SHED_LOAD_THRESHOLD = float(os.environ.get('SHED_LOAD_THRESHOLD', 0.8))  # porsi antrian download
+BUSY_RETRY_AFTER = 30
+
+def download_cost(url, quality, format_id, info_token):
+    """Budget units for one download request"""
+    if not isinstance(url, str):
+        return 1
+    # Sudah ada di download store: tinggal dikirim. peek() supaya hit/miss
+    # tidak terhitung dua kali (start_download melakukan lookup yang sama)
+    if download_store.peek(download_request_key(url, quality, format_id)) is not None:
+        return 1
+    cost = 1.0
+    info = info_tokens.peek(info_token, url)
+    if info:
+        size = info.get('filesize') or info.get('filesize_approx') or 0
+        cost += max((info.get('duration') or 0) / DOWNLOAD_COST_SECONDS, size / DOWNLOAD_COST_BYTES)
+    if quality == 'Audio Only (MP3)' or (
+            slideshow.is_photo_url(url) and slideshow_kind(quality, format_id) == slideshow.VIDEO):
+        cost += CONVERT_COST
+    # Video sangat panjang tetap bisa didownload selama budget IP masih kosong;
+    # melebihi budget karena cost hanya 429, tidak diblokir
+    return round(min(cost, rate_limiter.max_cost(ratelimit.DOWNLOAD)), 2)
+
+def download_request_cost():
+    data = request.get_json(silent=True) or {}
+    return download_cost(data.get('url'), data.get('quality', 'Best Quality'),
+                         data.get('format_id', 'best'), data.get('info_token'))
+
+def bulk_request_cost():
+    items = bulk_items(request.get_json(silent=True) or {}) or []
+    cost = sum(download_cost(item['url'], item['quality'], item['format_id'], item['info_token'])
+               for item in items[:BULK_MAX_ITEMS])
+    return round(cost, 2) or 1
+
+def batch_request_cost():
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls')
+    # URL playlist bisa berisi sampai BATCH_MAX_URLS video
+    count = len(urls) if isinstance(urls, list) else BATCH_MAX_URLS
+    # Batch terbesar tetap bisa lolos selama budget IP masih kosong
+    return round(min(1 + count * BATCH_ITEM_COST, rate_limiter.max_cost(ratelimit.INFO)), 2)
+
+def shed_load(cost):
+    """True if the download queue is too full to accept a request of this cost"""
+    load = download_jobs.load()
+    return load >= 1 or (load >= SHED_LOAD_THRESHOLD and cost > 1)
 
 # Security headers
 @app.after_request
@@ -168,6 +230,73 @@ def add_security_headers(response):
 DOWNLOAD_FOLDER = 'downloads'
 Path(DOWNLOAD_FOLDER).mkdir(exist_ok=True)
 
+# Pengiriman file oleh web server (zero-copy) alih-alih worker Python:
+# '' = Python, 'nginx' = X-Accel-Redirect, 'apache' = X-Sendfile
+SENDFILE_MODE = os.environ.get('SENDFILE_MODE', '')
+# Location internal nginx yang menunjuk ke folder downloads
+SENDFILE_PREFIX = os.environ.get('SENDFILE_PREFIX', '/protected-downloads/')
+if SENDFILE_MODE == 'apache':
+    app.config['USE_X_SENDFILE'] = True
+
+# Cache metadata untuk /api/get-info (backend diatur via INFO_CACHE_BACKEND)
+info_cache = InfoCache(create_backend())
+
+# Info dict lengkap dari get-info, dipakai ulang oleh /api/download.
+# Backend sama dengan info_cache supaya token dari cache SQLite bersama berlaku di semua worker.
+info_tokens = InfoTokenStore(create_backend(
+    path=os.environ.get('INFO_TOKEN_PATH', 'info_tokens.sqlite3'),
+    max_entries=INFO_TOKEN_MAX_ENTRIES
+))
+
+# Worker pool untuk download (ukuran diatur via DOWNLOAD_WORKERS)
+download_jobs = JobManager()
+
+# File hasil download yang bisa dipakai ulang oleh request berikutnya
+download_store = DownloadStore(DOWNLOAD_FOLDER)
+
+# Hapus file lama otomatis sesuai kuota (STORE_MAX_BYTES / STORE_MAX_AGE)
+store_evictor = Evictor(download_store)
+
+# Worker bersama untuk /api/get-info/batch
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 8))
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch-info')
+
+# Koneksi HTTP (keep-alive) dan hasil DNS dipakai bersama oleh semua instance yt-dlp
+httppool.install()
+
+# Instance YoutubeDL dipakai ulang antar request (YTDL_POOL_SIZE per profil)
+ydl_pool = ytdl.YtdlPool()
+
+# Remux/transcode ffmpeg dibatasi sesuai jumlah core (POSTPROCESS_WORKERS)
+postprocess_pool = postprocess.PostprocessPool()
+
+# Batas ekstraksi dan pengiriman file bersamaan di seluruh server (EXTRACT_*/SERVE_*);
+# antrian download dan ffmpeg ikut sebagai tahap supaya 503 dan statistiknya seragam
+admission_control = admission.AdmissionController()
+admission_control.add_queue(admission.DOWNLOAD, download_jobs)
+admission_control.add_queue(admission.POSTPROCESS, postprocess_pool)
+
+# Thread latar (log-writer, evictor, warm-up yt-dlp, ekspor OTLP) tidak ikut ter-fork:
+# dimulai per proses pada request pertama atau dari hook post_fork gunicorn (lihat DEPLOYMENT.md)
+_background_pid = None
+_background_lock = threading.Lock()
+
+def start_background_workers():
+    """Start the background threads of this process; no-op once they run here"""
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        log_writer.start()
+        store_evictor.start()
+        tracing.recorder.start()
+        ydl_pool.start_warmup()
+        _background_pid = os.getpid()
+
+app.before_request(start_background_workers)
+
 # Download limits removed - unlimited download
 # MAX_FILE_SIZE = None  # No limit
 # DOWNLOAD_TIMEOUT = None  # No timeout
@@ -218,343 +347,964 @@ def downloading_page():
     """Halaman khusus download"""
     return render_template('download.html')
 
+# Format selection yang universal untuk semua platform
+VIDEO_FORMATS = [
+    {
+        'quality': 'Best Quality',
+        'ext': 'mp4',
+        'filesize': 0,
+        'format_id': 'bv*+ba/b',
+        'description': 'Kualitas terbaik'
+    },
+    {
+        'quality': 'HD 720p',
+        'ext': 'mp4',
+        'filesize': 0,
+        'format_id': 'bv*[height<=720]+ba/b[height<=720]/bv*[height<=720]/b',
+        'description': '720p HD'
+    },
+    {
+        'quality': 'SD 480p',
+        'ext': 'mp4',
+        'filesize': 0,
+        'format_id': 'bv*[height<=480]+ba/b[height<=480]/bv*[height<=480]/b',
+        'description': '480p SD'
+    },
+    {
+        'quality': 'Low 360p',
+        'ext': 'mp4',
+        'filesize': 0,
+        'format_id': 'bv*[height<=360]+ba/b[height<=360]/bv*[height<=360]/b',
+        'description': '360p'
+    },
+    {
+        'quality': 'Audio Only (MP3)',
+        'ext': 'mp3',
+        'filesize': 0,
+        'format_id': 'bestaudio',
+        'description': 'MP3 Audio'
+    }
+]
+
+def check_url(url):
+    """Return an error message if the URL cannot be processed, else None"""
+    if not url:
+        return 'URL tidak boleh kosong'
+
+    # Validate URL for security
+    if not is_valid_url(url):
+        return 'URL tidak valid atau mengandung karakter berbahaya'
+
+    # Block Facebook URLs (not supported currently)
+    if 'facebook.com' in url or 'fb.watch' in url or 'fb.com' in url:
+        return 'Maaf, Facebook sementara tidak didukung. Silakan gunakan platform lain seperti Instagram, TikTok, atau YouTube.'
+    return None
+
+def prepare_url(url):
+    """Return (url, platform) for a requested URL"""
+    # Determine platform for specific handling
+    platform = 'unknown'
+    if 'instagram.com' in url:
+        platform = 'instagram'
+    elif 'tiktok.com' in url:
+        platform = 'tiktok'
+    elif 'youtube.com' in url or 'youtu.be' in url:
+        platform = 'youtube'
+    return url, platform
+
+def validate_url(url):
+    """check_url + prepare_url, timed as the validate/detect stages
+
+    Returns (error, url, platform); error is None for a usable URL.
+    """
+    started = time.perf_counter()
+    with tracing.span('validate') as span:
+        error = check_url(url)
+        validated = time.perf_counter()
+        if error:
+            metrics.STAGE_SECONDS.observe(validated - started, metrics.VALIDATE, 'unknown', '')
+            return error, url, 'unknown'
+        url, platform = prepare_url(url)
+        if span is not None:
+            span.set(platform=platform)
+    metrics.STAGE_SECONDS.observe(validated - started, metrics.VALIDATE, platform, '')
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - validated, metrics.DETECT, platform, '')
+    return None, url, platform
+
+def build_video_info(info, info_token):
+    """Response payload of /api/get-info for an extracted info dict"""
+    return {
+        'title': info.get('title', 'Unknown'),
+        'thumbnail': info.get('thumbnail', '') or (info.get('thumbnails') or [{}])[0].get('url', ''),
+        'duration': info.get('duration', 0),
+        'uploader': info.get('uploader', info.get('uploader_id', 'Unknown')),
+        'view_count': info.get('view_count', 0) or info.get('like_count', 0),
+        'platform': info.get('extractor', 'Unknown'),
+        'info_token': info_token,
+        'formats': copy.deepcopy(VIDEO_FORMATS)
+    }
+
+# Pilihan download untuk slideshow foto TikTok (lihat slideshow.py)
+SLIDESHOW_FORMATS = [
+    {
+        'quality': 'Slideshow Video',
+        'ext': 'mp4',
+        'filesize': 0,
+        'format_id': slideshow.VIDEO,
+        'description': 'Video dari foto + musik'
+    },
+    {
+        'quality': 'Foto (ZIP)',
+        'ext': 'zip',
+        'filesize': 0,
+        'format_id': slideshow.IMAGES,
+        'description': 'Semua foto dalam satu ZIP'
+    },
+    {
+        'quality': 'Audio Only (MP3)',
+        'ext': 'mp3',
+        'filesize': 0,
+        'format_id': slideshow.AUDIO,
+        'description': 'MP3 Audio'
+    }
+]
+
+# Label quality di /metrics: nilai dari client bebas, jadi hanya pilihan yang dikenal
+METRIC_QUALITIES = {f['quality'] for f in VIDEO_FORMATS + SLIDESHOW_FORMATS}
+
+def quality_label(quality):
+    """Bounded metrics label for a requested quality ('' = not applicable)"""
+    if not quality:
+        return ''
+    return quality if quality in METRIC_QUALITIES else 'other'
+
+def build_slideshow_info(data, info_token):
+    """Response payload of /api/get-info for a TikTok photo slideshow"""
+    return {
+        'title': data['title'],
+        'thumbnail': data['images'][0],
+        'duration': data['duration'],
+        'uploader': data['uploader'],
+        'view_count': data['view_count'],
+        'platform': 'TikTok',
+        'info_token': info_token,
+        'slideshow': True,
+        'image_count': len(data['images']),
+        'formats': copy.deepcopy(SLIDESHOW_FORMATS)
+    }
+
+def extract_video_info(url, platform, info=None):
+    """Return (video_info, cache_hit) for a URL; video_info is None if extraction found nothing
+
+    `info` can be passed when the full info dict is already known (e.g.
+    from a flat extraction that resolved to a single video).
+    """
+    # Serve from cache if the same video was extracted recently. The cached
+    # info_token must still be alive, and lives as long as the entry again.
+    ttl = info_cache.ttl(platform)
+    cached_info = info_cache.get(url, valid=lambda value: info_tokens.touch(value.get('info_token'), ttl))
+    if cached_info is not None:
+        tracing.event('info_cache_hit')
+        return cached_info, True
+
+    if slideshow.is_photo_url(url):
+        # Slideshow foto: data post disimpan di token untuk /api/download
+        with tracing.span('extract', platform=platform, slideshow=True), \
+                admission_control.slot(admission.EXTRACT) as waited, \
+                ydl_pool.session(platform, ytdl.INFO, logger=tracing.ytdl_logger()) as ydl, \
+                metrics.STAGE_SECONDS.time(metrics.EXTRACT, platform, ''):
+            tracing.event('admitted', waited=round(waited, 3))
+            data = slideshow.extract(ydl, url)
+        video_info = build_slideshow_info(data, info_tokens.put(url, data, ttl))
+        info_cache.set(url, video_info, platform)
+        return video_info, False
+
+    with tracing.span('extract', platform=platform), \
+            admission_control.slot(admission.EXTRACT) as waited, \
+            ydl_pool.session(platform, ytdl.INFO, logger=tracing.ytdl_logger()) as ydl:
+        tracing.event('admitted', waited=round(waited, 3))
+        if info is None:
+            with metrics.STAGE_SECONDS.time(metrics.EXTRACT, platform, ''):
+                info = ydl.extract_info(url, download=False)
+        if not info:
+            return None, False
+
+        # Simpan info lengkap supaya /api/download tidak perlu ekstraksi ulang
+        info_token = info_tokens.put(url, ydl.sanitize_info(info), ttl)
+
+    video_info = build_video_info(info, info_token)
+    info_cache.set(url, video_info, platform)
+    return video_info, False
+
 @app.route('/api/get-info', methods=['POST'])
+@rate_limit_decorator(ratelimit.INFO)
 def get_video_info():
     """Mendapatkan informasi video tanpa download"""
     try:
         # Log request for monitoring
         ip = get_client_ip()
-        logger.info(f"get-info request from IP: {ip}")
+        logger.info("get-info request from IP: %s", ip)
 
         data = request.get_json()
         url = data.get('url')
 
-        if not url:
-            return jsonify({'error': 'URL tidak boleh kosong'}), 400
-
-        # Validate URL for security
-        if not is_valid_url(url):
-            return jsonify({'error': 'URL tidak valid atau mengandung karakter berbahaya'}), 400
-
-        # Block Facebook URLs (not supported currently)
-        if 'facebook.com' in url or 'fb.watch' in url or 'fb.com' in url:
-            return jsonify({'error': 'Maaf, Facebook sementara tidak didukung. Silakan gunakan platform lain seperti Instagram, TikTok, atau YouTube.'}), 400
-
-        # Handle TikTok photo/slideshow URLs - convert to video format
-        if 'tiktok.com' in url and '/photo/' in url:
-            # Remove query parameters
-            if '?' in url:
-                url = url.split('?')[0]
-            # Convert /photo/ to /video/ format
-            url = url.replace('/photo/', '/video/')
-
-        # Determine platform for specific handling
-        platform = 'unknown'
-        if 'instagram.com' in url:
-            platform = 'instagram'
-        elif 'tiktok.com' in url:
-            platform = 'tiktok'
-        elif 'youtube.com' in url or 'youtu.be' in url:
-            platform = 'youtube'
-
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'ignoreerrors': False,
-            'no_color': True,
-            # Force IPv4
-            'source_address': '0.0.0.0',
-            # Enhanced headers
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                'Accept': '*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Sec-Fetch-Dest': 'empty',
-                'Sec-Fetch-Mode': 'cors',
-                'Sec-Fetch-Site': 'same-origin',
-            },
-            # Platform-specific configurations
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['android', 'web', 'ios'],
-                    'skip': ['hls', 'dash'],
-                },
-                'tiktok': {
-                    'api_hostname': 'api16-normal-c-useast1a.tiktokv.com',
-                    'app_version': '34.1.2',
-                    'manifest_app_version': '341',
-                    'webpage_download': True,
-                },
-                'instagram': {
-                    'api': 'graphql',  # Use GraphQL API
-                },
-            },
-            # Retry and timeout settings
-            'retries': 15,
-            'fragment_retries': 15,
-            'socket_timeout': 30,
-            'nocheckcertificate': True,
-            'prefer_insecure': False,
-        }
-
-        # Add platform-specific Referer
-        if platform == 'instagram':
-            ydl_opts['http_headers']['Referer'] = 'https://www.instagram.com/'
-            ydl_opts['http_headers']['X-IG-App-ID'] = '936619743392459'
+        error, url, platform = validate_url(url)
+        if error:
+            return jsonify({'error': error}), 400
+        video_info, cache_hit = extract_video_info(url, platform)
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        # Check if info is valid
+        if not video_info:
+            return jsonify({'error': 'Tidak dapat mengambil informasi video. URL mungkin tidak valid atau tidak didukung.'}), 400
 
-            # Check if info is valid
-            if not info:
-                return jsonify({'error': 'Tidak dapat mengambil informasi video. URL mungkin tidak valid atau tidak didukung.'}), 400
-
-            # Format informasi video
-            video_info = {
-                'title': info.get('title', 'Unknown'),
-                'thumbnail': info.get('thumbnail', '') or info.get('thumbnails', [{}])[0].get('url', ''),
-                'duration': info.get('duration', 0),
-                'uploader': info.get('uploader', info.get('uploader_id', 'Unknown')),
-                'view_count': info.get('view_count', 0) or info.get('like_count', 0),
-                'platform': info.get('extractor', 'Unknown'),
-                'formats': []
-            }
-
-            # Ambil format yang tersedia untuk estimasi ukuran
-            available_formats = info.get('formats', [])
-            duration = info.get('duration', 0)
-
-            # Format selection yang universal untuk semua platform
-            video_info['formats'] = [
-                {
-                    'quality': 'Best Quality',
-                    'ext': 'mp4',
-                    'filesize': 0,
-                    'format_id': 'bv*+ba/b',
-                    'description': 'Kualitas terbaik'
-                },
-                {
-                    'quality': 'HD 720p',
-                    'ext': 'mp4',
-                    'filesize': 0,
-                    'format_id': 'bv*[height<=720]+ba/b[height<=720]/bv*[height<=720]/b',
-                    'description': '720p HD'
-                },
-                {
-                    'quality': 'SD 480p',
-                    'ext': 'mp4',
-                    'filesize': 0,
-                    'format_id': 'bv*[height<=480]+ba/b[height<=480]/bv*[height<=480]/b',
-                    'description': '480p SD'
-                },
-                {
-                    'quality': 'Low 360p',
-                    'ext': 'mp4',
-                    'filesize': 0,
-                    'format_id': 'bv*[height<=360]+ba/b[height<=360]/bv*[height<=360]/b',
-                    'description': '360p'
-                },
-                {
-                    'quality': 'Audio Only (MP3)',
-                    'ext': 'mp3',
-                    'filesize': 0,
-                    'format_id': 'bestaudio',
-                    'description': 'MP3 Audio'
-                }
-            ]
-
-            return jsonify(video_info)
+        response = jsonify(video_info)
+        response.headers['X-Cache'] = 'HIT' if cache_hit else 'MISS'
+        return response
 
+    except admission.StageBusy as e:
+        logger.warning("Extract stage busy, rejecting get-info from IP: %s", ip)
+        return busy_response(e.retry_after, e.stage)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 500))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))  # per batch request
+
+def expand_batch_source(url, platform):
+    """Flat-extract a playlist/profile URL into entry URLs
+
+    Returns (entry_urls, title, info); `info` is the full info dict when
+    the URL turned out to be a single video.
+    """
+    with tracing.span('expand', platform=platform), admission_control.slot(admission.EXTRACT), \
+            ydl_pool.session(platform, ytdl.FLAT, playlistend=BATCH_MAX_URLS,
+                             logger=tracing.ytdl_logger()) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if not info:
+        return [], None, None
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        return [url], None, info
+    urls = [
+        entry.get('webpage_url') or entry.get('url')
+        for entry in info.get('entries') or []
+        if entry and (entry.get('webpage_url') or entry.get('url'))
+    ]
+    return urls[:BATCH_MAX_URLS], info.get('title'), None
+
+def batch_item(index, url, info=None):
+    """Resolve one batch entry into an NDJSON-ready dict"""
+    result = {'index': index, 'url': url}
+    error = check_url(url)
+    if error:
+        result['error'] = error
+        return result
+    try:
+        url, platform = prepare_url(url)
+        video_info, cache_hit = extract_video_info(url, platform, info)
+    except admission.StageBusy as e:
+        result['error'] = 'Server sedang sibuk. Silakan coba lagi sebentar lagi.'
+        result['retry_after'] = int(ratelimit.retry_after_header(e.retry_after))
+        return result
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+    if not video_info:
+        result['error'] = 'Tidak dapat mengambil informasi video. URL mungkin tidak valid atau tidak didukung.'
+        return result
+    result.update(video_info, success=True, cache='HIT' if cache_hit else 'MISS')
+    return result
+
+@app.route('/api/get-info/batch', methods=['POST'])
+@rate_limit_decorator(ratelimit.INFO, cost=batch_request_cost)
+def get_video_info_batch():
+    """Info banyak video sekaligus (daftar URL atau URL playlist), hasil di-stream sebagai NDJSON"""
+    ip = get_client_ip()
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls')
+    playlist_url = data.get('url')
+    title = None
+    first_info = None
+
+    if urls is not None:
+        if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+            return jsonify({'error': 'urls harus berupa daftar URL'}), 400
+        if len(urls) > BATCH_MAX_URLS:
+            return jsonify({'error': f'Maksimal {BATCH_MAX_URLS} URL per batch'}), 400
+    else:
+        error = check_url(playlist_url)
+        if error:
+            return jsonify({'error': error}), 400
+        try:
+            url, platform = prepare_url(playlist_url)
+            urls, title, first_info = expand_batch_source(url, platform)
+        except admission.StageBusy as e:
+            logger.warning("Extract stage busy, rejecting batch from IP: %s", ip)
+            return busy_response(e.retry_after, e.stage)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
+        if not urls:
+            return jsonify({'error': 'Tidak ada video yang ditemukan di URL tersebut.'}), 400
+
+    logger.info("get-info batch of %d URLs from IP: %s", len(urls), ip)
+
+    def generate():
+        started = time.time()
+        failed = 0
+        yield json.dumps({'total': len(urls), 'playlist': title}) + '\n'
+
+        # Maksimal BATCH_CONCURRENCY entry diekstrak bersamaan; hasil dikirim begitu selesai
+        pending = set()
+        items = iter(enumerate(urls))
+        try:
+            while True:
+                for index, url in items:
+                    info = first_info if index == 0 else None
+                    pending.add(batch_executor.submit(tracing.propagate(batch_item), index, url, info))
+                    if len(pending) >= BATCH_CONCURRENCY:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    failed += 'error' in result
+                    yield json.dumps(result) + '\n'
+        finally:
+            # Client putus: batalkan entry yang belum mulai
+            for future in pending:
+                future.cancel()
+
+        yield json.dumps({
+            'done': True,
+            'total': len(urls),
+            'failed': failed,
+            'elapsed': round(time.time() - started, 3),
+        }) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/download', methods=['POST'])
+@rate_limit_decorator(ratelimit.DOWNLOAD, cost=download_request_cost)
 def download_video():
-    """Download video dengan kualitas yang dipilih"""
+    """Antrikan download video dengan kualitas yang dipilih"""
     try:
         # Log request for monitoring
         ip = get_client_ip()
-        logger.info(f"download request from IP: {ip}")
+        logger.info("download request from IP: %s", ip)
 
         data = request.get_json()
         url = data.get('url')
         quality = data.get('quality', 'Best Quality')
         format_id = data.get('format_id', 'best')
-
-        if not url:
-            return jsonify({'error': 'URL tidak boleh kosong'}), 400
-
-        # Validate URL for security
-        if not is_valid_url(url):
-            return jsonify({'error': 'URL tidak valid atau mengandung karakter berbahaya'}), 400
-
-        # Block Facebook URLs (not supported currently)
-        if 'facebook.com' in url or 'fb.watch' in url or 'fb.com' in url:
-            return jsonify({'error': 'Maaf, Facebook sementara tidak didukung. Silakan gunakan platform lain seperti Instagram, TikTok, atau YouTube.'}), 400
-
-        # Handle TikTok photo/slideshow URLs - convert to video format
-        original_url = url
-        if 'tiktok.com' in url and '/photo/' in url:
-            # Remove query parameters
-            if '?' in url:
-                url = url.split('?')[0]
-            # Convert /photo/ to /video/ format
-            url = url.replace('/photo/', '/video/')
-
-        # Determine platform for specific handling
-        platform = 'unknown'
-        if 'instagram.com' in url:
-            platform = 'instagram'
-        elif 'tiktok.com' in url:
-            platform = 'tiktok'
-        elif 'youtube.com' in url or 'youtu.be' in url:
-            platform = 'youtube'
-
-        # Generate unique filename - limit panjang nama
-        unique_id = str(uuid.uuid4())[:8]
-
-        # Gunakan template sederhana untuk menghindari nama file terlalu panjang
-        output_template = os.path.join(DOWNLOAD_FOLDER, f'{unique_id}.%(ext)s')
-
-        ydl_opts = {
-            'format': format_id,
-            'outtmpl': output_template,
-            'quiet': True,
-            'no_warnings': True,
-            'ignoreerrors': False,
-            'merge_output_format': 'mp4',
-            'postprocessor_args': ['-ar', '44100'],
-            # Force IPv4
-            'source_address': '0.0.0.0',
-            # Anti-403 measures - Enhanced
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-                'Accept': '*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'empty',
-                'Sec-Fetch-Mode': 'cors',
-                'Sec-Fetch-Site': 'same-origin',
-                'Cache-Control': 'max-age=0',
-            },
-            # Restrict filename untuk avoid nama terlalu panjang
-            'restrictfilenames': True,
-            # Platform-specific fixes
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['android', 'web', 'ios'],
-                    'skip': ['hls', 'dash']
-                },
-                'tiktok': {
-                    'api_hostname': 'api16-normal-c-useast1a.tiktokv.com',
-                    'app_version': '34.1.2',
-                    'manifest_app_version': '341',
-                    'webpage_download': True,
-                },
-                'instagram': {
-                    'api': 'graphql',
-                },
-            },
-            # Retry options
-            'retries': 15,
-            'fragment_retries': 15,
-            'socket_timeout': 30,
-            'skip_unavailable_fragments': True,
-            # Additional options
-            'nocheckcertificate': True,
-            'prefer_insecure': False,
-            'geo_bypass': True,
-            'age_limit': None,
+        info_token = data.get('info_token')
+
+        error, url, platform = validate_url(url)
+        if error:
+            return jsonify({'error': error}), 400
+
+        try:
+            job = start_download(url, platform, quality, format_id, info_token, ip)
+        except admission.StageBusy as e:
+            logger.warning("%s, rejecting request from IP: %s", e, ip)
+            return busy_response(e.retry_after, e.stage)
+
+        # Client lama bisa menunggu hasil langsung dengan "wait": true
+        if data.get('wait'):
+            download_jobs.wait(job)
+            if job.state == JOB_FAILED:
+                return jsonify({'error': job.error}), 400
+            return jsonify(job.result)
+
+        response = {
+            'success': True,
+            'job_id': job.id,
+            'status_url': f'/api/jobs/{job.id}',
+            'events_url': f'/api/download/{job.id}/events'
         }
+        if job.meta.get('progressive'):
+            response['stream_url'] = f'/api/download/{job.id}/stream'
+        return jsonify(response), 202
 
-        # Add platform-specific headers
-        if platform == 'instagram':
-            ydl_opts['http_headers']['Referer'] = 'https://www.instagram.com/'
-            ydl_opts['http_headers']['X-IG-App-ID'] = '936619743392459'
-
-        # Sesuaikan format berdasarkan pilihan
-        if quality == 'Audio Only (MP3)':
-            ydl_opts['format'] = 'bestaudio/best'
-            ydl_opts['postprocessors'] = [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }]
-        else:
-            # Untuk video, gunakan format ID yang sudah ada fallback
-            ydl_opts['format'] = format_id
-            # Untuk TikTok slideshow/foto, convert ke video
-            ydl_opts['postprocessors'] = [{
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': 'mp4',
-            }]
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+def start_download(url, platform, quality, format_id, info_token, ip):
+    """Queue a download job (or finish it at once from the store); return the Job
+
+    Raises admission.StageBusy when the download queue has no room, when
+    the request needs ffmpeg and the postprocess queue is already full,
+    or when no extract slot is free to resolve the format.
+    """
+    cached_info = info_tokens.get(info_token, url)
+    meta = {'url': url, 'platform': platform, 'quality': quality, 'ip': ip}
+
+    # File yang sama sudah pernah didownload: langsung selesai
+    entry = download_store.get(download_request_key(url, quality, format_id))
+    if entry is not None:
+        return download_jobs.add_finished(
+            download_result(download_store.path_for(entry)), meta=meta
+        )
+
+    if slideshow.is_photo_url(url):
+        # Token slideshow berisi data post, bukan info dict yt-dlp
+        data = cached_info if cached_info and 'images' in cached_info else None
+        if slideshow_kind(quality, format_id) == slideshow.VIDEO:
+            admission_control.check(admission.POSTPROCESS)
+        return submit_download(
+            traced_job(lambda job: run_slideshow(job, url, quality, format_id, data)), meta
+        )
+
+    # Format progresif (satu file mp4) bisa di-stream ke client sambil didownload
+    resolved = resolve_format(cached_info, quality, format_id) if cached_info else None
+    if quality == 'Audio Only (MP3)' or (resolved and not resolved.get('requested_formats')
+                                         and postprocess.plan_for_info(resolved)['action'] != postprocess.NONE):
+        admission_control.check(admission.POSTPROCESS)
+    meta['progressive'] = is_progressive(resolved, quality)
+    return submit_download(
+        traced_job(lambda job: run_download(job, url, platform, quality, format_id,
+                                            cached_info, resolved)), meta
+    )
+
+def submit_download(fn, meta):
+    """Queue a job through the download admission stage; raises admission.StageBusy"""
+    admission_control.check(admission.DOWNLOAD)
+    try:
+        return download_jobs.submit(fn, meta=meta)
+    except QueueFullError as e:
+        # Antrian terisi di antara check dan submit
+        raise admission.StageBusy(admission.DOWNLOAD, e.retry_after or admission.DEFAULT_RETRY_AFTER)
+
+def traced_job(fn):
+    """Run a job function in a 'job' span of the request that queued it
+
+    The job's phases (queued, extracting, downloading, merging,
+    pp_queued, remuxing, converting) are added as spans from
+    job.phase_log when it ends.
+    """
+    parent = tracing.current_span()
+    if parent is None:
+        return fn
+
+    def run(job):
+        with tracing.span('job', job_id=job.id) as span:
             try:
-                info = ydl.extract_info(url, download=True)
-            except Exception as extract_error:
-                # Handle TikTok slideshow/photo downloads specifically
-                if 'tiktok' in url.lower():
-                    # Try to find downloaded files in folder
-                    downloaded_files = [f for f in os.listdir(DOWNLOAD_FOLDER) if f.startswith(unique_id)]
-                    if downloaded_files:
-                        filename = os.path.join(DOWNLOAD_FOLDER, downloaded_files[0])
-                        actual_size = os.path.getsize(filename) if os.path.exists(filename) else 0
-
-                        return jsonify({
-                            'success': True,
-                            'filename': os.path.basename(filename),
-                            'download_url': f'/download/{os.path.basename(filename)}',
-                            'filesize': actual_size
-                        })
-
-                return jsonify({'error': f'Gagal mendownload: {str(extract_error)}'}), 400
-
-            # Check if download was successful
+                return fn(job)
+            finally:
+                if span is not None:
+                    phases = list(job.phase_log)
+                    ends = [started for _, started in phases[1:]] + [time.time()]
+                    for index, ((phase, started), ended) in enumerate(zip(phases, ends)):
+                        # Fase pertama (antri di JobManager) terjadi sebelum span job dimulai
+                        tracing.add_span(f'job.{phase}', started, ended, span if index else parent)
+    return tracing.propagate(run)
+
+def download_result(filename):
+    """Build the response payload for a finished download"""
+    actual_size = os.path.getsize(filename) if os.path.exists(filename) else 0
+    return {
+        'success': True,
+        'filename': os.path.basename(filename),
+        'download_url': f'/download/{os.path.basename(filename)}',
+        'filesize': actual_size
+    }
+
+def download_request_key(url, quality, format_id):
+    """Store key for a download request before the format is resolved"""
+    return make_key('request', normalize_url(url), quality, format_id)
+
+def download_content_key(info, quality):
+    """Store key for the resolved video + format chosen by yt-dlp"""
+    return make_key('content', info.get('extractor_key'), info.get('id'),
+                    info.get('format_id'), quality)
+
+def resolve_format(cached_info, quality, format_id):
+    """Run yt-dlp format selection on a cached info dict without downloading"""
+    selector = 'bestaudio/best' if quality == 'Audio Only (MP3)' else format_id
+    try:
+        with tracing.span('resolve_format', format=selector), \
+                admission_control.slot(admission.EXTRACT), \
+                ydl_pool.session('unknown', ytdl.INFO, format=selector, logger=tracing.ytdl_logger()) as ydl:
+            return ydl.process_ie_result(copy.deepcopy(cached_info), download=False)
+    except yt_dlp.utils.DownloadError:
+        return None
+
+# Protokol yang ditulis berurutan ke satu file .part, jadi bisa di-stream sambil jalan
+STREAMABLE_PROTOCOLS = ('http', 'https', 'm3u8_native')
+
+def is_progressive(resolved, quality):
+    """True if the selected format lands as one final file with no merge/convert"""
+    if not resolved or quality == 'Audio Only (MP3)':
+        return False
+    if resolved.get('requested_formats'):
+        return False
+    if postprocess.plan_for_info(resolved)['action'] != postprocess.NONE:
+        return False
+    return resolved.get('protocol') in STREAMABLE_PROTOCOLS
+
+def run_download(job, url, platform, quality, format_id, cached_info=None, resolved=None):
+    """Jalankan satu job download (dipanggil dari worker pool)
+
+    File yang sama (video + format + kualitas) hanya didownload sekali;
+    request bersamaan untuk key yang sama menunggu download pertama.
+    Tanpa info_token, info diekstrak dulu supaya store dicek dengan key
+    konten: format_id lain yang memilih file yang sama tidak didownload lagi.
+    """
+    request_key = download_request_key(url, quality, format_id)
+    key = request_key
+    try:
+        if cached_info is None:
+            cached_info = extract_download_info(url, platform)
+        if resolved is None:
+            resolved = resolve_format(cached_info, quality, format_id)
+    except admission.StageBusy:
+        raise JobError('Server sedang sibuk. Silakan coba lagi sebentar lagi.')
+    if resolved:
+        key = download_content_key(resolved, quality)
+
+    entry = download_store.run_once(
+        key,
+        lambda: fetch_download(job, url, platform, quality, format_id, cached_info, key[:16]),
+        aliases=[request_key]
+    )
+    return download_result(download_store.path_for(entry))
+
+def extract_download_info(url, platform):
+    """Extract the sanitized info dict for a download that came without an info_token"""
+    try:
+        with tracing.span('extract', platform=platform), \
+                admission_control.slot(admission.EXTRACT) as waited, \
+                ydl_pool.session(platform, ytdl.INFO, logger=tracing.ytdl_logger()) as ydl, \
+                metrics.STAGE_SECONDS.time(metrics.EXTRACT, platform, ''):
+            tracing.event('admitted', waited=round(waited, 3))
+            info = ydl.extract_info(url, download=False)
             if not info:
-                # Even if info is None, check if file was downloaded
-                downloaded_files = [f for f in os.listdir(DOWNLOAD_FOLDER) if f.startswith(unique_id)]
-                if downloaded_files:
-                    filename = os.path.join(DOWNLOAD_FOLDER, downloaded_files[0])
-                    actual_size = os.path.getsize(filename) if os.path.exists(filename) else 0
-
-                    return jsonify({
-                        'success': True,
-                        'filename': os.path.basename(filename),
-                        'download_url': f'/download/{os.path.basename(filename)}',
-                        'filesize': actual_size
-                    })
-                else:
-                    return jsonify({'error': 'Gagal mendownload video. URL mungkin tidak valid atau tidak didukung.'}), 400
-
-            filename = ydl.prepare_filename(info)
-
-            # Jika audio, file extension berubah jadi .mp3
-            if quality == 'Audio Only (MP3)':
-                filename = filename.rsplit('.', 1)[0] + '.mp3'
-
-            # Get actual file size
-            actual_size = 0
-            if os.path.exists(filename):
-                actual_size = os.path.getsize(filename)
+                raise JobError('Gagal mendownload video. URL mungkin tidak valid atau tidak didukung.')
+            return ydl.sanitize_info(info)
+    except yt_dlp.utils.DownloadError as extract_error:
+        raise JobError(f'Gagal mendownload: {str(extract_error)}')
+
+def postprocess_download(job, filename, info, quality):
+    """Convert the download to MP4 (or MP3) only when it is not one already
+
+    ffmpeg runs in the shared postprocess_pool so bursts of conversions
+    queue up instead of all encoding at once.
+    """
+    target = postprocess.AUDIO_EXT if quality == 'Audio Only (MP3)' else postprocess.TARGET_EXT
+    file_plan = postprocess.plan_for_file(filename, info, target)
+    job.postprocess = file_plan
+    if file_plan['action'] == postprocess.NONE:
+        return filename
+
+    phase = 'remuxing' if file_plan['action'] == postprocess.REMUX else 'converting'
+    job.set_phase(PP_QUEUED)
+    try:
+        with tracing.span('postprocess', action=file_plan['action'], reason=file_plan['reason']) as span:
+            filename = postprocess_pool.run(filename, file_plan, duration=info.get('duration'),
+                                            on_start=lambda: job.set_phase(phase))
+            if span is not None:
+                span.set(queue_wait=file_plan['queue_wait'], encode_time=file_plan['encode_time'])
+    except postprocess.PostprocessError as e:
+        raise JobError(f'Gagal mengonversi video: {str(e)}')
+    logger.info("Post-processed %s: %s (%s), waited %ss, encoded in %ss",
+                os.path.basename(filename), file_plan['action'], file_plan['reason'],
+                file_plan['queue_wait'], file_plan['encode_time'])
+    return filename
 
-        return jsonify({
-            'success': True,
-            'filename': os.path.basename(filename),
-            'download_url': f'/download/{os.path.basename(filename)}',
-            'filesize': actual_size
-        })
+def fetch_download(job, url, platform, quality, format_id, cached_info, unique_id):
+    """Download dengan yt-dlp; return (path, meta, content_keys) untuk download store"""
+
+    # Gunakan template sederhana untuk menghindari nama file terlalu panjang
+    output_template = os.path.join(DOWNLOAD_FOLDER, f'{unique_id}.%(ext)s')
+
+    # Ekstraksi MP3 dan konversi MP4 dijalankan di postprocess_pool setelah download
+    selector = 'bestaudio/best' if quality == 'Audio Only (MP3)' else format_id
+
+    meta = {'url': normalize_url(url), 'platform': platform, 'quality': quality}
+
+    with ydl_pool.session(platform, ytdl.DOWNLOAD, format=selector, outtmpl=output_template,
+                          progress_hooks=[job.progress_hook, *tracing.progress_hooks()],
+                          postprocessor_hooks=[job.postprocessor_hook],
+                          logger=tracing.ytdl_logger()) as ydl:
+        try:
+            info = None
+            if cached_info is not None:
+                try:
+                    # Lewati extractor, langsung format selection + download
+                    info = ydl.process_ie_result(copy.deepcopy(cached_info), download=True)
+                except yt_dlp.utils.DownloadError:
+                    # URL media di info lama mungkin sudah kadaluarsa
+                    info = None
+            if info is None:
+                info = ydl.extract_info(url, download=True)
+        except Exception as extract_error:
+            raise JobError(f'Gagal mendownload: {str(extract_error)}')
+
+        if not info:
+            raise JobError('Gagal mendownload video. URL mungkin tidak valid atau tidak didukung.')
+
+        # Path final setelah postprocessor (merge/convert) jika berbeda
+        filename = ytdl.downloaded_path(ydl, info)
+        if filename is None:
+            raise JobError('Gagal mendownload video. File hasil download tidak ditemukan.')
+
+    filename = postprocess_download(job, filename, info, quality)
+
+    meta.update({
+        'video_id': info.get('id'),
+        'extractor': info.get('extractor_key'),
+        'format_id': info.get('format_id'),
+        'ext': os.path.splitext(filename)[1].lstrip('.'),
+        'postprocess': job.postprocess and job.postprocess['action'],
+    })
+
+    logger.info("Download job %s finished: %s", job.id, os.path.basename(filename))
+    return filename, meta, [download_content_key(info, quality)]
+
+def slideshow_kind(quality, format_id):
+    """Map the requested quality/format of a photo post to a slideshow output kind"""
+    if quality == 'Audio Only (MP3)' or format_id == slideshow.AUDIO:
+        return slideshow.AUDIO
+    if format_id == slideshow.IMAGES:
+        return slideshow.IMAGES
+    return slideshow.VIDEO
+
+def run_slideshow(job, url, quality, format_id, data=None):
+    """Jalankan job slideshow foto TikTok: video, ZIP foto atau MP3 musiknya
+
+    Hasil render disimpan per post + jenis + setelan render, jadi request
+    berikutnya untuk post yang sama langsung dilayani dari download store.
+    """
+    kind = slideshow_kind(quality, format_id)
+    post_id = slideshow.PHOTO_URL_RE.search(url).group('id')
+    key = make_key('slideshow', post_id, kind, slideshow.render_signature())
+    entry = download_store.run_once(
+        key,
+        lambda: fetch_slideshow(job, url, kind, data, key[:16]),
+        aliases=[download_request_key(url, quality, format_id)]
+    )
+    return download_result(download_store.path_for(entry))
+
+def fetch_slideshow(job, url, kind, data, unique_id):
+    """Ambil foto + musik sekali lalu buat hasilnya; return (path, meta, aliases) untuk download store"""
+    base_path = os.path.join(DOWNLOAD_FOLDER, unique_id)
+    with ydl_pool.session('tiktok', ytdl.DOWNLOAD, logger=tracing.ytdl_logger()) as ydl:
+        fresh = data is None
+        if fresh:
+            data = slideshow.extract(ydl, url)
+        while True:
+            try:
+                filename, record = slideshow.build(
+                    ydl, data, kind, base_path, pool=postprocess_pool,
+                    progress_hook=job.progress_hook, on_phase=job.set_phase
+                )
+                break
+            except yt_dlp.networking.exceptions.HTTPError:
+                if fresh:
+                    raise
+                # URL foto dari token sudah kadaluarsa: ekstrak ulang sekali
+                data, fresh = slideshow.extract(ydl, url), True
+            except (slideshow.SlideshowError, postprocess.PostprocessError) as e:
+                raise JobError(f'Gagal membuat slideshow: {str(e)}')
+
+    job.postprocess = record
+    logger.info("Slideshow job %s finished: %s (%s, %d images)",
+                job.id, os.path.basename(filename), kind, len(data['images']))
+    meta = {
+        'url': normalize_url(url),
+        'platform': 'tiktok',
+        'quality': kind,
+        'video_id': data['id'],
+        'extractor': 'TikTokSlideshow',
+        'ext': os.path.splitext(filename)[1].lstrip('.'),
+        'postprocess': record and record['action'],
+    }
+    return filename, meta, []
+
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    """Status job download: state, bytes, kecepatan dan ETA"""
+    job = download_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job tidak ditemukan'}), 404
+    return jsonify(job.to_dict())
+
+# Interval keep-alive SSE supaya proxy tidak menutup koneksi idle
+SSE_KEEPALIVE = 15
+
+@app.route('/api/download/<job_id>/events')
+def download_events(job_id):
+    """Stream progress job download sebagai Server-Sent Events"""
+    job = download_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job tidak ditemukan'}), 404
+
+    def generate():
+        version = None
+        while True:
+            snapshot = job.to_dict()
+            if snapshot['version'] != version:
+                version = snapshot['version']
+                yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+            if snapshot['state'] in (JOB_FINISHED, JOB_FAILED):
+                yield f"event: {snapshot['state']}\ndata: {json.dumps(snapshot)}\n\n"
+                return
+            if job.wait_for_update(version, timeout=SSE_KEEPALIVE) == version:
+                yield ': keep-alive\n\n'
+            else:
+                # Gabungkan update progress yang datang beruntun
+                time.sleep(0.25)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def serve_slot(platform='unknown', quality=''):
+    """Take a SERVE slot for one file transfer; return the callback that frees it
+
+    Raises admission.StageBusy. The callback goes into a ClosingIterator so
+    the slot is held until the response body is done (or the client left);
+    it also records the transfer time as the serve stage.
+    """
+    stage = admission_control.stage(admission.SERVE)
+    stage.acquire()
+    started = time.monotonic()
+
+    def release():
+        held = time.monotonic() - started
+        stage.release(held)
+        metrics.STAGE_SECONDS.observe(held, metrics.SERVE, platform, quality_label(quality))
+    return release
+
+@app.route('/api/download/<job_id>/stream')
+@rate_limit_decorator(ratelimit.FILE, check_suspicious=False)
+def stream_download(job_id):
+    """Kirim file ke browser sambil yt-dlp masih mendownload (pipe-through)"""
+    job = download_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job tidak ditemukan'}), 404
+    if not job.meta.get('progressive'):
+        return jsonify({'error': 'Format ini perlu diproses dulu. Gunakan download_url setelah job selesai.'}), 409
+
+    # Tunggu sampai yt-dlp mulai menulis file
+    version = None
+    while job.output_path is None and not job.done.is_set():
+        version = job.wait_for_update(version, timeout=SSE_KEEPALIVE)
+
+    if job.output_path is None:
+        # Job selesai tanpa menulis file sendiri (mis. menunggu download yang sama)
+        if job.state == JOB_FINISHED:
+            return redirect(job.result['download_url'])
+        return jsonify({'error': job.error}), 400
+
+    try:
+        release_slot = serve_slot(job.meta.get('platform', 'unknown'), job.meta.get('quality'))
+    except admission.StageBusy as e:
+        return busy_response(e.retry_after, e.stage)
+
+    final_path = job.output_path
+    if final_path.endswith('.part'):
+        final_path = final_path[:-len('.part')]
+    try:
+        try:
+            f = open(job.output_path, 'rb')
+        except FileNotFoundError:
+            # .part sudah di-rename ke nama final
+            f = open(final_path, 'rb')
+    except Exception:
+        release_slot()
+        raise
+
+    def generate():
+        # File di disk sekaligus jadi cache: setelah selesai masuk download store
+        with f:
+            version = None
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                    continue
+                if job.done.is_set():
+                    if job.state == JOB_FAILED:
+                        # Putuskan koneksi supaya browser tidak menyimpan file terpotong
+                        logger.warning("Stream for job %s aborted: %s", job.id, job.error)
+                        raise IOError(job.error)
+                    chunk = f.read()
+                    if not chunk:
+                        return
+                    yield chunk
+                    continue
+                version = job.wait_for_update(version, timeout=1)
+
+    filename = os.path.basename(final_path)
+    response = Response(stream_with_context(generate()), mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.response = ClosingIterator(response.response, release_slot)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 50))
+
+def bulk_items(data):
+    """Normalized bulk items, or None if the request body is malformed
+
+    Accepts "items": [{url, quality, format_id, info_token}] or "urls"
+    with one quality/format_id for all of them.
+    """
+    items = data.get('items')
+    if items is None and isinstance(data.get('urls'), list):
+        items = [{'url': url} for url in data['urls']]
+    if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+        return None
+    return [
+        {
+            'url': item.get('url'),
+            'quality': item.get('quality', data.get('quality', 'Best Quality')),
+            'format_id': item.get('format_id', data.get('format_id', 'best')),
+            'info_token': item.get('info_token'),
+        }
+        for item in items
+    ]
+
+@app.route('/api/download/bulk', methods=['POST'])
+@rate_limit_decorator(ratelimit.DOWNLOAD, cost=bulk_request_cost)
+def download_bulk():
+    """Antrikan banyak download sekaligus; hasilnya diambil sebagai satu ZIP"""
+    ip = get_client_ip()
+    data = request.get_json(silent=True) or {}
+
+    items = bulk_items(data)
+    if not items:
+        return jsonify({'error': 'items atau urls harus berupa daftar yang tidak kosong'}), 400
+    if len(items) > BULK_MAX_ITEMS:
+        return jsonify({'error': f'Maksimal {BULK_MAX_ITEMS} video per bulk download'}), 400
+
+    for item in items:
+        error = check_url(item.get('url'))
+        if error:
+            return jsonify({'error': f"{item.get('url')}: {error}"}), 400
+
+    logger.info("bulk download of %d items from IP: %s", len(items), ip)
+    jobs = []
+    try:
+        for item in items:
+            url, platform = prepare_url(item['url'])
+            jobs.append(start_download(url, platform, item['quality'], item['format_id'],
+                                       item['info_token'], ip))
+    except admission.StageBusy as e:
+        logger.warning("%s, rejecting bulk request from IP: %s", e, ip)
+        return busy_response(e.retry_after, e.stage)
+
+    bulk_id = download_jobs.add_group(jobs)
+    return jsonify({
+        'success': True,
+        'bulk_id': bulk_id,
+        'zip_url': f'/api/download/bulk/{bulk_id}/zip',
+        'jobs': [
+            {'job_id': job.id, 'url': job.meta['url'], 'status_url': f'/api/jobs/{job.id}'}
+            for job in jobs
+        ],
+    }), 202
+
+class ZipSink:
+    """Write-only file object for zipfile; written bytes are drained by a generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+@app.route('/api/download/bulk/<bulk_id>/zip')
+@rate_limit_decorator(ratelimit.FILE, check_suspicious=False)
+def download_bulk_zip(bulk_id):
+    """Stream ZIP (tanpa kompresi) berisi hasil bulk download, entry dikirim begitu job selesai"""
+    jobs = download_jobs.get_group(bulk_id)
+    if not jobs:
+        return jsonify({'error': 'Bulk download tidak ditemukan'}), 404
+    try:
+        release_slot = serve_slot()
+    except admission.StageBusy as e:
+        return busy_response(e.retry_after, e.stage)
+
+    def finished_jobs():
+        # Urutan selesai, bukan urutan request: entry pertama bisa dikirim secepatnya
+        remaining = list(enumerate(jobs, 1))
+        while remaining:
+            ready = [item for item in remaining if item[1].done.is_set()]
+            if not ready:
+                remaining[0][1].done.wait(0.5)
+                continue
+            for item in ready:
+                remaining.remove(item)
+                yield item
+
+    def generate():
+        sink = ZipSink()
+        failures = []
+        # Arsip tidak pernah ditulis ke disk: zipfile menulis ke sink, isinya langsung di-yield
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for number, job in finished_jobs():
+                if job.state != JOB_FINISHED:
+                    failures.append(f"{number}. {job.meta.get('url')}: {job.error}")
+                    continue
+                filename = job.result['filename']
+                entry = download_store.acquire(filename)
+                path = os.path.join(DOWNLOAD_FOLDER, filename)
+                try:
+                    st = os.stat(path)
+                    info = zipfile.ZipInfo(f'{number:03d}-{filename}',
+                                           date_time=time.localtime(st.st_mtime)[:6])
+                    info.file_size = st.st_size
+                    with open(path, 'rb') as src, archive.open(info, 'w') as dst:
+                        for chunk in iter(lambda: src.read(STREAM_CHUNK_SIZE), b''):
+                            dst.write(chunk)
+                            yield sink.drain()
+                except OSError as e:
+                    failures.append(f"{number}. {job.meta.get('url')}: {e}")
+                finally:
+                    if entry is not None:
+                        download_store.release(entry)
+                yield sink.drain()
+
+            if failures:
+                archive.writestr('GAGAL.txt', 'Video yang gagal didownload:\n' + '\n'.join(failures) + '\n')
+        yield sink.drain()
+
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    response.response = ClosingIterator(response.response, release_slot)
+    response.headers['Content-Disposition'] = f'attachment; filename="vtmu-{bulk_id}.zip"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def accel_redirect_response(filename, etag):
+    """Empty response that tells nginx to serve the file via X-Accel-Redirect"""
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = app.response_class(mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if isinstance(etag, str):
+        response.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+            return response
+    response.headers['X-Accel-Redirect'] = SENDFILE_PREFIX + filename
+    return response
 
 @app.route('/download/<filename>')
+@rate_limit_decorator(ratelimit.FILE, check_suspicious=False)
 def serve_file(filename):
     """Serve downloaded file"""
     try:
@@ -568,11 +1318,46 @@ def serve_file(filename):
         if not os.path.abspath(file_path).startswith(os.path.abspath(DOWNLOAD_FOLDER)):
             return jsonify({'error': 'Akses ditolak'}), 403
 
-        # Check if file exists
-        if not os.path.exists(file_path):
+        # Check if file exists (file internal seperti index store diawali titik)
+        if filename.startswith('.') or not os.path.exists(file_path):
             return jsonify({'error': 'File tidak ditemukan'}), 404
 
-        return send_file(file_path, as_attachment=True)
+        # Tandai file sedang dipakai selama transfer (tidak boleh di-evict)
+        entry = download_store.acquire(filename)
+        try:
+            # Strong ETag dari hash isi file; file di luar store pakai ETag default
+            etag = download_store.etag_for(entry) if entry is not None else True
+
+            if SENDFILE_MODE == 'nginx':
+                # nginx yang mengirim file (termasuk Range), worker langsung bebas
+                response = accel_redirect_response(filename, etag)
+                if entry is not None:
+                    download_store.release(entry)
+                return response
+
+            meta = entry.meta if entry is not None else {}
+            release_slot = serve_slot(meta.get('platform') or 'unknown', meta.get('quality'))
+            try:
+                # conditional=True: Range, If-Range, If-None-Match dan 206/304.
+                # Path absolut: path relatif di-resolve Flask terhadap folder app, bukan working directory
+                response = send_file(os.path.abspath(file_path), as_attachment=True, etag=etag, conditional=True)
+            except Exception:
+                release_slot()
+                raise
+        except Exception:
+            if entry is not None:
+                download_store.release(entry)
+            raise
+
+        # send_file memakai direct_passthrough, jadi call_on_close tidak dipanggil;
+        # bungkus iterable-nya supaya release terjadi saat transfer selesai
+        callbacks = [release_slot]
+        if entry is not None:
+            callbacks.append(lambda: download_store.release(entry))
+        response.response = ClosingIterator(response.response, callbacks)
+        return response
+    except admission.StageBusy as e:
+        return busy_response(e.retry_after, e.stage)
     except Exception as e:
         return jsonify({'error': 'File tidak ditemukan'}), 404
 
@@ -600,12 +1385,8 @@ def health_check():
         # Check Python version
         python_version = f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
 
-        # Check disk space (downloads folder)
-        download_folder_size = sum(
-            os.path.getsize(os.path.join(DOWNLOAD_FOLDER, f))
-            for f in os.listdir(DOWNLOAD_FOLDER)
-            if os.path.isfile(os.path.join(DOWNLOAD_FOLDER, f))
-        ) if os.path.exists(DOWNLOAD_FOLDER) else 0
+        # Ukuran folder downloads dari index store (O(1), tanpa scan folder)
+        folder_summary = download_store.summary()
 
         health_data = {
             'status': 'healthy',
@@ -617,8 +1398,8 @@ def health_check():
                 'flask': '3.0.0'
             },
             'system': {
-                'download_folder_size_mb': round(download_folder_size / (1024 * 1024), 2),
-                'download_folder_files': len(os.listdir(DOWNLOAD_FOLDER)) if os.path.exists(DOWNLOAD_FOLDER) else 0
+                'download_folder_size_mb': round(folder_summary['bytes'] / (1024 * 1024), 2),
+                'download_folder_files': folder_summary['files']
             },
             'uptime': 'running'
         }
@@ -634,6 +1415,263 @@ def health_check():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/stats')
+def get_stats():
+    """Statistik detail: folder downloads, cache, job queue, eviction dan backpressure"""
+    return jsonify({
+        'download_store': download_store.stats(),
+        'eviction': store_evictor.stats(),
+        'download_jobs': download_jobs.stats(),
+        'postprocess': postprocess_pool.stats(),
+        'ytdl_pool': ydl_pool.stats(),
+        'http_pool': httppool.stats(),
+        'info_cache': info_cache.stats(),
+        'info_tokens': info_tokens.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'admission': admission_control.stats(),
+        'logging': dict(log_writer.source.stats(), **log_writer.stats()),
+        'tracing': tracing.recorder.stats(),
+        'profiler': request_profiler.status(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+# ============================================
+# PROMETHEUS METRICS
+# ============================================
+
+# Fase job (jobs.Job.phase) -> tahap di vtmu_stage_duration_seconds
+JOB_PHASE_STAGES = {
+    'queued': metrics.QUEUE,
+    'extracting': metrics.EXTRACT,
+    'downloading': metrics.DOWNLOAD,
+    'merging': metrics.MERGE,
+    PP_QUEUED: metrics.POSTPROCESS_QUEUE,
+    'remuxing': metrics.REMUX,
+    'converting': metrics.CONVERT,
+    # ZIP slideshow dan postprocessor yt-dlp lain
+    'processing': metrics.CONVERT,
+}
+
+def record_job_metrics(job):
+    """Stage durations, bytes and speed of a finished download job"""
+    platform = job.meta.get('platform', 'unknown')
+    quality = quality_label(job.meta.get('quality'))
+    metrics.JOBS.inc(platform, quality, job.state)
+    for phase, seconds in job.phase_durations.items():
+        stage = JOB_PHASE_STAGES.get(phase)
+        if stage is not None:
+            metrics.STAGE_SECONDS.observe(seconds, stage, platform, quality)
+    downloaded = job.downloaded_bytes
+    if downloaded:
+        metrics.DOWNLOAD_BYTES.inc(platform, quality, amount=downloaded)
+        seconds = job.phase_durations.get('downloading')
+        if seconds:
+            metrics.DOWNLOAD_SPEED.observe(downloaded / seconds, platform, quality)
+
+download_jobs.on_finished = record_job_metrics
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.HTTP_REQUESTS.inc(endpoint, request.method, str(response.status_code))
+        metrics.HTTP_SECONDS.observe(time.perf_counter() - started, endpoint)
+    return response
+
+def collect_component_metrics():
+    """Counters and queue depths kept by the other components, read at scrape time"""
+    cache = info_cache.stats()
+    store = download_store.stats()
+    limiter = rate_limiter.counts()
+    stages = admission_control.stats()
+    log_stats = log_writer.source.stats()
+    endpoints = sorted(set(limiter['allowed']) | set(limiter['denied']))
+    return [
+        ('vtmu_info_cache_hits_total', 'counter', 'get-info answered from the info cache',
+         [({}, cache['hits'])]),
+        ('vtmu_info_cache_misses_total', 'counter', 'get-info that needed an extraction',
+         [({}, cache['misses'])]),
+        ('vtmu_info_cache_entries', 'gauge', 'Entries in the info cache', [({}, cache['entries'])]),
+        ('vtmu_store_hits_total', 'counter', 'Downloads served from the download store',
+         [({}, store['hits'])]),
+        ('vtmu_store_misses_total', 'counter', 'Downloads that had to be fetched', [({}, store['misses'])]),
+        ('vtmu_store_coalesced_total', 'counter', 'Downloads that waited for an identical in-flight download',
+         [({}, store['coalesced'])]),
+        ('vtmu_store_bytes', 'gauge', 'Bytes in the download store', [({}, store['total_bytes'])]),
+        ('vtmu_rate_limit_allowed_total', 'counter', 'Requests allowed by the rate limiter',
+         [({'endpoint': e}, limiter['allowed'].get(e, 0)) for e in endpoints]),
+        ('vtmu_rate_limit_rejections_total', 'counter', 'Requests rejected by the rate limiter (429 or global 503)',
+         [({'endpoint': e}, limiter['denied'].get(e, 0)) for e in endpoints]),
+        ('vtmu_rate_limit_blocks_total', 'counter', 'Clients blocked for BLOCK_DURATION', [({}, limiter['blocks'])]),
+        ('vtmu_rate_limit_state_errors_total', 'counter', 'Rate limit backend errors (failed open)',
+         [({}, limiter['state_errors'])]),
+        # Antrian download dan ffmpeg termasuk tahap admission
+        ('vtmu_queue_depth', 'gauge', 'Work waiting for a slot, per queue', [
+            ({'queue': 'log'}, log_stats['queue_depth']),
+        ] + [({'queue': name}, stage['waiting']) for name, stage in stages.items()]),
+        ('vtmu_queue_active', 'gauge', 'Work holding a slot, per queue',
+         [({'queue': name}, stage['active']) for name, stage in stages.items()]),
+        ('vtmu_admission_rejections_total', 'counter', 'Stage slot requests rejected (queue full or wait timed out)',
+         [({'stage': name}, stage['rejected'] + stage['timeouts']) for name, stage in stages.items()]),
+        ('vtmu_log_dropped_total', 'counter', 'Log records dropped because the log queue was full',
+         [({}, sum(log_stats['dropped'].values()))]),
+    ]
+
+metrics.REGISTRY.add_collector(collect_component_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics dalam format teks Prometheus"""
+    return Response(metrics.REGISTRY.expose(), content_type=metrics.CONTENT_TYPE)
+
+
+# ============================================
+# REQUEST TRACING & PROFILING
+# ============================================
+
+# Endpoint yang tidak ditrace/diprofile: file statis, scrape dan endpoint tracing/profiling sendiri
+UNTRACED_ENDPOINTS = {
+    'static', 'prometheus_metrics', 'list_traces', 'get_trace',
+    'profile_status', 'start_profile', 'stop_profile', 'profile_result',
+}
+
+request_profiler = profiler.Profiler()
+
+@app.before_request
+def start_request_trace():
+    if request.endpoint in UNTRACED_ENDPOINTS:
+        return
+    rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.trace = tracing.begin(
+        f'{request.method} {rule}',
+        force=request.headers.get(tracing.TRACE_HEADER) == '1',
+        ip=get_client_ip(),
+        path=request.path
+    )
+    g.profile = request_profiler.request_started(request.path)
+
+@app.after_request
+def add_trace_header(response):
+    span, _ = g.get('trace', (None, None))
+    if span is not None:
+        span.set(status=response.status_code)
+        response.headers['X-Trace-Id'] = span.trace.trace_id
+    return response
+
+@app.teardown_request
+def end_request_trace(error=None):
+    # Response streaming: dijalankan setelah body selesai dikirim
+    profiled = g.pop('profile', None)
+    if profiled is not None:
+        session, profile = profiled
+        session.add(profile)
+    span, token = g.pop('trace', (None, None))
+    tracing.end(span, token, error)
+
+def traces_api_disabled():
+    # Trace berisi IP, URL dan pesan yt-dlp: sama seperti /api/profile harus diizinkan dulu
+    return jsonify({'error': 'API trace tidak aktif. Set TRACES_API=1 untuk mengaktifkan.'}), 403
+
+@app.route('/api/traces')
+def list_traces():
+    """Trace yang disimpan (terbaru dulu): dipaksa dengan X-Trace: 1, sampel, atau lambat"""
+    if not tracing.TRACES_API_ENABLED:
+        return traces_api_disabled()
+    return jsonify({
+        'traces': tracing.recorder.recent(),
+        'stats': tracing.recorder.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/traces/<trace_id>')
+def get_trace(trace_id):
+    """Download satu trace: format=chrome (chrome://tracing, Perfetto) atau otlp (OTLP/JSON)"""
+    if not tracing.TRACES_API_ENABLED:
+        return traces_api_disabled()
+    trace = tracing.recorder.get(trace_id)
+    if trace is None:
+        return jsonify({'error': 'Trace tidak ditemukan'}), 404
+    format = request.args.get('format', 'chrome')
+    if format == 'chrome':
+        data = tracing.chrome_trace(trace)
+    elif format == 'otlp':
+        data = tracing.otlp_payload(list(trace.spans))
+    else:
+        return jsonify({'error': "format harus 'chrome' atau 'otlp'"}), 400
+    response = jsonify(data)
+    response.headers['Content-Disposition'] = f'attachment; filename=trace-{trace_id}.{format}.json'
+    return response
+
+@app.route('/api/profile', methods=['GET'])
+def profile_status():
+    """Status sesi profiling terakhir"""
+    return jsonify({
+        'enabled': profiler.PROFILER_ENABLED,
+        'session': request_profiler.status(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/profile', methods=['POST'])
+def start_profile():
+    """Mulai profiling: mode=sampling (stack semua thread selama N detik) atau cprofile (N request berikutnya)"""
+    if not profiler.PROFILER_ENABLED:
+        return jsonify({'error': 'Profiler tidak aktif. Set PROFILER=1 untuk mengaktifkan.'}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        try:
+            seconds = float(data.get('seconds', 10))
+            interval = float(data.get('interval', profiler.SAMPLE_INTERVAL))
+            requests = int(data.get('requests', 10))
+        except (TypeError, ValueError):
+            raise ValueError('seconds, interval dan requests harus berupa angka')
+        session = request_profiler.start(
+            data.get('mode', profiler.SAMPLING),
+            seconds=seconds,
+            interval=interval,
+            requests=requests,
+            endpoint=data.get('endpoint')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except profiler.ProfilerBusy as e:
+        return jsonify({'error': str(e), 'session': request_profiler.status()}), 409
+    logger.info("Profiling started: %s", session.status())
+    return jsonify({
+        'success': True,
+        'session': session.status(),
+        'result_url': '/api/profile/result'
+    }), 202
+
+@app.route('/api/profile/stop', methods=['POST'])
+def stop_profile():
+    """Hentikan sesi profiling yang sedang berjalan (hasil sejauh ini tetap bisa didownload)"""
+    session = request_profiler.stop()
+    if session is None:
+        return jsonify({'error': 'Tidak ada sesi profiling'}), 404
+    return jsonify({'success': True, 'session': session.status()})
+
+@app.route('/api/profile/result')
+def profile_result():
+    """Download hasil profiling: collapsed (sampling), text atau prof (cprofile)"""
+    session = request_profiler.session
+    if session is None:
+        return jsonify({'error': 'Belum ada sesi profiling'}), 404
+    try:
+        result = session.result(request.args['format']) if 'format' in request.args else session.result()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if result is None:
+        return jsonify({'error': 'Belum ada request yang diprofile'}), 404
+    data, mimetype, filename = result
+    return Response(data, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
 @app.route('/api/update-ytdlp', methods=['POST'])
 def update_ytdlp():
     """Update yt-dlp ke versi terbaru (untuk maintenance)"""
@@ -706,9 +1744,22 @@ def cleanup_downloads():
         files = os.listdir(DOWNLOAD_FOLDER)
         deleted_count = 0
         total_size_freed = 0
+        skipped_in_use = 0
+
+        # File di store dihapus lewat store supaya file yang sedang ditransfer aman
+        evicted = download_store.evict([entry.key for entry in download_store.entries()])
+        deleted_count += len(evicted)
+        total_size_freed += sum(entry.size for entry in evicted)
 
+        in_flight = download_store.in_flight_prefixes()
         for filename in files:
             file_path = os.path.join(DOWNLOAD_FOLDER, filename)
+            if filename == os.path.basename(download_store.index_path):
+                continue
+            # Masih di store berarti sedang dipakai; prefix in-flight berarti sedang didownload
+            if download_store.by_filename(filename) is not None or filename[:16] in in_flight:
+                skipped_in_use += 1
+                continue
             if os.path.isfile(file_path):
                 file_size = os.path.getsize(file_path)
                 os.remove(file_path)
@@ -721,6 +1772,7 @@ def cleanup_downloads():
             'success': True,
             'message': 'Cleanup successful',
             'files_deleted': deleted_count,
+            'files_in_use': skipped_in_use,
             'space_freed_mb': round(total_size_freed / (1024 * 1024), 2),
             'timestamp': datetime.now().isoformat()
         })
@@ -733,27 +1785,50 @@ def cleanup_downloads():
             'timestamp': datetime.now().isoformat()
         }), 500
 
-@app.route('/api/logs')
-def get_logs():
-    """Get recent application logs"""
+LOGS_MAX_LIMIT = 1000
+
+def parse_log_time(value):
+    """Epoch seconds or ISO 8601 (local time) from a query parameter, or None"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
     try:
-        log_file = 'app.log'
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f'Waktu tidak valid: {value}')
 
-        if not os.path.exists(log_file):
-            return jsonify({
-                'logs': [],
-                'message': 'No logs available'
-            })
+@app.route('/api/logs')
+def get_logs():
+    """Get recent application logs
 
-        # Read last 100 lines
-        with open(log_file, 'r') as f:
-            lines = f.readlines()
-            recent_logs = lines[-100:]  # Last 100 lines
+    Query: limit, level (minimum), ip, endpoint (prefix), since/until
+    (epoch or ISO 8601) and cursor (next_cursor of the previous page).
+    The log is read backwards from the end, never loaded as a whole.
+    """
+    try:
+        try:
+            limit = request.args.get('limit', 100)
+            if not str(limit).isdigit():
+                raise ValueError('limit harus berupa angka')
+            limit = min(max(int(limit), 1), LOGS_MAX_LIMIT)
+            query = applog.LogQuery(
+                level=request.args.get('level'),
+                ip=request.args.get('ip'),
+                endpoint=request.args.get('endpoint'),
+                since=parse_log_time(request.args.get('since')),
+                until=parse_log_time(request.args.get('until')),
+            )
+            logs, next_cursor = applog.read_logs(query, limit=limit, cursor=request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         return jsonify({
-            'logs': recent_logs,
-            'total_lines': len(lines),
-            'showing': len(recent_logs),
+            'logs': logs,
+            'showing': len(logs),
+            'next_cursor': next_cursor,
             'timestamp': datetime.now().isoformat()
         })
 
@@ -1005,4 +2080,5 @@ def update_theme():
         }), 500
 
 if __name__ == '__main__':
+    start_background_workers()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,591 @@
+import atexit
+import bisect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime
+
+# ============================================
+# STRUCTURED LOG FILE (JSON LINES)
+# ============================================
+
+LOG_FILE = os.environ.get('LOG_FILE', 'app.log')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 64 * 1024 * 1024))  # rotasi per ukuran
+LOG_ROTATE_INTERVAL = int(os.environ.get('LOG_ROTATE_INTERVAL', 86400))  # rotasi per waktu, 0 = mati
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 10))
+LOG_INDEX_INTERVAL = 1024 * 1024  # satu entry index (offset, waktu) per MiB log
+LOG_SCAN_BYTES = int(os.environ.get('LOG_SCAN_BYTES', 64 * 1024 * 1024))  # maksimum dibaca per request /api/logs
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # record yang menunggu ditulis; penuh = dibuang
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 500))
+LOG_SAMPLE_BURST = int(os.environ.get('LOG_SAMPLE_BURST', 20))  # WARNING sama per window, 0 = tanpa sampling
+LOG_SAMPLE_WINDOW = float(os.environ.get('LOG_SAMPLE_WINDOW', 60))
+SAMPLE_MAX_KEYS = 1000
+
+READ_BLOCK = 64 * 1024
+INDEX_ENTRY = struct.Struct('<Qd')
+# Baris ditulis berurutan tapi waktunya diambil sebelum lock handler: bisa sedikit tidak urut
+CLOCK_SLACK = 1.0
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+
+def index_path(path):
+    return f'{path}.idx'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, time, level, logger, msg (+ ip, endpoint, suppressed, exc)"""
+
+    def format(self, record):
+        data = {
+            'ts': round(record.created, 6),
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in ('ip', 'endpoint', 'suppressed'):
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds ip/endpoint of the current request to records that do not set them
+
+    `context()` returns a dict of those fields, or None outside a request.
+    """
+
+    def __init__(self, context):
+        super().__init__()
+        self.context = context
+
+    def filter(self, record):
+        if not hasattr(record, 'ip'):
+            try:
+                context = self.context()
+            except Exception:
+                context = None
+            for field, value in (context or {}).items():
+                setattr(record, field, value)
+        return True
+
+
+class JsonFileHandler(logging.handlers.RotatingFileHandler):
+    """JSON-lines log file rotated by size and age, with a sparse offset index
+
+    Every LOG_INDEX_INTERVAL bytes the (offset, time) of the next record is
+    appended to `<file>.idx`, so readers can jump to a time range without
+    scanning. Backups are renamed together with their index
+    (app.log.1 + app.log.1.idx, ...). A batch of records costs one write
+    and one flush; offsets are taken from the file after the write, so
+    lines appended by other processes do not shift the index.
+
+    Rotation is single-writer: with several worker processes appending to
+    one file they can rotate it more than once. A handler that finds its
+    file rotated by someone else reopens it, but give each process its own
+    LOG_FILE (or rotate externally) when running several workers.
+    """
+
+    def __init__(self, filename=LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 rotate_interval=LOG_ROTATE_INTERVAL):
+        self._offset = 0
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.setFormatter(JsonFormatter())
+        self.rotate_interval = rotate_interval
+        self._rotate_at = None
+        self._last_indexed = None
+        self._schedule_rotation()
+
+    def _open(self):
+        stream = super()._open()
+        self._offset = os.fstat(stream.fileno()).st_size
+        return stream
+
+    def _schedule_rotation(self):
+        if self.rotate_interval > 0:
+            self._rotate_at = time.time() + self.rotate_interval
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        if self._rotate_at is not None and record.created >= self._rotate_at:
+            # File kosong tidak perlu dirotasi, cukup jadwalkan ulang
+            if self._offset > 0:
+                return True
+            self._schedule_rotation()
+        return self.maxBytes > 0 and self._offset >= self.maxBytes
+
+    def doRollover(self):
+        # Index ikut digeser sebelum file log-nya, dengan nama yang sama + .idx
+        base = self.baseFilename
+        if self.backupCount > 0:
+            for i in range(self.backupCount - 1, 0, -1):
+                src, dst = index_path(f'{base}.{i}'), index_path(f'{base}.{i + 1}')
+                if os.path.exists(src):
+                    os.replace(src, dst)
+            if os.path.exists(index_path(base)):
+                os.replace(index_path(base), index_path(f'{base}.1'))
+        elif os.path.exists(index_path(base)):
+            os.remove(index_path(base))
+        super().doRollover()
+        self._last_indexed = None
+        self._schedule_rotation()
+
+    def emit(self, record):
+        self.emit_batch([record])
+
+    def emit_batch(self, records):
+        """Write records with one write/flush per file; called with the handler lock held"""
+        self._reopen_if_rotated()
+        lines = []
+        for record in records:
+            try:
+                if self.shouldRollover(record):
+                    self._write(lines)
+                    lines = []
+                    self.doRollover()
+                line = self.format(record) + self.terminator
+                size = len(line) if line.isascii() else len(line.encode('utf-8'))
+                lines.append((record.created, line, size))
+                # Perkiraan untuk shouldRollover; diganti ukuran file asli setelah write
+                self._offset += size
+            except Exception:
+                self.handleError(record)
+        try:
+            self._write(lines)
+        except Exception:
+            self.handleError(records[-1])
+
+    def _reopen_if_rotated(self):
+        """Reopen the file if another process renamed or removed it"""
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename)
+            opened = os.fstat(self.stream.fileno())
+            if (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino):
+                return
+        except OSError:
+            pass
+        self.stream.close()
+        self.stream = self._open()
+        self._last_indexed = None
+
+    def _write(self, lines):
+        if not lines:
+            return
+        self.stream.write(''.join(line for _, line, _ in lines))
+        self.stream.flush()
+        # File dibuka O_APPEND: posisi fd = akhir tulisan ini, walau proses lain ikut menulis
+        fd = self.stream.fileno()
+        offset = os.lseek(fd, 0, os.SEEK_CUR) - sum(size for _, _, size in lines)
+        for created, _, size in lines:
+            self._index(offset, created)
+            offset += size
+        self._offset = os.fstat(fd).st_size
+
+    def _index(self, offset, created):
+        if self._last_indexed is None:
+            self._last_indexed = offset - LOG_INDEX_INTERVAL if offset == 0 else offset
+        if offset - self._last_indexed < LOG_INDEX_INTERVAL:
+            return
+        with open(index_path(self.baseFilename), 'ab') as f:
+            f.write(INDEX_ENTRY.pack(offset, created))
+        self._last_indexed = offset
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """StreamHandler that writes a batch of records with a single write/flush"""
+
+    def emit_batch(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if lines:
+            try:
+                self.stream.write(''.join(lines))
+                self.flush()
+            except Exception:
+                self.handleError(records[-1])
+
+
+# ============================================
+# ASYNC PIPELINE (request threads never write)
+# ============================================
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    """Puts records on a bounded queue for BatchListener; never blocks the caller
+
+    Records are queued unformatted (the message is built in the listener
+    thread), so call sites should log with %-style arguments. Repeated
+    WARNING records with the same message template are sampled: after
+    `sample_burst` in `sample_window` seconds the rest are counted, not
+    queued. A full queue drops the record and counts it.
+    """
+
+    def __init__(self, queue_size=LOG_QUEUE_SIZE, sample_burst=LOG_SAMPLE_BURST,
+                 sample_window=LOG_SAMPLE_WINDOW):
+        super().__init__(queue.Queue(queue_size))
+        self.sample_burst = sample_burst
+        self.sample_window = sample_window
+        self._samples = {}
+        self.queued = 0
+        self.dropped = {}
+        self.sampled_out = 0
+
+    def prepare(self, record):
+        # Tidak diformat di sini (beda dengan QueueHandler bawaan): listener yang memformat
+        return record
+
+    def emit(self, record):
+        # Dipanggil dengan lock handler terkunci (Handler.handle)
+        if self.sample_burst > 0 and logging.WARNING <= record.levelno < logging.ERROR:
+            if not self._sample(record):
+                self.sampled_out += 1
+                return
+        try:
+            self.queue.put_nowait(record)
+            self.queued += 1
+        except queue.Full:
+            self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+
+    def _sample(self, record):
+        # Template %-style (bukan pesan jadi) sebagai key: "IP: %s" untuk semua IP
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        now = record.created
+        state = self._samples.get(key)
+        if state is None or now - state[0] >= self.sample_window:
+            if state is not None and state[2]:
+                # Record pertama di window baru membawa jumlah yang disembunyikan
+                record.suppressed = state[2]
+            if state is None and len(self._samples) >= SAMPLE_MAX_KEYS:
+                self._samples.clear()
+            self._samples[key] = [now, 1, 0]
+            return True
+        if state[1] < self.sample_burst:
+            state[1] += 1
+            return True
+        state[2] += 1
+        return False
+
+    def dropped_total(self):
+        return sum(self.dropped.values())
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queue_size': self.queue.maxsize,
+                'queue_depth': self.queue.qsize(),
+                'queued': self.queued,
+                'dropped': dict(self.dropped),
+                'sampled_out': self.sampled_out,
+            }
+
+
+_STOP = object()
+
+
+class BatchListener:
+    """Thread that drains an AsyncHandler queue into the real handlers in batches"""
+
+    def __init__(self, source, handlers, batch_size=LOG_BATCH_SIZE):
+        self.source = source
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.written = 0
+        self.batches = 0
+        self.max_batch = 0
+        self._reported_drops = 0
+        self._thread = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=self._before_fork, after_in_child=self._after_fork_in_child)
+
+    def running(self):
+        # Setelah fork, thread milik proses induk tidak lagi alive di proses anak
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the writer thread of this process; no-op if it already runs here"""
+        if self.running():
+            return
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Write what is still queued, then stop the thread"""
+        if not self.running():
+            self._drain()
+            return
+        try:
+            self.source.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        q = self.source.queue
+        while True:
+            batch = [q.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(record is _STOP for record in batch)
+            self._write([record for record in batch if record is not _STOP])
+            if stop:
+                return
+
+    def _drain(self):
+        # Tanpa thread writer (mis. master gunicorn --preload): tulis langsung di thread ini
+        records = []
+        while True:
+            try:
+                records.append(self.source.queue.get_nowait())
+            except queue.Empty:
+                break
+        self._write([record for record in records if record is not _STOP])
+
+    def _before_fork(self):
+        if not self.running():
+            self._drain()
+
+    def _after_fork_in_child(self):
+        # Antrian baru: lock antrian lama bisa saja sedang dipegang writer milik induk,
+        # dan record yang masih di dalamnya ditulis oleh induk
+        self.source.queue = queue.Queue(self.source.queue.maxsize)
+        self._thread = None
+
+    def _write(self, records):
+        dropped = self.source.dropped_total()
+        if dropped > self._reported_drops:
+            notice = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                       'Antrian log penuh: %d record dibuang',
+                                       (dropped - self._reported_drops,), None)
+            records.insert(0, notice)
+            self._reported_drops = dropped
+        if not records:
+            return
+        for handler in self.handlers:
+            accepted = [r for r in records if r.levelno >= handler.level and handler.filter(r)]
+            if not accepted:
+                continue
+            handler.acquire()
+            try:
+                emit_batch = getattr(handler, 'emit_batch', None)
+                if emit_batch is not None:
+                    emit_batch(accepted)
+                else:
+                    for record in accepted:
+                        handler.emit(record)
+            finally:
+                handler.release()
+        self.written += len(records)
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(records))
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'batches': self.batches,
+            'max_batch': self.max_batch,
+            'alive': self._thread is not None and self._thread.is_alive(),
+        }
+
+
+def install(handlers, level=logging.INFO, context=None):
+    """Route the root logger through an AsyncHandler + BatchListener
+
+    `context` is a RequestContextFilter callable; it runs in the calling
+    thread, before the record is queued, while the request is still there.
+    The writer thread is not started here: call listener.start() in each
+    process that serves requests (after the fork under gunicorn --preload).
+    Returns the listener (for stats; it is stopped at exit).
+    """
+    source = AsyncHandler()
+    if context is not None:
+        source.addFilter(RequestContextFilter(context))
+    listener = BatchListener(source, handlers)
+    root = logging.getLogger()
+    root.handlers = [source]
+    root.setLevel(level)
+    atexit.register(listener.stop)
+    return listener
+
+
+# ============================================
+# READING (newest first, cursor pagination)
+# ============================================
+
+class LogQuery:
+    """Filters for read_logs; level is a minimum (WARNING includes ERROR)"""
+
+    def __init__(self, level=None, ip=None, endpoint=None, since=None, until=None):
+        self.level = logging.getLevelName(level.upper()) if level else None
+        if level and not isinstance(self.level, int):
+            raise ValueError(f'level harus salah satu dari {", ".join(LEVELS)}')
+        self.ip = ip
+        self.endpoint = endpoint
+        self.since = since
+        self.until = until
+
+    @property
+    def filtered(self):
+        return any(value is not None for value in (self.level, self.ip, self.endpoint, self.since, self.until))
+
+    def matches(self, entry):
+        if self.level is not None and logging.getLevelName(entry.get('level')) < self.level:
+            return False
+        if self.ip is not None and entry.get('ip') != self.ip:
+            return False
+        if self.endpoint is not None and not (entry.get('endpoint') or '').startswith(self.endpoint):
+            return False
+        ts = entry.get('ts')
+        if self.since is not None and ts < self.since:
+            return False
+        if self.until is not None and ts > self.until:
+            return False
+        return True
+
+
+def log_files(path=LOG_FILE, backup_count=LOG_BACKUP_COUNT):
+    """Existing log files, newest first"""
+    paths = [path] + [f'{path}.{i}' for i in range(1, backup_count + 1)]
+    return [p for p in paths if os.path.exists(p)]
+
+
+def read_index(path):
+    """[(offset, ts)] of a log file's index, or [] if it has none"""
+    try:
+        with open(index_path(path), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+
+def _end_before(path, size, until):
+    """Offset after which every record is newer than `until` (index lookup)"""
+    entries = read_index(path)
+    if until is None or not entries:
+        return size
+    times = [ts for _, ts in entries]
+    i = bisect.bisect_right(times, until + CLOCK_SLACK)
+    if i == len(entries):
+        return size
+    return min(entries[i][0], size)
+
+
+def reverse_lines(f, end):
+    """Yield (offset, line) of complete lines before `end`, last line first"""
+    pos = end
+    tail = b''
+    complete = False
+    while pos > 0:
+        size = min(READ_BLOCK, pos)
+        pos -= size
+        f.seek(pos)
+        chunk = f.read(size) + tail
+        if not complete:
+            # Baris terakhir mungkin masih ditulis: abaikan sampai ada newline,
+            # walaupun baris itu lebih panjang dari satu blok
+            cut = chunk.rfind(b'\n')
+            if cut == -1:
+                continue
+            complete = True
+            chunk = chunk[:cut + 1]
+        stop = len(chunk)
+        while True:
+            newline = chunk.rfind(b'\n', 0, stop - 1)
+            if newline == -1:
+                break
+            yield pos + newline + 1, chunk[newline + 1:stop]
+            stop = newline + 1
+        tail = chunk[:stop]
+    if tail:
+        yield 0, tail
+
+
+def parse_line(line):
+    """JSON record of a log line; older plain-text lines come back as {'raw': ...}"""
+    text = line.decode('utf-8', errors='replace').rstrip('\n')
+    if text.startswith('{'):
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    return {'raw': text}
+
+
+def make_cursor(path, offset):
+    # Inode tetap sama saat file dirotasi (rename), jadi cursor tetap valid
+    return f'{os.stat(path).st_ino}-{offset}'
+
+
+def parse_cursor(cursor):
+    inode, _, offset = cursor.partition('-')
+    try:
+        return int(inode), int(offset)
+    except ValueError:
+        raise ValueError('cursor tidak valid')
+
+
+def read_logs(query=None, limit=100, cursor=None, path=LOG_FILE, backup_count=LOG_BACKUP_COUNT,
+              scan_bytes=LOG_SCAN_BYTES):
+    """Newest matching records before `cursor`; return (entries, next_cursor)
+
+    Files are read backwards in blocks, so the cost depends on how far back
+    the page is, not on the size of the log. At most `scan_bytes` are read
+    per call; the returned cursor resumes where the scan stopped and is None
+    when there is nothing older. Entries come back oldest first.
+    """
+    query = query or LogQuery()
+    files = log_files(path, backup_count)
+    start_offset = None
+    if cursor:
+        inode, start_offset = parse_cursor(cursor)
+        inodes = [os.stat(p).st_ino for p in files]
+        # File cursor sudah terhapus oleh rotasi: tidak ada yang lebih lama lagi
+        files = files[inodes.index(inode):] if inode in inodes else []
+
+    entries = []
+    scanned = 0
+    for i, log_path in enumerate(files):
+        with open(log_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if i == 0 and start_offset is not None:
+                end = min(start_offset, size)
+            else:
+                end = _end_before(log_path, size, query.until)
+            offset = end
+            for offset, line in reverse_lines(f, end):
+                scanned += len(line)
+                entry = parse_line(line)
+                if 'raw' in entry:
+                    if not query.filtered:
+                        entries.append(entry)
+                else:
+                    if query.since is not None and entry.get('ts', 0) < query.since - CLOCK_SLACK:
+                        return entries[::-1], None
+                    if query.matches(entry):
+                        entries.append(entry)
+                if len(entries) >= limit or scanned >= scan_bytes:
+                    more = offset > 0 or i + 1 < len(files)
+                    cursor = make_cursor(log_path, offset) if offset > 0 else (
+                        make_cursor(files[i + 1], os.path.getsize(files[i + 1])) if more else None)
+                    return entries[::-1], cursor
+    return entries[::-1], None
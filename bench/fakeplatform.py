@@ -0,0 +1,225 @@
+"""Local stand-in for a video platform, for benchmarks
+
+Serves synthetic media that yt-dlp's generic extractor understands:
+
+    /media/<id>.mp4          direct MP4 link (Range requests supported)
+    /hls/<id>.m3u8           HLS playlist, 1-second MPEG-TS fragments
+    /watch/<id>              HTML page with og:/JSON-LD metadata -> /media/<id>.mp4
+
+Every <id> is a different "video" for yt-dlp and the download store, but
+all of them share the same bytes, so the server costs almost nothing.
+Media is rendered once with ffmpeg into --media-dir.
+
+    python bench/fakeplatform.py --port 8765 --latency 0.05 --rate 5000000
+"""
+import argparse
+import html
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK_SIZE = 64 * 1024
+
+
+def render_media(media_dir, seconds, size, ffmpeg):
+    """Render clip.mp4 and its HLS fragments once; return (mp4 path, [(duration, ts path)])"""
+    os.makedirs(media_dir, exist_ok=True)
+    mp4 = os.path.join(media_dir, f'clip-{seconds}s-{size}.mp4')
+    playlist = os.path.join(media_dir, f'clip-{seconds}s-{size}.m3u8')
+    if not os.path.exists(mp4):
+        # GOP 1 detik supaya HLS bisa dipotong per detik
+        subprocess.run([
+            ffmpeg, '-loglevel', 'error', '-y',
+            '-f', 'lavfi', '-i', f'testsrc=size={size}:rate=25',
+            '-f', 'lavfi', '-i', 'sine=frequency=440',
+            '-t', str(seconds), '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '25',
+            '-c:a', 'aac', '-shortest', '-movflags', '+faststart', mp4 + '.tmp.mp4',
+        ], check=True)
+        os.replace(mp4 + '.tmp.mp4', mp4)
+    if not os.path.exists(playlist):
+        subprocess.run([
+            ffmpeg, '-loglevel', 'error', '-y', '-i', mp4, '-c', 'copy', '-f', 'hls',
+            '-hls_time', '1', '-hls_list_size', '0',
+            '-hls_segment_filename', os.path.join(media_dir, f'clip-{seconds}s-{size}-%03d.ts'),
+            playlist,
+        ], check=True)
+    segments = []
+    duration = None
+    with open(playlist) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                duration = float(line[8:].rstrip(','))
+            elif line and not line.startswith('#'):
+                segments.append((duration, os.path.join(media_dir, line)))
+    return mp4, segments
+
+
+class FakePlatform(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, mp4, segments, latency=0.0, rate=0):
+        super().__init__(address, Handler)
+        self.mp4 = mp4
+        self.segments = segments
+        self.latency = latency
+        self.rate = rate
+        self.duration = round(sum(d for d, _ in segments))
+        self._cache = {}
+
+    def read(self, path):
+        data = self._cache.get(path)
+        if data is None:
+            with open(path, 'rb') as f:
+                data = self._cache[path] = f.read()
+        return data
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakePlatform/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path = self.path.split('?', 1)[0]
+        match = re.fullmatch(r'/media/([\w-]+)\.mp4', path)
+        if match:
+            return self.send_media(self.server.read(self.server.mp4), 'video/mp4', head)
+        match = re.fullmatch(r'/hls/([\w-]+)\.m3u8', path)
+        if match:
+            return self.send_playlist(match.group(1), head)
+        match = re.fullmatch(r'/hls/([\w-]+)/(\d+)\.ts', path)
+        if match and int(match.group(2)) < len(self.server.segments):
+            data = self.server.read(self.server.segments[int(match.group(2))][1])
+            return self.send_media(data, 'video/mp2t', head)
+        match = re.fullmatch(r'/watch/([\w-]+)', path)
+        if match:
+            return self.send_page(match.group(1), head)
+        self.send_body(b'not found', 'text/plain', head, status=404)
+
+    def send_playlist(self, video_id, head):
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:2', '#EXT-X-MEDIA-SEQUENCE:0']
+        for index, (duration, _) in enumerate(self.server.segments):
+            lines += [f'#EXTINF:{duration:.3f},', f'/hls/{video_id}/{index}.ts']
+        lines.append('#EXT-X-ENDLIST')
+        self.send_body(('\n'.join(lines) + '\n').encode(), 'application/vnd.apple.mpegurl', head)
+
+    def send_page(self, video_id, head):
+        host = self.headers.get('Host', '127.0.0.1')
+        video_url = f'http://{host}/media/{video_id}.mp4'
+        metadata = {
+            '@context': 'https://schema.org',
+            '@type': 'VideoObject',
+            'name': f'Benchmark video {video_id}',
+            'description': 'Synthetic test video',
+            'contentUrl': video_url,
+            'thumbnailUrl': f'http://{host}/thumb/{video_id}.jpg',
+            'uploadDate': '2025-01-01',
+            'duration': f'PT{self.server.duration}S',
+            'author': {'@type': 'Person', 'name': 'bench'},
+        }
+        title = html.escape(metadata['name'])
+        page = f"""<!DOCTYPE html>
+<html><head>
+<title>{title}</title>
+<meta property="og:title" content="{title}">
+<meta property="og:type" content="video.other">
+<meta property="og:video" content="{video_url}">
+<meta property="og:video:type" content="video/mp4">
+<script type="application/ld+json">{json.dumps(metadata)}</script>
+</head><body><h1>{title}</h1></body></html>
+"""
+        self.send_body(page.encode(), 'text/html; charset=utf-8', head)
+
+    def send_media(self, data, content_type, head):
+        start, end = 0, len(data) - 1
+        status = 200
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            else:
+                start = max(0, len(data) - int(match.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+        if not head:
+            self.write_throttled(memoryview(data)[start:end + 1])
+
+    def send_body(self, body, content_type, head, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def write_throttled(self, data):
+        """Write data, at most --rate bytes/second per response when set"""
+        rate = self.server.rate
+        started = time.monotonic()
+        sent = 0
+        try:
+            for offset in range(0, len(data), CHUNK_SIZE):
+                chunk = data[offset:offset + CHUNK_SIZE]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if rate:
+                    ahead = sent / rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--media-dir', default=os.path.join(tempfile.gettempdir(), 'vtmu-bench-media'))
+    parser.add_argument('--seconds', type=int, default=5, help='length of the synthetic video')
+    parser.add_argument('--size', default='640x360', help='video resolution (WxH)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--rate', type=int, default=0, help='bytes/second per media response, 0 = unlimited')
+    parser.add_argument('--ffmpeg', default=os.environ.get('FFMPEG_BIN') or shutil.which('ffmpeg'))
+    args = parser.parse_args(argv)
+
+    if not args.ffmpeg:
+        sys.exit('ffmpeg tidak ditemukan (dibutuhkan untuk membuat media benchmark); set FFMPEG_BIN')
+    mp4, segments = render_media(args.media_dir, args.seconds, args.size, args.ffmpeg)
+    server = FakePlatform((args.host, args.port), mp4, segments, args.latency, args.rate)
+    print(f'Fake platform on http://{args.host}:{server.server_address[1]} '
+          f'({os.path.getsize(mp4)} byte MP4, {len(segments)} HLS fragments)', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,594 @@
+"""Load test for app.py against a local fake video platform
+
+Starts bench/fakeplatform.py and bench/server.py (or drives --target),
+runs each scenario at each concurrency level and writes a JSON report
+with throughput, p50/p95/p99 latency and the server process' CPU, RSS and
+disk I/O. With --baseline the run is compared against an earlier report
+and the exit status is 1 when a metric got worse by more than --threshold.
+
+    python bench/loadtest.py --concurrency 1,8,32 --duration 20 --output bench/baseline.json
+    python bench/loadtest.py --concurrency 1,8,32 --duration 20 --baseline bench/baseline.json
+
+Scenarios:
+    info            POST /api/get-info, a new video every request (extraction)
+    info-cached     POST /api/get-info, always the same video (info cache)
+    download        POST /api/download with "wait": true, a new video every request
+    download-cached POST /api/download, always the same video (download store)
+    serve           GET /download/<file> of one finished download, whole body
+"""
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+SCENARIOS = ('info', 'info-cached', 'download', 'download-cached', 'serve')
+SOURCES = {
+    'direct': '/media/{id}.mp4',
+    'hls': '/hls/{id}.m3u8',
+    'page': '/watch/{id}',
+}
+
+# Batas rate limit diangkat untuk server yang dijalankan benchmark: yang diukur kapasitas, bukan limiter
+SERVER_ENV = {
+    'RATE_LIMIT_INFO': '1000000/60',
+    'RATE_LIMIT_DOWNLOAD': '1000000/60',
+    'RATE_LIMIT_FILE': '1000000/60',
+    'RATE_LIMIT_GLOBAL_INFO': '1000000/60',
+    'RATE_LIMIT_GLOBAL_DOWNLOAD': '1000000/60',
+}
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+REQUEST_TIMEOUT = 300
+STARTUP_TIMEOUT = 120
+READ_CHUNK = 256 * 1024
+SAMPLE_INTERVAL = 0.25  # detik antar sampel RSS server
+
+# Metric yang dibandingkan dengan baseline: (path, arah baik) - +1 = lebih besar lebih baik
+COMPARED_METRICS = (
+    ('throughput', 1),
+    ('latency_ms.p50', -1),
+    ('latency_ms.p95', -1),
+    ('latency_ms.p99', -1),
+    ('server.cpu_ms_per_request', -1),
+    ('server.rss_max_mb', -1),
+)
+
+
+# ============================================
+# HTTP CLIENT
+# ============================================
+
+class Client:
+    """One keep-alive connection per load worker"""
+
+    def __init__(self, target, ip):
+        parts = urlsplit(target)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.headers = dict(HEADERS, **{'X-Forwarded-For': ip})
+        self.conn = None
+
+    def request(self, method, path, payload=None, keep_body=True):
+        """Return (status, body or None, bytes read)"""
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = dict(self.headers, **{'Content-Type': 'application/json'}) if body else self.headers
+        reused = self.conn is not None
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            if keep_body:
+                data = response.read()
+                size = len(data)
+            else:
+                data, size = None, 0
+                while True:
+                    chunk = response.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+        except (http.client.HTTPException, OSError):
+            self.close()
+            if reused:
+                # Koneksi keep-alive ditutup server saat idle: ulangi sekali di koneksi baru
+                return self.request(method, path, payload, keep_body)
+            raise
+        if response.will_close:
+            self.close()
+        return response.status, data, size
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def json_body(data):
+    try:
+        return json.loads(data) if data else {}
+    except ValueError:
+        return {}
+
+
+# ============================================
+# SCENARIOS
+# ============================================
+
+class Scenario:
+    """Builds the request of one scenario; run(client) returns (ok, status, bytes)"""
+
+    def __init__(self, name, source_url, run_id):
+        self.name = name
+        self.source_url = source_url
+        self.run_id = run_id
+        self._ids = itertools.count()
+        self.fixed_url = self.video_url()
+        self.filename = None
+
+    def video_url(self):
+        # run_id membuat video unik per run, jadi cache/store server tidak membantu run berikutnya
+        return self.source_url.format(id=f'{self.run_id}-{next(self._ids)}')
+
+    def prepare(self, client):
+        """Warm what the cached/serve scenarios rely on; raise if the server cannot do it"""
+        if self.name == 'info-cached':
+            self.check(client.request('POST', '/api/get-info', {'url': self.fixed_url}))
+        elif self.name == 'download-cached':
+            self.check(client.request('POST', '/api/download', self.download_payload(self.fixed_url)))
+        elif self.name == 'serve':
+            status, data, _ = self.check(client.request(
+                'POST', '/api/download', self.download_payload(self.fixed_url)))
+            self.filename = json_body(data)['filename']
+
+    def check(self, result):
+        status, data, _ = result
+        if status != 200:
+            raise RuntimeError(f'persiapan gagal ({status}): {data[:300].decode(errors="replace")}')
+        return result
+
+    @staticmethod
+    def download_payload(url):
+        return {'url': url, 'quality': 'Best Quality', 'format_id': 'best', 'wait': True}
+
+    def run(self, client):
+        if self.name == 'info':
+            status, data, size = client.request('POST', '/api/get-info', {'url': self.video_url()})
+        elif self.name == 'info-cached':
+            status, data, size = client.request('POST', '/api/get-info', {'url': self.fixed_url})
+        elif self.name == 'download':
+            status, data, size = client.request('POST', '/api/download', self.download_payload(self.video_url()))
+            size = json_body(data).get('filesize', 0) if status == 200 else 0
+        elif self.name == 'download-cached':
+            status, data, size = client.request('POST', '/api/download', self.download_payload(self.fixed_url))
+            size = json_body(data).get('filesize', 0) if status == 200 else 0
+        else:
+            status, data, size = client.request('GET', f'/download/{self.filename}', keep_body=False)
+        return status == 200, status, size
+
+
+# ============================================
+# SERVER PROCESS STATS (/proc)
+# ============================================
+
+class ProcessMonitor:
+    """CPU time, RSS and disk I/O of the server process, read from /proc (Linux)"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.tick = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self.available = pid is not None and os.path.exists(f'/proc/{pid}/stat')
+        self.rss_max = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def snapshot(self):
+        if not self.available:
+            return None
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            # utime, stime + cutime, cstime (ffmpeg yang sudah selesai ikut terhitung)
+            cpu = sum(int(value) for value in fields[11:15]) / self.tick
+            rss = 0
+            with open(f'/proc/{self.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss = int(line.split()[1]) * 1024
+            io = {}
+            try:
+                with open(f'/proc/{self.pid}/io') as f:
+                    for line in f:
+                        key, value = line.split(':')
+                        io[key] = int(value)
+            except OSError:
+                pass
+            return {'cpu': cpu, 'rss': rss, 'read_bytes': io.get('read_bytes'),
+                    'write_bytes': io.get('write_bytes'), 'time': time.monotonic()}
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def start(self):
+        self.rss_max = 0
+        self._stop.clear()
+        if self.available:
+            self._thread = threading.Thread(target=self._sample, name='monitor', daemon=True)
+            self._thread.start()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            snapshot = self.snapshot()
+            if snapshot:
+                self.rss_max = max(self.rss_max, snapshot['rss'])
+            self._stop.wait(SAMPLE_INTERVAL)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def usage(self, before, after, requests):
+        if not before or not after:
+            return None
+        elapsed = after['time'] - before['time']
+        cpu = after['cpu'] - before['cpu']
+        usage = {
+            'cpu_seconds': round(cpu, 3),
+            'cpu_percent': round(cpu * 100 / elapsed, 1) if elapsed else None,
+            'cpu_ms_per_request': round(cpu * 1000 / requests, 3) if requests else None,
+            'rss_max_mb': round(max(self.rss_max, after['rss']) / 2 ** 20, 1),
+            'rss_end_mb': round(after['rss'] / 2 ** 20, 1),
+        }
+        for key in ('read_bytes', 'write_bytes'):
+            if before[key] is not None and after[key] is not None:
+                usage[f'disk_{key}'] = after[key] - before[key]
+        return usage
+
+
+# ============================================
+# LOAD RUNNER
+# ============================================
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def run_load(scenario, target, concurrency, duration, warmup, max_requests, monitor):
+    """Run one scenario at one concurrency level; return its result dict"""
+    samples = []
+    lock = threading.Lock()
+    stop = threading.Event()
+    budget = itertools.count()
+
+    def worker(n):
+        # IP berbeda per worker, seperti banyak pengguna
+        client = Client(target, f'10.{n // 250}.{n % 250 + 1}.1')
+        local = []
+        while not stop.is_set():
+            if max_requests and next(budget) >= max_requests:
+                break
+            started = time.monotonic()
+            try:
+                ok, status, size = scenario.run(client)
+            except Exception as e:
+                ok, status, size = False, type(e).__name__, 0
+            local.append((started, time.monotonic() - started, ok, status, size))
+        client.close()
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(n,), name=f'load-{n}', daemon=True)
+               for n in range(concurrency)]
+    began = time.monotonic()
+    for thread in threads:
+        thread.start()
+
+    # Request yang dimulai selama warm-up tidak dihitung
+    window_start = began + (0 if max_requests else warmup)
+    time.sleep(max(0.0, window_start - time.monotonic()))
+    monitor.start()
+    before = monitor.snapshot()
+    if max_requests:
+        for thread in threads:
+            thread.join()
+    else:
+        time.sleep(duration)
+        stop.set()
+    window_end = time.monotonic()
+    for thread in threads:
+        thread.join()
+    after = monitor.snapshot()
+    monitor.stop()
+
+    measured = [s for s in samples if s[0] >= window_start]
+    ok = [s for s in measured if s[2]]
+    latencies = sorted(s[1] * 1000 for s in ok)
+    statuses = {}
+    for s in measured:
+        statuses[str(s[3])] = statuses.get(str(s[3]), 0) + 1
+    window = (window_end - window_start) if not max_requests else (max(
+        (s[0] + s[1] for s in measured), default=window_start) - window_start)
+    total_bytes = sum(s[4] for s in ok)
+    return {
+        'scenario': scenario.name,
+        'concurrency': concurrency,
+        'duration': round(window, 3),
+        'requests': len(measured),
+        'ok': len(ok),
+        'errors': len(measured) - len(ok),
+        'status': statuses,
+        'throughput': round(len(ok) / window, 3) if window > 0 else None,
+        'bytes': total_bytes,
+        'bytes_per_second': round(total_bytes / window) if window > 0 else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'p50': _round(percentile(latencies, 50)),
+            'p95': _round(percentile(latencies, 95)),
+            'p99': _round(percentile(latencies, 99)),
+            'max': _round(latencies[-1] if latencies else None),
+        },
+        'server': monitor.usage(before, after, len(measured)),
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+# ============================================
+# PROCESSES
+# ============================================
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process, log_path):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit(f'Proses berhenti saat start, lihat {log_path}')
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f'{url} tidak merespons dalam {STARTUP_TIMEOUT} detik, lihat {log_path}')
+
+
+def start_process(args, log_path, env=None):
+    log = open(log_path, 'w')
+    return subprocess.Popen([sys.executable, *args], stdout=log, stderr=subprocess.STDOUT,
+                            env=dict(os.environ, **(env or {})), cwd=ROOT)
+
+
+def stop_process(process):
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# ============================================
+# REPORT & BASELINE COMPARISON
+# ============================================
+
+def result_key(result):
+    return f"{result['scenario']}/{result['source']}/c{result['concurrency']}"
+
+
+def metric(result, path):
+    value = result
+    for part in path.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(report, baseline, threshold):
+    """Print current vs baseline per metric; return the regressions"""
+    previous = {result_key(r): r for r in baseline.get('results', [])}
+    regressions = []
+    print(f"\nVs baseline {baseline.get('meta', {}).get('created', '?')} "
+          f"(commit {baseline.get('meta', {}).get('git_commit') or '?'}), threshold {threshold:.0%}")
+    for result in report['results']:
+        old = previous.get(result_key(result))
+        if old is None:
+            print(f'  {result_key(result)}: tidak ada di baseline')
+            continue
+        for path, better in COMPARED_METRICS:
+            now, before = metric(result, path), metric(old, path)
+            if not now or not before:
+                continue
+            change = (now - before) / before
+            worse = -change * better > threshold
+            if worse:
+                regressions.append((result_key(result), path, before, now))
+            print(f'  {result_key(result):32} {path:28} {before:>12} -> {now:>12} '
+                  f'{change:+7.1%}{"  REGRESI" if worse else ""}')
+        if result['errors'] > old['errors']:
+            print(f"  {result_key(result):32} {'errors':28} {old['errors']:>12} -> {result['errors']:>12}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_result(result):
+    latency = result['latency_ms']
+    server = result['server'] or {}
+    print(f"{result_key(result):32} {result['throughput'] or 0:8.2f} req/s  "
+          f"p50 {latency['p50']} p95 {latency['p95']} p99 {latency['p99']} ms  "
+          f"errors {result['errors']}/{result['requests']}  "
+          f"cpu {server.get('cpu_percent', '-')}%  rss {server.get('rss_max_mb', '-')} MB", flush=True)
+
+
+def parse_list(value, cast=str):
+    return [cast(item.strip()) for item in value.split(',') if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=__doc__.split('\n\n', 1)[1])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated, see above')
+    parser.add_argument('--source', default='direct', choices=sorted(SOURCES),
+                        help='media type served by the fake platform')
+    parser.add_argument('--concurrency', default='1,8', help='comma-separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=15, help='measured seconds per scenario and level')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds run before measuring')
+    parser.add_argument('--requests', type=int, default=0,
+                        help='fixed number of requests per scenario and level instead of --duration')
+    parser.add_argument('--target', help='running server to test (default: start bench/server.py)')
+    parser.add_argument('--server-pid', type=int, help='pid of --target, for CPU/RSS/disk I/O')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the started server (e.g. EXTRACT_CONCURRENCY=16)')
+    parser.add_argument('--platform', help='running fake platform (default: start bench/fakeplatform.py)')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake platform delay per response (s)')
+    parser.add_argument('--rate', type=int, default=0, help='fake platform bytes/s per media response')
+    parser.add_argument('--media-seconds', type=int, default=5, help='length of the synthetic video')
+    parser.add_argument('--workdir', help='server state directory (default: temporary, removed afterwards)')
+    parser.add_argument('--output', help='JSON report (default: bench/results/<time>.json)')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change counted as a regression (default 0.1 = 10%%)')
+    args = parser.parse_args(argv)
+
+    scenarios = parse_list(args.scenarios)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'skenario tidak dikenal: {", ".join(sorted(unknown))}')
+    concurrency_levels = parse_list(args.concurrency, int)
+    server_env = dict(SERVER_ENV)
+    for item in args.server_env:
+        key, _, value = item.partition('=')
+        server_env[key] = value
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='vtmu-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    platform_process = server_process = None
+    try:
+        platform_url = args.platform
+        if not platform_url:
+            port = free_port()
+            log_path = os.path.join(workdir, 'fakeplatform.log')
+            platform_process = start_process(
+                [os.path.join(BENCH_DIR, 'fakeplatform.py'), '--port', str(port),
+                 '--latency', str(args.latency), '--rate', str(args.rate),
+                 '--seconds', str(args.media_seconds)], log_path)
+            platform_url = f'http://127.0.0.1:{port}'
+            wait_until_up(f'{platform_url}/watch/ping', platform_process, log_path)
+
+        target = args.target
+        server_pid = args.server_pid
+        if not target:
+            port = free_port()
+            log_path = os.path.join(workdir, 'server.log')
+            server_process = start_process(
+                [os.path.join(BENCH_DIR, 'server.py'), '--port', str(port), '--workdir', workdir],
+                log_path, server_env)
+            target = f'http://127.0.0.1:{port}'
+            server_pid = server_process.pid
+            wait_until_up(f'{target}/api/health', server_process, log_path)
+        target = target.rstrip('/')
+
+        monitor = ProcessMonitor(server_pid)
+        if not monitor.available:
+            print('CPU/RSS/disk I/O server tidak diukur (butuh --server-pid dan /proc)', flush=True)
+        run_id = uuid.uuid4().hex[:8]
+        results = []
+        skipped = {}
+        for name in scenarios:
+            scenario = Scenario(name, platform_url + SOURCES[args.source], run_id)
+            try:
+                scenario.prepare(Client(target, '10.255.255.1'))
+            except (RuntimeError, KeyError, OSError, http.client.HTTPException) as e:
+                print(f'{name}: dilewati, {e}', flush=True)
+                skipped[name] = str(e)
+                continue
+            for concurrency in concurrency_levels:
+                result = run_load(scenario, target, concurrency, args.duration, args.warmup,
+                                  args.requests, monitor)
+                result['source'] = args.source
+                results.append(result)
+                print_result(result)
+
+        report = {
+            'meta': {
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'target': target if args.target else 'bench/server.py',
+                'settings': {
+                    'source': args.source,
+                    'duration': args.duration,
+                    'warmup': args.warmup,
+                    'requests': args.requests,
+                    'latency': args.latency,
+                    'rate': args.rate,
+                    'media_seconds': args.media_seconds,
+                    'server_env': server_env if not args.target else None,
+                },
+            },
+            'results': results,
+            'skipped': skipped,
+        }
+        output = args.output or os.path.join(BENCH_DIR, 'results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nReport: {output}')
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare(report, json.load(f), args.threshold)
+            if regressions:
+                print(f'\n{len(regressions)} metric memburuk lebih dari {args.threshold:.0%}')
+                return 1
+        return 0
+    finally:
+        stop_process(server_process)
+        stop_process(platform_process)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,31 @@
+"""Run app.py for a benchmark: threaded server, no debugger/reloader, state in a work dir
+
+    python bench/server.py --port 5055 --workdir /tmp/vtmu-bench
+
+downloads/, config/, app.log and the SQLite files end up in --workdir
+instead of the checkout. Rate limits are set by loadtest.py through the
+environment (RATE_LIMIT_*), like in production.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--workdir', required=True)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    sys.path.insert(0, ROOT)
+    from app import app
+    app.run(host=args.host, port=args.port, threaded=True, debug=False, use_reloader=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# ============================================
+# METADATA CACHE (/api/get-info)
+# ============================================
+
+# TTL per platform (detik). URL CDN TikTok/Instagram cepat kadaluarsa,
+# jadi TTL dibuat lebih pendek dari YouTube.
+PLATFORM_TTLS = {
+    'tiktok': 600,
+    'instagram': 600,
+    'youtube': 1800,
+    'unknown': 300,
+}
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 1000
+
+# Query parameter yang tidak mengubah video (tracking/share params)
+TRACKING_PARAMS = {
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+    'si', 'feature', 'igsh', 'igshid', 'is_from_webapp', 'sender_device',
+    'share_app_id', 'share_link_id', 'tt_from', 'u_code', '_r', '_t', 'lang',
+}
+
+# Query parameter YouTube yang menentukan konten: video (v) dan playlist (list).
+# watch?v=..&list=.. tanpa noplaylist mengekstrak playlist-nya, jadi list ikut dipakai.
+YOUTUBE_CONTENT_PARAMS = {'v', 'list'}
+
+
+def normalize_url(url):
+    """Normalize URL so equivalent share links map to one cache key"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip('/') or '/'
+
+    # youtu.be/<id> -> youtube.com/watch?v=<id>
+    if host == 'youtu.be':
+        query = [('v', path.lstrip('/'))]
+        host, path = 'youtube.com', '/watch'
+    else:
+        query = [
+            (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if k.lower() not in TRACKING_PARAMS
+        ]
+        if 'youtube.com' in host:
+            query = [(k, v) for k, v in query if k in YOUTUBE_CONTENT_PARAMS]
+        elif 'tiktok.com' in host or 'instagram.com' in host:
+            query = []
+
+    return urlunsplit(('https', host, path, urlencode(sorted(query)), ''))
+
+
+class MemoryBackend:
+    """In-process LRU store with per-entry expiry"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def touch(self, key, ttl):
+        """Extend a live entry's expiry; return False if it is gone"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.time():
+                return False
+            self._data[key] = (time.time() + ttl, entry[1])
+            self._data.move_to_end(key)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """On-disk LRU store, shared by every worker process on the same host"""
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES * 5):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL,'
+            ' last_access REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)'
+        )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                return None
+            self._conn.execute(
+                'UPDATE cache SET last_access = ? WHERE key = ?', (now, key)
+            )
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at, last_access)'
+                ' VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now + ttl, now)
+            )
+            count = self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                # Buang yang kadaluarsa dulu, baru yang paling lama tidak diakses
+                self._conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+                count = self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+                overflow = count - self.max_entries
+                if overflow > 0:
+                    self._conn.execute(
+                        'DELETE FROM cache WHERE key IN ('
+                        ' SELECT key FROM cache ORDER BY last_access LIMIT ?)',
+                        (overflow,)
+                    )
+                    self.evictions += overflow
+
+    def touch(self, key, ttl):
+        """Extend a live entry's expiry; return False if it is gone"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE cache SET expires_at = ?, last_access = ?'
+                ' WHERE key = ? AND expires_at > ?',
+                (now + ttl, now, key, now)
+            )
+        return cursor.rowcount > 0
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM cache')
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+def create_backend(kind=None, path=None, max_entries=None):
+    """Build a cache backend from arguments or INFO_CACHE_* env variables"""
+    kind = kind or os.environ.get('INFO_CACHE_BACKEND', 'memory')
+    max_entries = max_entries or int(
+        os.environ.get('INFO_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+    )
+    if kind == 'sqlite':
+        path = path or os.environ.get('INFO_CACHE_PATH', 'info_cache.sqlite3')
+        return SQLiteBackend(path, max_entries=max_entries)
+    return MemoryBackend(max_entries=max_entries)
+
+
+class InfoCache:
+    """URL-keyed cache for the video_info dict returned by /api/get-info"""
+
+    def __init__(self, backend=None, ttls=None, default_ttl=DEFAULT_TTL):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttls = dict(PLATFORM_TTLS, **(ttls or {}))
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, valid=None):
+        """Return the cached value; `valid(value)` can reject it as a miss"""
+        value = self.backend.get(normalize_url(url))
+        if value is not None and valid is not None and not valid(value):
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def ttl(self, platform='unknown'):
+        return self.ttls.get(platform, self.default_ttl)
+
+    def set(self, url, value, platform='unknown'):
+        self.backend.set(normalize_url(url), value, self.ttl(platform))
+
+    def invalidate(self, url):
+        self.backend.delete(normalize_url(url))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'max_entries': self.backend.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# ============================================
+# INFO TOKENS (/api/get-info -> /api/download)
+# ============================================
+
+INFO_TOKEN_TTL = 600
+INFO_TOKEN_MAX_ENTRIES = 200
+
+
+class InfoTokenStore:
+    """Short-lived tokens pointing at full sanitized yt-dlp info dicts
+
+    /api/get-info stores the extractor result here so /api/download can
+    hand it straight to YoutubeDL.process_ie_result instead of running the
+    extractor a second time. Tokens are also served from InfoCache, so the
+    cache hands out the token's TTL and touches it on every hit; a token
+    that is already gone turns the hit into a miss.
+    """
+
+    def __init__(self, backend=None, ttl=INFO_TOKEN_TTL):
+        self.backend = backend if backend is not None else MemoryBackend(
+            max_entries=INFO_TOKEN_MAX_ENTRIES
+        )
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def put(self, url, info, ttl=None):
+        token = uuid.uuid4().hex
+        self.backend.set(token, {'url': normalize_url(url), 'info': info}, ttl or self.ttl)
+        return token
+
+    def touch(self, token, ttl=None):
+        """Keep a token alive for another `ttl` seconds; False if it expired or was evicted"""
+        return bool(token) and self.backend.touch(token, ttl or self.ttl)
+
+    def get(self, token, url):
+        """Return the stored info dict, or None if expired or for another URL"""
+        info = self.peek(token, url)
+        with self._lock:
+            if info is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return info
+
+    def peek(self, token, url):
+        """Like get(), without counting a hit/miss"""
+        entry = self.backend.get(token) if token else None
+        if entry is None or entry['url'] != normalize_url(url):
+            return None
+        return entry['info']
+
+    def stats(self):
+        return {
+            'entries': len(self.backend),
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
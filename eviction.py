@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+import time
+
+# ============================================
+# DOWNLOADS FOLDER EVICTION
+# ============================================
+
+STORE_MAX_BYTES = int(os.environ.get('STORE_MAX_BYTES', 2 * 1024 ** 3))  # 2 GB
+STORE_MAX_AGE = int(os.environ.get('STORE_MAX_AGE', 24 * 3600))  # seconds since last serve
+EVICTION_POLICY = os.environ.get('EVICTION_POLICY', 'lru')  # 'lru' or 'lfu'
+EVICTION_INTERVAL = int(os.environ.get('EVICTION_INTERVAL', 60))
+RECONCILE_INTERVAL = int(os.environ.get('RECONCILE_INTERVAL', 600))
+# File baru diberi waktu supaya client sempat mengambilnya setelah job selesai
+EVICTION_GRACE = 300
+
+logger = logging.getLogger(__name__)
+
+
+class Evictor:
+    """Keeps the download store under a byte quota and max age
+
+    Works from the store index; the folder itself is only scanned by the
+    periodic reconcile every RECONCILE_INTERVAL seconds. Entries with an
+    open transfer (refcount > 0) or created within EVICTION_GRACE seconds
+    are never evicted.
+    """
+
+    def __init__(self, store, max_bytes=STORE_MAX_BYTES, max_age=STORE_MAX_AGE,
+                 policy=EVICTION_POLICY, interval=EVICTION_INTERVAL, grace=EVICTION_GRACE,
+                 reconcile_interval=RECONCILE_INTERVAL):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.policy = policy
+        self.interval = interval
+        self.grace = grace
+        self.reconcile_interval = reconcile_interval
+        self.runs = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sort_key(self, entry):
+        if self.policy == 'lfu':
+            return (entry.hits, entry.last_access)
+        return entry.last_access
+
+    def run_once(self):
+        """Run one eviction pass; return the number of files and bytes freed"""
+        # Ikut hitung file yang didownload worker process lain
+        self.store.sync()
+        now = time.time()
+        candidates = [
+            entry for entry in self.store.entries()
+            if entry.refcount == 0 and now - entry.created_at >= self.grace
+        ]
+
+        # 1. Kadaluarsa: tidak diakses lebih lama dari max_age
+        victims = [entry for entry in candidates if now - entry.last_access > self.max_age]
+
+        # 2. Masih di atas kuota: buang sesuai policy sampai cukup
+        excess = self.store.total_bytes - sum(e.size for e in victims) - self.max_bytes
+        if excess > 0:
+            chosen = {entry.key for entry in victims}
+            for entry in sorted(candidates, key=self._sort_key):
+                if excess <= 0:
+                    break
+                if entry.key not in chosen:
+                    victims.append(entry)
+                    excess -= entry.size
+
+        evicted = self.store.evict([entry.key for entry in victims])
+        freed = sum(entry.size for entry in evicted)
+
+        self.runs += 1
+        self.evicted_files += len(evicted)
+        self.evicted_bytes += freed
+        self.last_run = now
+        if evicted:
+            logger.info("Evicted %d files (%d bytes) from download store", len(evicted), freed)
+        return len(evicted), freed
+
+    def start(self):
+        """Start the eviction thread of this process; no-op if it already runs here"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name='store-evictor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        # Reconcile sekali saat start untuk menghitung file lama di luar index
+        last_reconcile = 0
+        while True:
+            try:
+                if time.time() - last_reconcile >= self.reconcile_interval:
+                    self.store.reconcile(orphan_max_age=self.max_age)
+                    last_reconcile = time.time()
+                self.run_once()
+                self.store.compact()
+            except Exception:
+                logger.exception("Eviction pass failed")
+            if self._stop.wait(self.interval):
+                return
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'max_bytes': self.max_bytes,
+            'max_age': self.max_age,
+            'runs': self.runs,
+            'evicted_files': self.evicted_files,
+            'evicted_bytes': self.evicted_bytes,
+            'last_run': self.last_run,
+        }
@@ -0,0 +1,238 @@
+import logging
+import os
+import socket
+import threading
+import time
+
+# ============================================
+# SHARED HTTP CONNECTIONS AND DNS CACHE
+# ============================================
+
+HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', 50))  # host pools kept open
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))  # idle connections per host
+HTTP2_ENABLED = os.environ.get('HTTP2_ENABLED', '').lower() in ('1', 'true', 'yes')
+DNS_CACHE_TTL = int(os.environ.get('DNS_CACHE_TTL', 300))  # 0 = disabled
+DNS_CACHE_MAX_ENTRIES = 1024
+
+logger = logging.getLogger(__name__)
+
+
+class DNSCache:
+    """TTL cache of getaddrinfo results, used only by the pooled yt-dlp connections"""
+
+    def __init__(self, ttl=DNS_CACHE_TTL, max_entries=DNS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] > now:
+                self.hits += 1
+                return list(cached[1])
+            self.misses += 1
+
+        # Gagal resolve tidak di-cache, exception diteruskan apa adanya
+        result = socket.getaddrinfo(host, port, family, type, proto, flags)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (now + self.ttl, result)
+        return list(result)
+
+    def resolve(self, host, port, family=0):
+        """Unique (ip, port) addresses for a TCP connection, in resolver order"""
+        addresses = []
+        for _, _, _, _, sockaddr in self.getaddrinfo(host, port, family, socket.SOCK_STREAM):
+            if sockaddr[:2] not in addresses:
+                addresses.append(sockaddr[:2])
+        return addresses
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.ttl > 0,
+                'ttl': self.ttl,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+dns_cache = DNSCache()
+
+_pool_managers = {}
+_pool_classes = None
+_pool_lock = threading.Lock()
+_installed = False
+
+
+def _cached_dns_pool_classes():
+    """urllib3 pool classes whose connections resolve hosts through dns_cache
+
+    Dibuat saat pertama dipakai supaya kelas koneksi HTTPS mengikuti
+    inject_into_urllib3() dari HTTP/2 bila aktif.
+    """
+    import urllib3
+    from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+    from urllib3.util.connection import allowed_gai_family, create_connection
+
+    class CachedDNSConnectionMixin:
+        def _new_conn(self):
+            if dns_cache.ttl <= 0:
+                return super()._new_conn()
+            try:
+                addresses = dns_cache.resolve(self._dns_host.strip('[]'), self.port, allowed_gai_family())
+            except socket.gaierror as e:
+                raise NameResolutionError(self.host, self, e) from e
+
+            # Sama seperti urllib3: coba tiap alamat sampai ada yang tersambung
+            error = NewConnectionError(self, 'Failed to establish a new connection: no addresses')
+            for address in addresses:
+                try:
+                    return create_connection(
+                        address,
+                        self.timeout,
+                        source_address=self.source_address,
+                        socket_options=self.socket_options,
+                    )
+                except socket.timeout as e:
+                    error = ConnectTimeoutError(
+                        self, f'Connection to {self.host} timed out. (connect timeout={self.timeout})')
+                    error.__cause__ = e
+                except OSError as e:
+                    error = NewConnectionError(self, f'Failed to establish a new connection: {e}')
+                    error.__cause__ = e
+            raise error
+
+    class CachedDNSHTTPConnection(CachedDNSConnectionMixin, urllib3.HTTPConnectionPool.ConnectionCls):
+        pass
+
+    class CachedDNSHTTPSConnection(CachedDNSConnectionMixin, urllib3.HTTPSConnectionPool.ConnectionCls):
+        pass
+
+    class CachedDNSHTTPConnectionPool(urllib3.HTTPConnectionPool):
+        ConnectionCls = CachedDNSHTTPConnection
+
+    class CachedDNSHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+        ConnectionCls = CachedDNSHTTPSConnection
+
+    return {'http': CachedDNSHTTPConnectionPool, 'https': CachedDNSHTTPSConnectionPool}
+
+
+def shared_pool_manager(key, **pool_kwargs):
+    """One urllib3 PoolManager per TLS/source-address setting, shared process-wide"""
+    global _pool_classes
+    import urllib3
+
+    with _pool_lock:
+        manager = _pool_managers.get(key)
+        if manager is None:
+            if _pool_classes is None:
+                _pool_classes = _cached_dns_pool_classes()
+            manager = _pool_managers[key] = urllib3.PoolManager(
+                num_pools=HTTP_POOL_HOSTS, maxsize=HTTP_POOL_MAXSIZE, **pool_kwargs
+            )
+            # DNS cache hanya berlaku untuk koneksi pool ini, bukan socket.getaddrinfo global
+            manager.pool_classes_by_scheme = _pool_classes
+        return manager
+
+
+def _register_handler():
+    """Register a yt-dlp request handler that uses the shared pool managers"""
+    from yt_dlp.networking._requests import RequestsHTTPAdapter, RequestsRH, RequestsSession
+    from yt_dlp.networking.common import register_preference, register_rh
+    import requests
+    import urllib3
+
+    class SharedPoolAdapter(RequestsHTTPAdapter):
+        def __init__(self, pool_key, **kwargs):
+            self._pool_key = pool_key
+            super().__init__(**kwargs)
+
+        def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+            self.poolmanager = shared_pool_manager(self._pool_key, **self._pm_args)
+
+        def close(self):
+            # Pool koneksi dipakai bersama: hanya proxy manager milik adapter ini yang ditutup
+            for proxy in self.proxy_manager.values():
+                proxy.clear()
+
+    class PooledRequestsRH(RequestsRH):
+        """RequestsRH whose connections outlive the YoutubeDL that opened them"""
+        RH_NAME = 'pooled_requests'
+
+        def _create_instance(self, cookiejar, legacy_ssl_support=None):
+            legacy = legacy_ssl_support if legacy_ssl_support is not None else self.legacy_ssl_support
+            pool_key = (self.verify, legacy, self.source_address, self.prefer_system_certs,
+                        tuple(sorted(self._client_cert.items())))
+            session = RequestsSession()
+            http_adapter = SharedPoolAdapter(
+                pool_key,
+                ssl_context=self._make_sslcontext(legacy_ssl_support=legacy_ssl_support),
+                source_address=self.source_address,
+                max_retries=urllib3.util.retry.Retry(False),
+            )
+            session.adapters.clear()
+            session.headers = requests.models.CaseInsensitiveDict()
+            session.mount('https://', http_adapter)
+            session.mount('http://', http_adapter)
+            # Cookie tetap per instance YoutubeDL, hanya koneksi yang dibagi
+            session.cookies = cookiejar
+            session.trust_env = False
+            return session
+
+    register_rh(PooledRequestsRH)
+
+    @register_preference(PooledRequestsRH)
+    def pooled_requests_preference(rh, request):
+        return 200
+
+
+def install():
+    """Enable the DNS cache and shared connection pools for yt-dlp"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    try:
+        _register_handler()
+    except ImportError:
+        # Tanpa requests yt-dlp memakai urllib (tanpa keep-alive antar request)
+        logger.warning("requests/urllib3 not installed, HTTP connection pooling disabled")
+        return
+    if HTTP2_ENABLED:
+        try:
+            import urllib3.http2
+            urllib3.http2.inject_into_urllib3()
+        except ImportError:
+            logger.warning("HTTP2_ENABLED set but h2 is not installed, using HTTP/1.1")
+
+
+def stats():
+    hosts = connections = requests_sent = 0
+    with _pool_lock:
+        managers = list(_pool_managers.values())
+    for manager in managers:
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            hosts += 1
+            connections += pool.num_connections
+            requests_sent += pool.num_requests
+    return {
+        'installed': _installed,
+        'hosts': hosts,
+        'connections_opened': connections,
+        'requests': requests_sent,
+        'dns_cache': dns_cache.stats(),
+    }
@@ -0,0 +1,331 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# ============================================
+# DOWNLOAD JOB QUEUE
+# ============================================
+
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', 4))
+MAX_PENDING_JOBS = int(os.environ.get('MAX_PENDING_JOBS', 100))
+JOB_RETENTION = 3600  # seconds a finished job stays queryable
+
+QUEUED = 'queued'
+# Fase: menunggu slot ffmpeg di PostprocessPool (beda dengan antrian download)
+PP_QUEUED = 'pp_queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'error'
+
+# Nama postprocessor yt-dlp -> fase yang dilaporkan ke client
+POSTPROCESSOR_PHASES = {
+    'Merger': 'merging',
+    'VideoConvertor': 'converting',
+    'VideoRemuxer': 'converting',
+    'ExtractAudio': 'converting',
+}
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another download"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobError(Exception):
+    """Raised by a job function to fail the job with a user-facing message"""
+
+
+class Job:
+    """State of a single download, updated from yt-dlp progress hooks"""
+
+    def __init__(self, job_id, meta=None):
+        self.id = job_id
+        self.meta = meta or {}
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.speed = None
+        self.eta = None
+        self.phase = QUEUED
+        self.phase_durations = {}
+        # Urutan fase dengan waktu mulainya: [(phase, epoch)], untuk tracing
+        self.phase_log = [(QUEUED, self.created_at)]
+        # Langkah post-processing yang dipilih planner (none/remux/transcode)
+        self.postprocess = None
+        # File yang sedang ditulis yt-dlp (.part), untuk pipe-through streaming
+        self.output_path = None
+        self.done = threading.Event()
+        # yt-dlp bisa download beberapa file (video + audio) untuk satu job
+        self._files = {}
+        self._phase_started = self.created_at
+        self._version = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    @property
+    def downloaded_bytes(self):
+        return sum(done for done, _ in self._files.values())
+
+    @property
+    def total_bytes(self):
+        return sum(total for _, total in self._files.values()) or None
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook, see YoutubeDL 'progress_hooks' option"""
+        filename = d.get('filename') or ''
+        with self._lock:
+            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            done = d.get('downloaded_bytes') or 0
+            if d.get('status') == 'finished':
+                done = total = d.get('total_bytes') or done or total
+            self._files[filename] = (done, total)
+            self.speed = d.get('speed')
+            self.eta = d.get('eta')
+            if self.output_path is None:
+                self.output_path = d.get('tmpfilename') or d.get('filename')
+            if d.get('status') == 'downloading':
+                self._set_phase('downloading')
+            self._notify()
+
+    def postprocessor_hook(self, d):
+        """yt-dlp postprocessor hook, see YoutubeDL 'postprocessor_hooks' option"""
+        if d.get('status') != 'started':
+            return
+        with self._lock:
+            self._set_phase(POSTPROCESSOR_PHASES.get(d.get('postprocessor'), 'processing'))
+            self._notify()
+
+    def set_state(self, state):
+        with self._lock:
+            self.state = state
+            # Setelah job mulai, yt-dlp menjalankan extractor dulu
+            self._set_phase('extracting' if state == RUNNING else state)
+            self._notify()
+
+    def set_phase(self, phase):
+        with self._lock:
+            self._set_phase(phase)
+            self._notify()
+
+    def wait_for_update(self, version, timeout=None):
+        """Block until the job changes past `version`; return the new version"""
+        with self._lock:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def _set_phase(self, phase):
+        # Dipanggil dengan self._lock terkunci
+        if phase == self.phase:
+            return
+        now = time.time()
+        elapsed = now - self._phase_started
+        self.phase_durations[self.phase] = round(
+            self.phase_durations.get(self.phase, 0) + elapsed, 3
+        )
+        self.phase = phase
+        self._phase_started = now
+        self.phase_log.append((phase, now))
+
+    def _notify(self):
+        # Dipanggil dengan self._lock terkunci
+        self._version += 1
+        self._changed.notify_all()
+
+    def to_dict(self):
+        with self._lock:
+            downloaded = self.downloaded_bytes
+            total = self.total_bytes
+            data = {
+                'job_id': self.id,
+                'version': self._version,
+                'state': self.state,
+                'phase': self.phase,
+                'phase_durations': dict(self.phase_durations),
+                'postprocess': self.postprocess,
+                'downloaded_bytes': downloaded,
+                'total_bytes': total,
+                'progress': round(downloaded * 100 / total, 1) if total else None,
+                'speed': self.speed,
+                'eta': self.eta,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+        if self.state == FINISHED:
+            data['result'] = self.result
+        elif self.state == FAILED:
+            data['error'] = self.error
+        return data
+
+
+class JobManager:
+    """Runs download jobs on a bounded thread pool"""
+
+    def __init__(self, max_workers=DOWNLOAD_WORKERS, max_pending=MAX_PENDING_JOBS,
+                 retention=JOB_RETENTION, on_finished=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        # Dipanggil dengan job yang selesai/gagal (mis. untuk metrics)
+        self.on_finished = on_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='download')
+        self._jobs = {}
+        # Kelompok job (bulk download): group_id -> daftar job_id
+        self._groups = {}
+        self._active = 0
+        self._lock = threading.Lock()
+        self.started = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        # Rata-rata (EWMA) lama satu job berjalan, untuk estimasi Retry-After
+        self.run_time = None
+
+    def submit(self, fn, meta=None):
+        """Queue fn(job) and return the Job; fn's return value becomes job.result"""
+        with self._lock:
+            self._prune()
+            if self._active >= self.max_workers + self.max_pending:
+                raise QueueFullError('Download queue is full', self._retry_after())
+            job = Job(uuid.uuid4().hex[:16], meta)
+            self._jobs[job.id] = job
+            self._active += 1
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def add_finished(self, result, meta=None):
+        """Register a job that is already done (e.g. served from the store)"""
+        job = Job(uuid.uuid4().hex[:16], meta)
+        job.started_at = job.finished_at = job.created_at
+        job.result = result
+        job.set_state(FINISHED)
+        job.done.set()
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def add_group(self, jobs):
+        """Register jobs that belong together; return the group id"""
+        group_id = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._groups[group_id] = [job.id for job in jobs]
+        return group_id
+
+    def get_group(self, group_id):
+        """Jobs of a group in submission order, or None for an unknown group"""
+        with self._lock:
+            job_ids = self._groups.get(group_id)
+            if job_ids is None:
+                return None
+            return [self._jobs[job_id] for job_id in job_ids if job_id in self._jobs]
+
+    def wait(self, job, timeout=None):
+        """Block until the job leaves the queued/running states"""
+        return job.done.wait(timeout)
+
+    def _retry_after(self):
+        # Dipanggil dengan self._lock terkunci: waktu sampai satu slot antrian kosong
+        if self.run_time is None:
+            return None
+        waiting = max(0, self._active - self.max_workers)
+        return (waiting + 1) / self.max_workers * self.run_time
+
+    def saturated(self):
+        """True when submit() would raise QueueFullError"""
+        with self._lock:
+            return self._active >= self.max_workers + self.max_pending
+
+    def retry_after(self):
+        """Rough seconds until a queue slot frees up, or None before the first job"""
+        with self._lock:
+            return self._retry_after()
+
+    def queue_stats(self):
+        """Queue fields in the shape of admission.Stage.stats()"""
+        with self._lock:
+            return {
+                'limit': self.max_workers,
+                'active': min(self._active, self.max_workers),
+                'waiting': max(0, self._active - self.max_workers),
+                'max_queue': self.max_pending,
+                'avg_wait': round(self.queue_wait_total / self.started, 3) if self.started else None,
+                'max_wait': round(self.queue_wait_max, 3),
+                'avg_service_time': round(self.run_time, 3) if self.run_time is not None else None,
+            }
+
+    def load(self):
+        """Share of the queue capacity (running + waiting jobs) in use, 0..1"""
+        with self._lock:
+            return self._active / (self.max_workers + self.max_pending)
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'active': self._active,
+                'waiting': states.get(QUEUED, 0),
+                'states': states,
+                'avg_queue_wait': round(self.queue_wait_total / self.started, 3) if self.started else None,
+                'max_queue_wait': round(self.queue_wait_max, 3),
+                'avg_run_time': round(self.run_time, 3) if self.run_time is not None else None,
+            }
+
+    def _run(self, job, fn):
+        job.started_at = time.time()
+        with self._lock:
+            waited = job.started_at - job.created_at
+            self.started += 1
+            self.queue_wait_total += waited
+            self.queue_wait_max = max(self.queue_wait_max, waited)
+        job.set_state(RUNNING)
+        state = FAILED
+        try:
+            job.result = fn(job)
+            state = FINISHED
+        except JobError as e:
+            job.error = str(e)
+        except Exception as e:
+            job.error = f'Gagal mendownload: {str(e)}'
+        finally:
+            job.finished_at = time.time()
+            run_time = job.finished_at - job.started_at
+            with self._lock:
+                self._active -= 1
+                self.run_time = run_time if self.run_time is None else 0.2 * run_time + 0.8 * self.run_time
+            job.set_state(state)
+            job.done.set()
+            if self.on_finished is not None:
+                self.on_finished(job)
+
+    def _prune(self):
+        # Dipanggil dengan self._lock terkunci
+        cutoff = time.time() - self.retention
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if expired:
+            # Group hilang setelah semua job-nya kadaluarsa
+            self._groups = {
+                group_id: job_ids for group_id, job_ids in self._groups.items()
+                if any(job_id in self._jobs for job_id in job_ids)
+            }
@@ -0,0 +1,243 @@
+import bisect
+import threading
+import time
+
+# ============================================
+# PROMETHEUS METRICS (/metrics)
+# ============================================
+
+# Batas bucket histogram durasi (detik): dari validasi URL (µs) sampai download/encode (menit)
+SECONDS_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Kecepatan download (byte/detik): 100 KB/s .. 100 MB/s
+SPEED_BUCKETS = (1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7, 1e8)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Tahap pipeline yang diukur
+VALIDATE = 'validate'
+DETECT = 'detect'
+EXTRACT = 'extract'
+QUEUE = 'queue'
+DOWNLOAD = 'download'
+MERGE = 'merge'
+POSTPROCESS_QUEUE = 'postprocess_queue'
+REMUX = 'remux'
+CONVERT = 'convert'
+SERVE = 'serve'
+
+
+class _Shard:
+    """Values written by one thread; only that thread ever mutates it"""
+
+    __slots__ = ('thread', 'values')
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.values = {}
+
+
+class _Metric:
+    """Base for per-thread aggregated metrics
+
+    Each thread updates its own dict without locks; a scrape sums the
+    shards of all threads. Shards of finished threads are folded into
+    `_retired` at scrape time, so short-lived request threads do not pile
+    up. A scrape racing an update can see that update half-applied (count
+    but not sum yet), which is fine for monitoring.
+    """
+
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _values(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard.values
+
+    def _collect(self):
+        """Merged {label_values: value} over all threads"""
+        with self._lock:
+            alive = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                else:
+                    self._merge_into(self._retired, shard.values)
+            self._shards = alive
+            merged = {}
+            self._merge_into(merged, self._retired)
+            for shard in alive:
+                self._merge_into(merged, dict(shard.values))
+        return merged
+
+    def _merge_into(self, target, values):
+        raise NotImplementedError
+
+    def _labels(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        values = self._values()
+        values[labels] = values.get(labels, 0) + amount
+
+    def _merge_into(self, target, values):
+        for labels, value in values.items():
+            target[labels] = target.get(labels, 0) + value
+
+    def expose(self):
+        return [f'{self.name}{self._labels(labels)} {_number(value)}'
+                for labels, value in sorted(self._collect().items())]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        values = self._values()
+        cell = values.get(labels)
+        if cell is None:
+            # [jumlah per bucket (non-kumulatif, terakhir = +Inf), sum]
+            cell = values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        cell[0][bisect.bisect_left(self.buckets, value)] += 1
+        cell[1] += value
+
+    def time(self, *labels):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def _merge_into(self, target, values):
+        for labels, (counts, total) in values.items():
+            cell = target.get(labels)
+            if cell is None:
+                target[labels] = [list(counts), total]
+            else:
+                cell[0] = [a + b for a, b in zip(cell[0], counts)]
+                cell[1] += total
+
+    def expose(self):
+        lines = []
+        bounds = [_number(b) for b in self.buckets] + ['+Inf']
+        for labels, (counts, total) in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{self._labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_sum{self._labels(labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{self._labels(labels)} {cumulative}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) or abs(value) >= 1e15 else str(int(value))
+    return str(value)
+
+
+class Registry:
+    """Metrics plus collectors that read existing stats() at scrape time
+
+    A collector returns [(name, type, help, [(labels_dict, value), ...])];
+    it is how queue depths and counters that already live in other
+    components are exported without touching their hot paths.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def expose(self):
+        """Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.expose())
+        for collector in self._collectors:
+            for name, kind, help, samples in collector():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    lines.append(f'{name}{{{label_text}}} {_number(value)}' if label_text
+                                 else f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# ============================================
+# METRICS OF THE DOWNLOAD PIPELINE
+# ============================================
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'vtmu_stage_duration_seconds', 'Duration of one pipeline stage (validate, detect, extract, queue, '
+    'download, merge, convert, serve)', ('stage', 'platform', 'quality'))
+DOWNLOAD_BYTES = REGISTRY.counter(
+    'vtmu_download_bytes_total', 'Bytes downloaded from video platforms', ('platform', 'quality'))
+DOWNLOAD_SPEED = REGISTRY.histogram(
+    'vtmu_download_speed_bytes_per_second', 'Average download speed of a finished job',
+    ('platform', 'quality'), SPEED_BUCKETS)
+JOBS = REGISTRY.counter(
+    'vtmu_download_jobs_total', 'Download jobs that ran, by final state', ('platform', 'quality', 'state'))
+HTTP_REQUESTS = REGISTRY.counter(
+    'vtmu_http_requests_total', 'HTTP requests by route and status', ('endpoint', 'method', 'status'))
+HTTP_SECONDS = REGISTRY.histogram(
+    'vtmu_http_request_duration_seconds', 'Time until the response (headers) is returned', ('endpoint',))
+BUSY = REGISTRY.counter(
+    'vtmu_busy_rejections_total', 'Requests rejected with 503, by reason', ('reason',))
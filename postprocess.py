@@ -0,0 +1,318 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+# ============================================
+# FORMAT-AWARE POST-PROCESSING
+# ============================================
+
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN') or shutil.which('ffmpeg') or 'ffmpeg'
+FFPROBE_BIN = os.environ.get('FFPROBE_BIN') or shutil.which('ffprobe')
+
+CPU_COUNT = os.cpu_count() or 1
+# ffmpeg memakai banyak core per proses, jadi worker < jumlah core
+POSTPROCESS_WORKERS = int(os.environ.get('POSTPROCESS_WORKERS', max(1, CPU_COUNT // 2)))
+FFMPEG_THREADS = int(os.environ.get('FFMPEG_THREADS', max(1, CPU_COUNT // POSTPROCESS_WORKERS)))
+TRANSCODE_PRESET = os.environ.get('TRANSCODE_PRESET', 'fast')
+# Antrian ffmpeg sepanjang ini = request baru yang butuh konversi ditolak (503)
+POSTPROCESS_MAX_QUEUE = int(os.environ.get('POSTPROCESS_MAX_QUEUE', 32))
+
+TARGET_EXT = 'mp4'
+AUDIO_EXT = 'mp3'
+# Codec yang boleh masuk container MP4 apa adanya (cukup stream copy)
+MP4_VIDEO_CODECS = {'avc1', 'avc3', 'h264', 'hev1', 'hvc1', 'h265', 'hevc', 'vp09', 'vp9', 'av01', 'av1'}
+MP4_AUDIO_CODECS = {'mp4a', 'aac', 'mp3', 'opus', 'flac', 'ac-3', 'ac3', 'ec-3', 'eac3'}
+
+# Preset encoder software (libx264): hasil sama di semua server, tidak bergantung GPU
+PRESETS = {
+    'fast': ['-preset', 'veryfast', '-crf', '23'],
+    'balanced': ['-preset', 'medium', '-crf', '23'],
+    'small': ['-preset', 'slow', '-crf', '26'],
+}
+VIDEO_ENCODE_ARGS = ['-c:v', 'libx264'] + PRESETS.get(TRANSCODE_PRESET, PRESETS['fast']) + ['-pix_fmt', 'yuv420p']
+AUDIO_ENCODE_ARGS = {
+    TARGET_EXT: ['-c:a', 'aac', '-b:a', '192k'],
+    AUDIO_EXT: ['-c:a', 'libmp3lame', '-b:a', '192k'],
+}
+
+NONE = 'none'
+REMUX = 'remux'
+TRANSCODE = 'transcode'
+
+logger = logging.getLogger(__name__)
+
+
+class PostprocessError(Exception):
+    """Raised when ffmpeg fails to produce the output file"""
+
+
+def normalize_codec(codec):
+    """'avc1.64001F' -> 'avc1'; None stays None (unknown), 'none' means no stream"""
+    if codec is None:
+        return None
+    return str(codec).lower().split('.')[0]
+
+
+def probe_codecs(path):
+    """(vcodec, acodec) of a file via ffprobe; (None, None) if ffprobe is missing"""
+    if not FFPROBE_BIN:
+        return None, None
+    try:
+        output = subprocess.run(
+            [FFPROBE_BIN, '-v', 'error', '-show_entries', 'stream=codec_type,codec_name',
+             '-of', 'json', path],
+            capture_output=True, check=True, timeout=30,
+        ).stdout
+        streams = json.loads(output).get('streams', [])
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None, None
+    codecs = {'video': 'none', 'audio': 'none'}
+    for stream in streams:
+        kind = stream.get('codec_type')
+        if kind in codecs and codecs[kind] == 'none':
+            codecs[kind] = normalize_codec(stream.get('codec_name'))
+    return codecs['video'], codecs['audio']
+
+
+def _stream_action(codec, allowed):
+    if codec == 'none':
+        return None
+    # Codec tidak diketahui: coba copy dulu, transcode jika remux gagal
+    if codec is None or codec in allowed:
+        return 'copy'
+    return 'encode'
+
+
+def plan(ext, vcodec=None, acodec=None, target=TARGET_EXT):
+    """Decide the cheapest way to turn a file into a playable MP4 (or MP3)
+
+    Returns a dict with 'action' (none/remux/transcode), the per-stream
+    'video'/'audio' handling (copy/encode/None), the 'target' extension
+    and a short 'reason'.
+    """
+    ext = (ext or '').lower()
+    vcodec, acodec = normalize_codec(vcodec), normalize_codec(acodec)
+    if target == AUDIO_EXT:
+        video = None
+        audio = _stream_action(acodec, {'mp3'})
+    else:
+        video = _stream_action(vcodec, MP4_VIDEO_CODECS)
+        audio = _stream_action(acodec, MP4_AUDIO_CODECS)
+
+    if 'encode' in (video, audio):
+        action = TRANSCODE
+        reason = f'{vcodec}/{acodec} tidak bisa masuk {target.upper()}'
+    elif ext != target or (target == AUDIO_EXT and vcodec not in ('none', None)):
+        action = REMUX
+        reason = f'container {ext or "unknown"} -> {target}'
+    else:
+        action = NONE
+        reason = f'sudah {target.upper()}'
+    return {'action': action, 'video': video, 'audio': audio, 'target': target, 'reason': reason}
+
+
+def plan_for_info(info, target=TARGET_EXT):
+    """Plan from a yt-dlp info dict (before or after download)"""
+    return plan(info.get('ext'), info.get('vcodec'), info.get('acodec'), target)
+
+
+def plan_for_file(path, info=None, target=TARGET_EXT):
+    """Plan for a downloaded file, probing it when yt-dlp did not report codecs"""
+    info = info or {}
+    vcodec, acodec = info.get('vcodec'), info.get('acodec')
+    if vcodec is None or acodec is None:
+        probed_v, probed_a = probe_codecs(path)
+        vcodec = probed_v if vcodec is None else vcodec
+        acodec = probed_a if acodec is None else acodec
+    return plan(os.path.splitext(path)[1].lstrip('.'), vcodec, acodec, target)
+
+
+def ffmpeg_command(src, dst, file_plan, threads=FFMPEG_THREADS):
+    target, video, audio = file_plan['target'], file_plan['video'], file_plan['audio']
+    cmd = [FFMPEG_BIN, '-y', '-nostdin', '-loglevel', 'error', '-i', src]
+    if video:
+        cmd += ['-map', '0:v:0?'] + (VIDEO_ENCODE_ARGS if video == 'encode' else ['-c:v', 'copy'])
+    else:
+        cmd += ['-vn']
+    if audio:
+        cmd += ['-map', '0:a:0?'] + (AUDIO_ENCODE_ARGS[target] if audio == 'encode' else ['-c:a', 'copy'])
+    else:
+        cmd += ['-an']
+    cmd += ['-threads', str(threads)]
+    if target == TARGET_EXT:
+        cmd += ['-movflags', '+faststart']
+    cmd += ['-f', target, dst]
+    return cmd
+
+
+def run_ffmpeg(cmd):
+    """Run an ffmpeg command, raising PostprocessError with its last stderr line"""
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        message = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise PostprocessError(message[-1] if message else f'ffmpeg exit {result.returncode}')
+
+
+def apply(path, file_plan, threads=FFMPEG_THREADS):
+    """Run the planned step on path; return the path of the final file"""
+    if file_plan['action'] == NONE:
+        return path
+
+    base = os.path.splitext(path)[0]
+    final_path = f"{base}.{file_plan['target']}"
+    tmp_path = f"{base}.pp.{file_plan['target']}"
+    try:
+        try:
+            run_ffmpeg(ffmpeg_command(path, tmp_path, file_plan, threads))
+        except PostprocessError:
+            if file_plan['action'] != REMUX:
+                raise
+            # Codec ternyata tidak cocok untuk stream copy: transcode penuh
+            logger.info("Remux of %s failed, falling back to transcode", path)
+            file_plan.update(action=TRANSCODE, reason='remux gagal',
+                             video=file_plan['video'] and 'encode',
+                             audio=file_plan['audio'] and 'encode')
+            run_ffmpeg(ffmpeg_command(path, tmp_path, file_plan, threads))
+        os.replace(tmp_path, final_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if final_path != path and os.path.exists(path):
+        os.remove(path)
+    return final_path
+
+
+class PostprocessPool:
+    """Bounded ffmpeg stage shared by all download workers
+
+    At most `workers` ffmpeg processes run at once, each limited to
+    `threads` threads. Waiting files are served shortest clip first;
+    remuxes (stream copy) go ahead of any transcode.
+    """
+
+    def __init__(self, workers=POSTPROCESS_WORKERS, threads=FFMPEG_THREADS,
+                 max_queue=POSTPROCESS_MAX_QUEUE):
+        self.workers = workers
+        self.threads = threads
+        self.max_queue = max_queue
+        self._waiting = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.completed = 0
+        self.failed = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.encode_time_total = 0.0
+        self.by_action = {}
+
+    def run(self, path, file_plan, duration=None, on_start=None):
+        """Wait for a free slot, then apply file_plan; return the final path
+
+        on_start() is called once the slot is acquired, just before ffmpeg runs.
+        Queue wait and encode time are added to file_plan.
+        """
+        if file_plan['action'] == NONE:
+            return path
+
+        priority = 0 if file_plan['action'] == REMUX else (duration or float('inf'))
+        return self.execute(lambda: apply(path, file_plan, self.threads), file_plan,
+                            priority, on_start)
+
+    def execute(self, fn, record, priority=float('inf'), on_start=None):
+        """Run fn() (an ffmpeg step) in a free slot and return its result
+
+        Lower priority runs first. record['action'] is counted in the stats
+        once fn() returns; 'queue_wait' and 'encode_time' are added to record.
+        """
+        ticket = (priority, next(self._seq))
+        queued_at = time.time()
+        with self._changed:
+            heapq.heappush(self._waiting, ticket)
+            self._changed.wait_for(
+                lambda: self._running < self.workers and self._waiting[0] == ticket
+            )
+            heapq.heappop(self._waiting)
+            self._running += 1
+            # Slot lain mungkin masih kosong untuk antrian berikutnya
+            self._changed.notify_all()
+
+        started = time.time()
+        ok = False
+        try:
+            if on_start is not None:
+                on_start()
+            result = fn()
+            ok = True
+            return result
+        finally:
+            finished = time.time()
+            record['queue_wait'] = round(started - queued_at, 3)
+            record['encode_time'] = round(finished - started, 3)
+            with self._changed:
+                self._running -= 1
+                self.completed += ok
+                self.failed += not ok
+                self.queue_wait_total += started - queued_at
+                self.queue_wait_max = max(self.queue_wait_max, started - queued_at)
+                self.encode_time_total += finished - started
+                action = record['action']
+                self.by_action[action] = self.by_action.get(action, 0) + 1
+                self._changed.notify_all()
+
+    def saturated(self):
+        """True when max_queue steps are already waiting for a slot
+
+        Steps that are queued always run; this is checked before accepting
+        new work that will need ffmpeg.
+        """
+        with self._lock:
+            return len(self._waiting) >= self.max_queue
+
+    def retry_after(self):
+        """Rough seconds until the current queue has drained one worker's share"""
+        with self._lock:
+            runs = self.completed + self.failed
+            if not runs:
+                return None
+            return (len(self._waiting) + 1) / self.workers * (self.encode_time_total / runs)
+
+    def queue_stats(self):
+        """Queue fields in the shape of admission.Stage.stats()"""
+        with self._lock:
+            runs = self.completed + self.failed
+            return {
+                'limit': self.workers,
+                'active': self._running,
+                'waiting': len(self._waiting),
+                'max_queue': self.max_queue,
+                'avg_wait': round(self.queue_wait_total / runs, 3) if runs else None,
+                'max_wait': round(self.queue_wait_max, 3),
+                'avg_service_time': round(self.encode_time_total / runs, 3) if runs else None,
+            }
+
+    def stats(self):
+        with self._lock:
+            runs = self.completed + self.failed
+            return {
+                'workers': self.workers,
+                'threads_per_job': self.threads,
+                'preset': TRANSCODE_PRESET,
+                'running': self._running,
+                'queued': len(self._waiting),
+                'max_queue': self.max_queue,
+                'completed': self.completed,
+                'failed': self.failed,
+                'by_action': dict(self.by_action),
+                'avg_queue_wait': round(self.queue_wait_total / runs, 3) if runs else None,
+                'max_queue_wait': round(self.queue_wait_max, 3),
+                'avg_encode_time': round(self.encode_time_total / runs, 3) if runs else None,
+            }
@@ -0,0 +1,233 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# ============================================
+# ON-DEMAND PROFILER (STACK SAMPLING / CPROFILE)
+# ============================================
+
+PROFILER_ENABLED = os.environ.get('PROFILER', '0') == '1'  # /api/profile hanya aktif jika diizinkan
+PROFILE_MAX_SECONDS = 300
+PROFILE_MAX_REQUESTS = 1000
+SAMPLE_INTERVAL = 0.01  # detik antar sampel stack
+STACK_DEPTH = 64
+
+SAMPLING = 'sampling'
+CPROFILE = 'cprofile'
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profiling session is already running"""
+
+
+class SamplingSession:
+    """Samples the stacks of all threads every `interval` seconds (like py-spy)
+
+    Stacks are aggregated as collapsed stacks ("a;b;c count"), the input
+    format of flamegraph.pl and speedscope. Only the sampler thread does
+    work; the sampled threads are not slowed down beyond the GIL hand-off.
+    """
+
+    mode = SAMPLING
+
+    def __init__(self, seconds, interval=SAMPLE_INTERVAL):
+        self.seconds = seconds
+        self.interval = interval
+        self.started = time.time()
+        self.finished = None
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self.finished is None
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(_thread_group(names.get(ident, str(ident))))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self.finished = time.time()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def result(self, format='collapsed'):
+        """(data, mimetype, filename) of the samples so far"""
+        if format != 'collapsed':
+            raise ValueError("Format hasil sampling harus 'collapsed'")
+        stacks = dict(self.stacks)  # sampler bisa masih menambah stack baru
+        lines = [f'{stack} {count}' for stack, count in sorted(stacks.items(), key=lambda item: -item[1])]
+        return '\n'.join(lines) + '\n', 'text/plain', 'profile.collapsed.txt'
+
+    def status(self):
+        return {
+            'mode': self.mode,
+            'running': self.running,
+            'started': self.started,
+            'finished': self.finished,
+            'seconds': self.seconds,
+            'interval': self.interval,
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+        }
+
+
+def _thread_group(name):
+    # Thread pool menamai thread "download_0", "batch-info_3", ...: digabung per pool
+    return name.rsplit('_', 1)[0] if name.rsplit('_', 1)[-1].isdigit() else name
+
+
+class CProfileSession:
+    """Deterministic profile (cProfile) of the next `requests` matching requests
+
+    Each request gets its own cProfile.Profile in its own thread (cProfile
+    only sees the thread that enabled it); finished profiles are merged
+    into one pstats.Stats. Work a request hands to other threads (download
+    jobs) is not included. On Python 3.12+ only one profile can be active
+    per process, so concurrent requests are skipped, not queued.
+    """
+
+    mode = CPROFILE
+
+    def __init__(self, requests, endpoint=None):
+        self.requests = requests
+        self.endpoint = endpoint
+        self.started = time.time()
+        self.finished = None
+        self.claimed = 0
+        self.profiled = 0
+        self._stats = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.finished is None
+
+    def claim(self, path):
+        """A Profile for a request to `path`, or None if it is not to be profiled"""
+        if self.endpoint and not path.startswith(self.endpoint):
+            return None
+        with self._lock:
+            if self.finished is not None or self.claimed >= self.requests:
+                return None
+            self.claimed += 1
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Profiler lain sudah aktif (Python 3.12+: hanya satu per proses)
+            with self._lock:
+                self.claimed -= 1
+            return None
+        return profile
+
+    def add(self, profile):
+        profile.disable()
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.profiled += 1
+            if self.profiled >= self.requests:
+                self.finished = time.time()
+
+    def stop(self):
+        with self._lock:
+            if self.finished is None:
+                self.finished = time.time()
+
+    def result(self, format='text'):
+        with self._lock:
+            stats = self._stats
+            if stats is None:
+                return None
+            if format == 'prof':
+                # Format file pstats (snakeviz, pstats.Stats(path))
+                return marshal.dumps(stats.stats), 'application/octet-stream', 'profile.prof'
+            if format != 'text':
+                raise ValueError("Format hasil cProfile harus 'text' atau 'prof'")
+            out = io.StringIO()
+            report = pstats.Stats(stream=out)
+            report.add(stats)  # salinan: sort_stats() tidak mengubah hasil gabungan
+            report.sort_stats('cumulative').print_stats(100)
+            return out.getvalue(), 'text/plain', 'profile.txt'
+
+    def status(self):
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'running': self.running,
+                'started': self.started,
+                'finished': self.finished,
+                'requests': self.requests,
+                'endpoint': self.endpoint,
+                'profiled': self.profiled,
+            }
+
+
+class Profiler:
+    """One profiling session at a time, started from /api/profile"""
+
+    def __init__(self):
+        self.session = None
+        self._lock = threading.Lock()
+
+    def start(self, mode, seconds=10, interval=SAMPLE_INTERVAL, requests=10, endpoint=None):
+        if mode not in (SAMPLING, CPROFILE):
+            raise ValueError("mode harus 'sampling' atau 'cprofile'")
+        with self._lock:
+            if self.session is not None and self.session.running:
+                raise ProfilerBusy('Profiling lain sedang berjalan')
+            if mode == SAMPLING:
+                if not 0 < seconds <= PROFILE_MAX_SECONDS:
+                    raise ValueError(f'seconds harus antara 1 dan {PROFILE_MAX_SECONDS}')
+                if not 0.001 <= interval <= 1:
+                    raise ValueError('interval harus antara 0.001 dan 1 detik')
+                self.session = SamplingSession(seconds, interval)
+            else:
+                if not 0 < requests <= PROFILE_MAX_REQUESTS:
+                    raise ValueError(f'requests harus antara 1 dan {PROFILE_MAX_REQUESTS}')
+                self.session = CProfileSession(requests, endpoint)
+            return self.session
+
+    def stop(self):
+        session = self.session
+        if session is not None:
+            session.stop()
+        return session
+
+    def request_started(self, path):
+        """(session, profile) when a cProfile session wants this request, else None"""
+        session = self.session
+        if session is None or session.mode != CPROFILE or not session.running:
+            return None
+        profile = session.claim(path)
+        return (session, profile) if profile is not None else None
+
+    def status(self):
+        session = self.session
+        return session.status() if session is not None else None
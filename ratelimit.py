@@ -0,0 +1,546 @@
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import unquote, urlsplit
+
+# ============================================
+# RATE LIMITING
+# ============================================
+
+RATE_LIMIT_WINDOW = 60  # seconds
+MAX_REQUESTS_PER_WINDOW = 10  # max requests per IP in window
+MAX_REQUESTS_PER_HOUR = 50  # max requests per IP per hour
+DOWNLOAD_LIMIT_PER_HOUR = 20  # max downloads per IP per hour
+BLOCK_DURATION = int(os.environ.get('BLOCK_DURATION', 300))  # 5 minutes block for abusers
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 200000))  # batas memori counter
+
+# Endpoint dengan budget masing-masing
+INFO = 'info'
+DOWNLOAD = 'download'
+FILE = 'file'
+
+Limit = namedtuple('Limit', 'count window')
+
+
+def parse_limits(spec):
+    """'10/60,50/3600' -> (Limit(10, 60), Limit(50, 3600)), shortest window first"""
+    limits = []
+    for part in spec.split(','):
+        if part.strip():
+            count, window = part.split('/')
+            limits.append(Limit(float(count), int(window)))
+    return tuple(sorted(limits, key=lambda limit: limit.window))
+
+
+ENDPOINT_LIMITS = {
+    INFO: parse_limits(os.environ.get(
+        'RATE_LIMIT_INFO', f'{MAX_REQUESTS_PER_WINDOW}/{RATE_LIMIT_WINDOW},{MAX_REQUESTS_PER_HOUR}/3600')),
+    DOWNLOAD: parse_limits(os.environ.get(
+        'RATE_LIMIT_DOWNLOAD', f'{MAX_REQUESTS_PER_WINDOW}/{RATE_LIMIT_WINDOW},{DOWNLOAD_LIMIT_PER_HOUR}/3600')),
+    # Player video mengirim banyak Range request untuk satu file
+    FILE: parse_limits(os.environ.get('RATE_LIMIT_FILE', '120/60')),
+}
+# Melewati batas jendela terpendek di endpoint ini = diblokir BLOCK_DURATION.
+# Yang dihitung jumlah request, bukan cost: request mahal yang melebihi budget cukup 429.
+BLOCKING_ENDPOINTS = {INFO, DOWNLOAD}
+
+# Budget seluruh server (semua IP), dalam unit cost yang sama dengan budget per IP
+GLOBAL_CLIENT = '*'
+GLOBAL_LIMITS = {
+    INFO: parse_limits(os.environ.get('RATE_LIMIT_GLOBAL_INFO', '600/60')),
+    DOWNLOAD: parse_limits(os.environ.get('RATE_LIMIT_GLOBAL_DOWNLOAD', '120/60')),
+}
+
+CLIENT = 'client'
+GLOBAL = 'global'
+
+Decision = namedtuple('Decision', 'allowed retry_after blocked limit remaining scope',
+                      defaults=(CLIENT,))
+
+logger = logging.getLogger(__name__)
+
+
+class StateError(Exception):
+    """Raised when a shared state backend cannot be reached"""
+
+
+class MemoryState:
+    """In-process counters and blocks with per-key TTL
+
+    Keys with the same TTL expire in insertion order, so each TTL gets its
+    own FIFO queue and expired keys are dropped from the queue heads in
+    O(1) per key. At most max_keys keys are kept; beyond that the oldest
+    counters of the shortest TTL are dropped first. Blocks have their own
+    queues and are only dropped once no counter is left, so key pressure
+    does not unblock an abusive client.
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.evicted = 0
+        self._entries = {}  # key -> [value, expires_at, (is_block, ttl)]
+        self._queues = {}  # (is_block, ttl) -> OrderedDict of keys in expiry order
+        self._lock = threading.Lock()
+
+    def incr(self, key, amount, ttl):
+        """Add amount to a counter (created with the given TTL); return the new value"""
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                self._insert(key, 0, now + ttl, ttl)
+                entry = self._entries[key]
+            entry[0] += amount
+            return entry[0]
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            values = []
+            for key in keys:
+                entry = self._entries.get(key)
+                values.append(entry[0] if entry is not None and entry[1] > now else 0)
+            return values
+
+    def block(self, key, ttl):
+        with self._lock:
+            self._sweep(time.time())
+            self._insert(key, 1, time.time() + ttl, ttl, block=True)
+
+    def blocked_for(self, key):
+        """Seconds left on a block, 0 if the key is not blocked"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return max(0.0, entry[1] - time.time()) if entry is not None else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'keys': len(self._entries), 'evicted': self.evicted}
+
+    def _insert(self, key, value, expires_at, ttl, block=False):
+        # Dipanggil dengan self._lock terkunci
+        old = self._entries.get(key)
+        if old is not None:
+            self._queues[old[2]].pop(key, None)
+        queue_key = (block, ttl)
+        self._entries[key] = [value, expires_at, queue_key]
+        self._queues.setdefault(queue_key, OrderedDict())[key] = None
+
+    def _sweep(self, now):
+        # Dipanggil dengan self._lock terkunci
+        for queue in self._queues.values():
+            while queue:
+                key = next(iter(queue))
+                if self._entries[key][1] > now:
+                    break
+                queue.popitem(last=False)
+                del self._entries[key]
+        # (False, ttl) < (True, ttl): semua counter habis dulu sebelum block
+        for queue_key in sorted(self._queues):
+            queue = self._queues[queue_key]
+            while queue and len(self._entries) >= self.max_keys:
+                key, _ = queue.popitem(last=False)
+                del self._entries[key]
+                self.evicted += 1
+
+
+class SQLiteState:
+    """Counters and blocks in a SQLite file, shared by every worker on one host
+
+    Each increment is one upsert inside BEGIN IMMEDIATE, so concurrent
+    processes never lose an update. Expired rows are deleted at most once
+    per sweep_interval seconds.
+    """
+
+    def __init__(self, path, sweep_interval=10):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS limits ('
+            ' key TEXT PRIMARY KEY,'
+            ' value REAL NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS limits_expires_at ON limits (expires_at)'
+        )
+
+    def incr(self, key, amount, ttl):
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    self._conn.execute(
+                        'INSERT INTO limits (key, value, expires_at) VALUES (?, ?, ?)'
+                        ' ON CONFLICT (key) DO UPDATE SET'
+                        '  value = CASE WHEN expires_at <= ? THEN excluded.value'
+                        '          ELSE value + excluded.value END,'
+                        '  expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at'
+                        '               ELSE expires_at END',
+                        (key, amount, now + ttl, now, now)
+                    )
+                    value = self._conn.execute(
+                        'SELECT value FROM limits WHERE key = ?', (key,)
+                    ).fetchone()[0]
+                    if now >= self._next_sweep:
+                        self._next_sweep = now + self.sweep_interval
+                        self._conn.execute('DELETE FROM limits WHERE expires_at <= ?', (now,))
+                    self._conn.execute('COMMIT')
+                except BaseException:
+                    self._conn.execute('ROLLBACK')
+                    raise
+            except sqlite3.Error as e:
+                raise StateError(str(e))
+        return value
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            try:
+                rows = dict(self._conn.execute(
+                    f'SELECT key, value FROM limits WHERE expires_at > ?'
+                    f' AND key IN ({",".join("?" * len(keys))})',
+                    (now, *keys)
+                ).fetchall())
+            except sqlite3.Error as e:
+                raise StateError(str(e))
+        return [rows.get(key, 0) for key in keys]
+
+    def block(self, key, ttl):
+        with self._lock:
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO limits (key, value, expires_at) VALUES (?, 1, ?)',
+                    (key, time.time() + ttl)
+                )
+            except sqlite3.Error as e:
+                raise StateError(str(e))
+
+    def blocked_for(self, key):
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    'SELECT expires_at FROM limits WHERE key = ?', (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                raise StateError(str(e))
+        return max(0.0, row[0] - time.time()) if row else 0.0
+
+    def stats(self):
+        with self._lock:
+            keys = self._conn.execute('SELECT COUNT(*) FROM limits').fetchone()[0]
+        return {'backend': 'sqlite', 'path': self.path, 'keys': keys}
+
+
+class RedisState:
+    """Counters and blocks in Redis, shared by every worker on every host
+
+    Speaks RESP over a plain socket (no client library needed), so any
+    server implementing SET/INCRBYFLOAT/MGET/PTTL and MULTI/EXEC works.
+    Expiry is left to Redis: counters are created with SET NX PX inside
+    the same MULTI as their increment, blocks with SET PX.
+    """
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', prefix='vtmu:', timeout=1.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.url = f'redis://{self.host}:{self.port}/{self.db}'
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def incr(self, key, amount, ttl):
+        key = self.prefix + key
+        replies = self._call(
+            ('MULTI',),
+            ('SET', key, 0, 'PX', max(1, int(ttl * 1000)), 'NX'),
+            ('INCRBYFLOAT', key, amount),
+            ('EXEC',),
+        )
+        return float(replies[-1][1])
+
+    def get_many(self, keys):
+        values = self._call(('MGET', *[self.prefix + key for key in keys]))[0]
+        return [float(value) if value is not None else 0 for value in values]
+
+    def block(self, key, ttl):
+        self._call(('SET', self.prefix + key, 1, 'PX', max(1, int(ttl * 1000))))
+
+    def blocked_for(self, key):
+        ms = self._call(('PTTL', self.prefix + key))[0]
+        return ms / 1000 if ms > 0 else 0.0
+
+    def stats(self):
+        return {'backend': 'redis', 'url': self.url, 'connected': self._sock is not None}
+
+    def _call(self, *commands):
+        """Send commands as one pipeline and return their replies"""
+        payload = b''.join(self._encode(command) for command in commands)
+        with self._lock:
+            # Satu kali coba ulang: koneksi lama mungkin sudah ditutup server
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(payload)
+                    return [self._read() for _ in commands]
+                except (OSError, StateError) as e:
+                    self._close()
+                    if attempt == 2 or isinstance(e, StateError):
+                        raise StateError(f'Redis {self.url}: {e}')
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile('rb')
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            self._sock.sendall(b''.join(self._encode(command) for command in setup))
+            for _ in setup:
+                self._read()
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    @staticmethod
+    def _encode(command):
+        out = [b'*%d\r\n' % len(command)]
+        for arg in command:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(out)
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise OSError('connection closed')
+        kind, data = line[:1], line[1:-2]
+        if kind == b'+':
+            return data.decode()
+        if kind == b'-':
+            raise StateError(data.decode())
+        if kind == b':':
+            return int(data)
+        if kind == b'$':
+            size = int(data)
+            if size < 0:
+                return None
+            value = self._reader.read(size + 2)[:-2]
+            return value.decode()
+        if kind == b'*':
+            size = int(data)
+            return None if size < 0 else [self._read() for _ in range(size)]
+        raise StateError(f'unexpected reply {line!r}')
+
+
+def create_state(kind=None, path=None, url=None):
+    """Build a limiter state backend from arguments or RATE_LIMIT_* env variables"""
+    kind = kind or os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    if kind == 'sqlite':
+        return SQLiteState(path or os.environ.get('RATE_LIMIT_PATH', 'ratelimit.sqlite3'))
+    if kind == 'redis':
+        return RedisState(url or os.environ.get('RATE_LIMIT_REDIS_URL', 'redis://127.0.0.1:6379/0'))
+    return MemoryState()
+
+
+def retry_after(limit, previous, current, elapsed, cost):
+    """Seconds until `cost` more fits under a sliding-window estimate
+
+    The estimate is previous * (1 - elapsed / window) + current, so the
+    weight of the previous window decays linearly while the current one
+    counts in full until it becomes the previous window.
+    """
+    window = limit.window
+    if cost > limit.count:
+        return float(window)
+    room = limit.count - cost
+    if current <= room:
+        # Cukup menunggu bagian jendela sebelumnya meluruh
+        needed = 1 - (room - current) / previous if previous else 0
+        return max(0.0, needed * window - elapsed)
+    # Jendela sekarang sendiri sudah penuh: tunggu sampai ia jadi jendela sebelumnya
+    return (window - elapsed) + max(0.0, 1 - room / current) * window
+
+
+class RateLimiter:
+    """Sliding-window rate limits per client and endpoint
+
+    Each limit keeps two fixed-window counters per client (current and
+    previous window) and approximates a sliding window from them: constant
+    memory and constant work per request, however many requests a client
+    sends. Counters expire on their own two windows after they start.
+    """
+
+    def __init__(self, state=None, limits=None, global_limits=None, block_duration=BLOCK_DURATION):
+        self.state = state if state is not None else MemoryState()
+        self.limits = limits if limits is not None else ENDPOINT_LIMITS
+        self.global_limits = global_limits if global_limits is not None else GLOBAL_LIMITS
+        self.block_duration = block_duration
+        self.allowed = {}
+        self.denied = {}
+        self.blocks = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def hit(self, client, endpoint, cost=1):
+        """Charge cost to client's and the global budget for endpoint; return a Decision
+
+        A denied request is not charged. Going over the shortest window of
+        a blocking endpoint blocks the client for block_duration, but only
+        when the number of requests (not their cost) is over the limit;
+        running out of budget through expensive requests is a plain denial
+        with retry_after. Running out of the global budget is reported with
+        scope 'global'. If the state backend is unreachable the request is
+        allowed (fail open).
+        """
+        try:
+            decision = self._hit(client, endpoint, cost)
+        except StateError as e:
+            logger.warning("Rate limit state unavailable, allowing request: %s", e)
+            with self._lock:
+                self.errors += 1
+            decision = Decision(True, 0, False, None, None)
+        counter = self.allowed if decision.allowed else self.denied
+        with self._lock:
+            counter[endpoint] = counter.get(endpoint, 0) + 1
+        return decision
+
+    def max_cost(self, endpoint):
+        """Largest cost a single request to endpoint can ever be admitted with"""
+        counts = [limit.count for limit in self.limits.get(endpoint, ())]
+        counts += [limit.count for limit in self.global_limits.get(endpoint, ())]
+        return min(counts) if counts else float('inf')
+
+    def _hit(self, client, endpoint, cost):
+        block_key = f'block:{client}'
+        block_left = self.state.blocked_for(block_key)
+        if block_left > 0:
+            return Decision(False, block_left, True, None, 0)
+
+        decision, charged = self._charge(client, endpoint, self.limits.get(endpoint, ()), cost)
+        if not decision.allowed:
+            if decision.blocked and not self._over_request_count(client, endpoint, decision.limit):
+                # Budget habis karena bobot request, bukan karena jumlah request
+                decision = decision._replace(blocked=False)
+            if decision.blocked:
+                self.state.block(block_key, self.block_duration)
+                with self._lock:
+                    self.blocks += 1
+                decision = decision._replace(retry_after=max(decision.retry_after, self.block_duration))
+            return decision
+
+        overall, _ = self._charge(GLOBAL_CLIENT, endpoint, self.global_limits.get(endpoint, ()), cost)
+        if not overall.allowed:
+            # Server penuh: jatah IP ini tidak ikut terpakai
+            for key, ttl in charged:
+                self.state.incr(key, -cost, ttl)
+            return overall._replace(blocked=False, scope=GLOBAL)
+        if endpoint in BLOCKING_ENDPOINTS and decision.limit is not None:
+            current_key, _, _ = self._request_count_keys(client, endpoint)
+            self.state.incr(current_key, 1, self.limits[endpoint][0].window * 2)
+        return decision
+
+    def _request_count_keys(self, client, endpoint):
+        """(current key, previous key, offset) of the unweighted request counter
+
+        Kept for the shortest window of blocking endpoints only, next to
+        the cost-weighted counters.
+        """
+        window = self.limits[endpoint][0].window
+        index, offset = divmod(time.time(), window)
+        prefix = f'rq:{endpoint}:{window}:{client}:'
+        return prefix + str(int(index)), prefix + str(int(index) - 1), offset
+
+    def _over_request_count(self, client, endpoint, limit):
+        """True if this request would be over limit counting every request as 1"""
+        current_key, previous_key, offset = self._request_count_keys(client, endpoint)
+        current, previous = self.state.get_many([current_key, previous_key])
+        return previous * (1 - offset / limit.window) + current + 1 > limit.count
+
+    def _charge(self, client, endpoint, limits, cost):
+        """Charge every limit or none; return (decision, [(key, ttl)] charged)"""
+        if not limits:
+            return Decision(True, 0, False, None, None), []
+
+        now = time.time()
+        windows = []
+        for limit in limits:
+            index, offset = divmod(now, limit.window)
+            prefix = f'rl:{endpoint}:{limit.window}:{client}:'
+            windows.append((limit, offset, prefix + str(int(index)), prefix + str(int(index) - 1)))
+        previous_counts = self.state.get_many([previous_key for *_, previous_key in windows])
+
+        charged = []
+        decision = None
+        for number, ((limit, offset, current_key, _), previous) in enumerate(zip(windows, previous_counts)):
+            # Naikkan dulu (atomik), batalkan kalau ternyata melewati batas
+            current = self.state.incr(current_key, cost, limit.window * 2)
+            charged.append((current_key, limit.window * 2))
+            estimate = previous * (1 - offset / limit.window) + current
+            if estimate > limit.count:
+                for key, ttl in charged:
+                    self.state.incr(key, -cost, ttl)
+                wait = retry_after(limit, previous, current - cost, offset, cost)
+                blocked = number == 0 and endpoint in BLOCKING_ENDPOINTS
+                return Decision(False, wait, blocked, limit, 0), []
+            if decision is None or limit.count - estimate < decision.remaining:
+                decision = Decision(True, 0, False, limit, limit.count - estimate)
+        return decision, charged
+
+    def stats(self):
+        with self._lock:
+            data = {
+                'limits': {
+                    endpoint: [f'{limit.count:g}/{limit.window}s' for limit in limits]
+                    for endpoint, limits in self.limits.items()
+                },
+                'global_limits': {
+                    endpoint: [f'{limit.count:g}/{limit.window}s' for limit in limits]
+                    for endpoint, limits in self.global_limits.items()
+                },
+            }
+        data.update(self.counts())
+        data['state'] = self.state.stats()
+        return data
+
+    def counts(self):
+        """Decision counters only (stats() also queries the state backend)"""
+        with self._lock:
+            return {
+                'allowed': dict(self.allowed),
+                'denied': dict(self.denied),
+                'blocks': self.blocks,
+                'state_errors': self.errors,
+            }
+
+
+def retry_after_header(seconds):
+    """Retry-After value: whole seconds, rounded up, at least 1"""
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,291 @@
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import yt_dlp
+from yt_dlp.extractor.tiktok import TikTokIE
+from yt_dlp.networking import Request
+from yt_dlp.utils import ExtractorError
+
+import jobs
+import postprocess
+
+# ============================================
+# TIKTOK PHOTO SLIDESHOWS
+# ============================================
+
+SLIDESHOW_FETCH_WORKERS = int(os.environ.get('SLIDESHOW_FETCH_WORKERS', 6))  # gambar diunduh bersamaan
+SLIDE_SECONDS = float(os.environ.get('SLIDE_SECONDS', 3))  # durasi tiap foto di video
+SLIDESHOW_WIDTH = 1080
+SLIDESHOW_HEIGHT = 1920
+SLIDESHOW_FPS = 30
+FETCH_CHUNK_SIZE = 64 * 1024
+
+# Hasil yang bisa dibuat dari satu slideshow
+VIDEO = 'video'
+IMAGES = 'images'
+AUDIO = 'audio'
+KIND_EXT = {VIDEO: postprocess.TARGET_EXT, IMAGES: 'zip', AUDIO: postprocess.AUDIO_EXT}
+
+RENDER = 'render'
+
+PHOTO_URL_RE = re.compile(r'tiktok\.com/@(?P<user>[^/?#]+)/photo/(?P<id>\d+)')
+# Header gambar/musik TikTok menolak request tanpa Referer
+FETCH_HEADERS = {'Referer': 'https://www.tiktok.com/'}
+# Opsi jaringan yang disalin ke YoutubeDL milik tiap thread fetch
+FETCH_PARAMS = ('proxy', 'source_address', 'socket_timeout', 'nocheckcertificate', 'logger', 'quiet',
+                'no_warnings')
+
+logger = logging.getLogger(__name__)
+
+
+class SlideshowError(Exception):
+    """Raised when a TikTok photo post cannot be turned into a download"""
+
+
+def is_photo_url(url):
+    return bool(url) and PHOTO_URL_RE.search(url) is not None
+
+
+def render_signature():
+    """Settings that change the rendered video; part of its store key"""
+    return (f'{SLIDESHOW_WIDTH}x{SLIDESHOW_HEIGHT}@{SLIDESHOW_FPS}/{SLIDE_SECONDS}s/'
+            f'{postprocess.TRANSCODE_PRESET}')
+
+
+def _image_url(image):
+    urls = (image.get('imageURL') or {}).get('urlList') or []
+    # Varian JPEG lebih aman untuk ffmpeg dan penampil gambar daripada HEIC
+    for url in urls:
+        if '.jpeg' in url or '.jpg' in url:
+            return url
+    return urls[0] if urls else None
+
+
+class TikTokPhotoIE(TikTokIE):
+    """Photo posts, which yt-dlp's TikTok extractor does not match
+
+    Uses the TikTok extractor's webpage helper (same headers, cookies and
+    challenge handling) and returns the image and music URLs in
+    `slideshow_images` / `slideshow_audio_url`.
+    """
+    IE_NAME = 'tiktok:photo'
+    _VALID_URL = r'https?://(?:www\.)?tiktok\.com/@(?P<user_id>[\w.-]+)/photo/(?P<id>\d+)'
+    _TESTS = []
+
+    def _real_extract(self, url):
+        user_id, post_id = self._match_valid_url(url).group('user_id', 'id')
+        url = f'https://www.tiktok.com/@{user_id}/photo/{post_id}'
+        item, status = self._extract_web_data_and_status(url, post_id)
+        if status in (10216, 10222):
+            self.raise_login_required('Slideshow ini privat. Login dengan akun yang punya akses')
+        if status != 0 or not item:
+            raise ExtractorError(
+                f'Slideshow tidak tersedia (status {status}). Post mungkin privat atau sudah dihapus.',
+                video_id=post_id, expected=True)
+
+        images = [_image_url(image) for image in (item.get('imagePost') or {}).get('images') or []]
+        author = item.get('author') or {}
+        return {
+            'id': post_id,
+            'webpage_url': url,
+            'title': item.get('desc') or f'TikTok {post_id}',
+            'uploader': author.get('uniqueId') or user_id,
+            'view_count': (item.get('stats') or {}).get('playCount') or 0,
+            'slideshow_images': [image for image in images if image],
+            'slideshow_audio_url': (item.get('music') or {}).get('playUrl') or None,
+        }
+
+
+def extract(ydl, url):
+    """Read image and music URLs of a TikTok photo post through ydl.extract_info"""
+    if not is_photo_url(url):
+        raise SlideshowError('URL bukan slideshow foto TikTok')
+
+    # Instance baru tiap kali: extractor terikat ke satu YoutubeDL
+    ydl.add_info_extractor(TikTokPhotoIE())
+    info = ydl.extract_info(url, download=False, ie_key=TikTokPhotoIE.ie_key(), process=False)
+    if not info:
+        raise SlideshowError('Slideshow tidak tersedia')
+
+    images = info.get('slideshow_images') or []
+    if not images:
+        raise SlideshowError('Post ini tidak berisi foto')
+    return {
+        'id': info['id'],
+        'url': info['webpage_url'],
+        'title': info['title'],
+        'uploader': info['uploader'],
+        'view_count': info['view_count'],
+        'images': images,
+        'audio_url': info.get('slideshow_audio_url'),
+        'duration': round(len(images) * SLIDE_SECONDS, 3),
+    }
+
+
+def fetch(ydl, url, path, progress_hook=None):
+    """Download one URL through ydl's HTTP stack; return the path with a proper extension"""
+    with ydl.urlopen(Request(url, headers=FETCH_HEADERS)) as response:
+        content_type = (response.headers.get('Content-Type') or '').split(';')[0].strip()
+        ext = mimetypes.guess_extension(content_type) or os.path.splitext(path)[1]
+        if ext and not path.endswith(ext):
+            path = os.path.splitext(path)[0] + ext
+        total = int(response.headers.get('Content-Length') or 0)
+        done = 0
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: response.read(FETCH_CHUNK_SIZE), b''):
+                f.write(chunk)
+                done += len(chunk)
+                if progress_hook is not None:
+                    progress_hook({'status': 'downloading', 'filename': path,
+                                   'downloaded_bytes': done, 'total_bytes': total or None})
+    if progress_hook is not None:
+        progress_hook({'status': 'finished', 'filename': path, 'total_bytes': done})
+    return path
+
+
+def fetch_all(ydl, data, work_dir, with_images=True, with_audio=True, progress_hook=None,
+              workers=SLIDESHOW_FETCH_WORKERS):
+    """Fetch images (in order) and music concurrently; return (image_paths, audio_path)
+
+    YoutubeDL is not thread-safe, so every fetch thread opens its own
+    instance with ydl's network options; connections still come from the
+    shared pools in httppool.
+    """
+    tasks = []
+    if with_images:
+        tasks += [(url, os.path.join(work_dir, f'{i:02d}.jpg'))
+                  for i, url in enumerate(data['images'], 1)]
+    if with_audio and data.get('audio_url'):
+        # Tanpa ekstensi kecuali Content-Type jelas: planner lalu memeriksa isinya
+        tasks.append((data['audio_url'], os.path.join(work_dir, 'audio')))
+
+    params = {key: ydl.params[key] for key in FETCH_PARAMS if key in ydl.params}
+    local = threading.local()
+    opened = []
+    opened_lock = threading.Lock()
+
+    def fetch_task(task):
+        thread_ydl = getattr(local, 'ydl', None)
+        if thread_ydl is None:
+            thread_ydl = local.ydl = yt_dlp.YoutubeDL(params)
+            with opened_lock:
+                opened.append(thread_ydl)
+        return fetch(thread_ydl, task[0], task[1], progress_hook)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tasks))),
+                                thread_name_prefix='slideshow-fetch') as executor:
+            paths = list(executor.map(fetch_task, tasks))
+    finally:
+        for thread_ydl in opened:
+            thread_ydl.close()
+
+    if with_audio and data.get('audio_url'):
+        return paths[:-1], paths[-1]
+    return paths, None
+
+
+def render_command(image_paths, audio_path, dst, seconds=SLIDE_SECONDS,
+                   threads=postprocess.FFMPEG_THREADS):
+    """ffmpeg command that shows each image for `seconds` over the music
+
+    Every image is scaled and letterboxed to the same portrait frame so the
+    output only depends on the inputs and the settings in render_signature().
+    """
+    w, h, fps = SLIDESHOW_WIDTH, SLIDESHOW_HEIGHT, SLIDESHOW_FPS
+    cmd = [postprocess.FFMPEG_BIN, '-y', '-nostdin', '-loglevel', 'error']
+    for path in image_paths:
+        cmd += ['-loop', '1', '-framerate', str(fps), '-t', str(seconds), '-i', path]
+    if audio_path:
+        cmd += ['-i', audio_path]
+
+    count = len(image_paths)
+    filters = [
+        f'[{i}:v]scale={w}:{h}:force_original_aspect_ratio=decrease,'
+        f'pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps}[v{i}]'
+        for i in range(count)
+    ]
+    filters.append(''.join(f'[v{i}]' for i in range(count)) + f'concat=n={count}:v=1:a=0[v]')
+    cmd += ['-filter_complex', ';'.join(filters), '-map', '[v]'] + postprocess.VIDEO_ENCODE_ARGS
+    if audio_path:
+        cmd += ['-map', f'{count}:a:0'] + postprocess.AUDIO_ENCODE_ARGS[postprocess.TARGET_EXT]
+    cmd += ['-t', str(round(count * seconds, 3)), '-threads', str(threads),
+            '-map_metadata', '-1', '-fflags', '+bitexact', '-flags:v', '+bitexact',
+            '-movflags', '+faststart', '-f', postprocess.TARGET_EXT, dst]
+    return cmd
+
+
+def write_zip(image_paths, dst):
+    """Images as a ZIP without compression (JPEGs are already compressed)"""
+    with zipfile.ZipFile(dst, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for path in image_paths:
+            # Tanggal tetap supaya isi ZIP sama untuk post yang sama
+            info = zipfile.ZipInfo(os.path.basename(path), date_time=(1980, 1, 1, 0, 0, 0))
+            with open(path, 'rb') as src, archive.open(info, 'w') as out:
+                shutil.copyfileobj(src, out)
+
+
+def build(ydl, data, kind, base_path, pool=None, progress_hook=None, on_phase=None):
+    """Produce the slideshow download of `kind` at base_path.<ext>
+
+    Images and music are fetched once, concurrently, into a scratch folder
+    next to the output; ffmpeg steps run in `pool` (a PostprocessPool)
+    when given. Returns (path, record) where record describes the ffmpeg
+    step like a postprocess plan, or None for an image ZIP.
+    """
+    def phase(name):
+        if on_phase is not None:
+            on_phase(name)
+
+    def run(fn, record):
+        if pool is None:
+            return fn()
+        phase(jobs.PP_QUEUED)
+        return pool.execute(fn, record, priority=data['duration'],
+                            on_start=lambda: phase('converting'))
+
+    final_path = f'{base_path}.{KIND_EXT[kind]}'
+    work_dir = f'{base_path}.parts'
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        phase('downloading')
+        if kind == AUDIO:
+            if not data.get('audio_url'):
+                raise SlideshowError('Slideshow ini tidak memiliki musik')
+            _, audio_path = fetch_all(ydl, data, work_dir, with_images=False,
+                                      progress_hook=progress_hook)
+            record = postprocess.plan_for_file(audio_path, target=postprocess.AUDIO_EXT)
+            if record['action'] != postprocess.NONE:
+                audio_path = run(lambda: postprocess.apply(audio_path, record), record)
+            os.replace(audio_path, final_path)
+            return final_path, record
+
+        image_paths, audio_path = fetch_all(ydl, data, work_dir, with_audio=kind == VIDEO,
+                                            progress_hook=progress_hook)
+        tmp_path = os.path.join(work_dir, f'output.{KIND_EXT[kind]}')
+        if kind == IMAGES:
+            phase('processing')
+            write_zip(image_paths, tmp_path)
+            os.replace(tmp_path, final_path)
+            return final_path, None
+
+        record = {
+            'action': RENDER,
+            'video': 'encode',
+            'audio': 'encode' if audio_path else None,
+            'target': postprocess.TARGET_EXT,
+            'reason': f'slideshow {len(image_paths)} foto',
+        }
+        threads = pool.threads if pool is not None else postprocess.FFMPEG_THREADS
+        cmd = render_command(image_paths, audio_path, tmp_path, threads=threads)
+        run(lambda: postprocess.run_ffmpeg(cmd), record)
+        os.replace(tmp_path, final_path)
+        return final_path, record
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -14,6 +14,7 @@ const formatList = document.getElementById('formatList');
 const downloadProgress = document.getElementById('downloadProgress');
 
 let currentVideoUrl = '';
+let currentInfoToken = '';
 
 // Event Listeners
 getInfoBtn.addEventListener('click', getVideoInfo);
@@ -89,6 +90,9 @@ async function getVideoInfo() {
 
 // Display Video Info
 function displayVideoInfo(data) {
+    // Token info dari server, dipakai ulang saat download
+    currentInfoToken = data.info_token || '';
+
     // Set thumbnail and details
     videoThumbnail.src = data.thumbnail;
     videoTitle.textContent = data.title;
@@ -193,11 +197,13 @@ async function downloadVideo(quality, format_id, event) {
         url: currentVideoUrl,
         quality: quality,
         format_id: format_id,
+        info_token: currentInfoToken,
         video_title: videoTitle.textContent,
         thumbnail: videoThumbnail.src
     };
 
     sessionStorage.setItem('downloadData', JSON.stringify(downloadData));
+    sessionStorage.removeItem('downloadJobId');
 
     // Redirect to download page
     showToast('Redirecting ke halaman download...', 'success');
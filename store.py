@@ -0,0 +1,628 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: journal tetap dipakai, hanya tanpa file lock
+    fcntl = None
+
+# ============================================
+# DEDUPLICATED DOWNLOAD STORE
+# ============================================
+
+INDEX_FILENAME = '.store_index.json'
+JOURNAL_SUFFIX = '.journal'
+LOCK_SUFFIX = '.lock'
+# Journal dilipat ke snapshot setelah sebanyak ini record (minimal)
+COMPACT_MIN_RECORDS = 1000
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def make_key(*parts):
+    """Content key for a download: sha256 over the identifying parts"""
+    raw = '\0'.join('' if part is None else str(part) for part in parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def file_sha256(path):
+    """sha256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StoreEntry:
+    """A finished file in the downloads folder"""
+
+    def __init__(self, key, filename, size, meta=None, created_at=None,
+                 last_access=None, hits=0, sha256=None):
+        self.key = key
+        self.filename = filename
+        self.size = size
+        # Hash isi file, dipakai sebagai strong ETag
+        self.sha256 = sha256
+        self.meta = meta or {}
+        self.created_at = created_at or time.time()
+        self.last_access = last_access or self.created_at
+        self.hits = hits
+        # Transfer/job yang sedang memakai file ini (tidak di-persist)
+        self.refcount = 0
+
+    def to_dict(self):
+        return {
+            'key': self.key,
+            'filename': self.filename,
+            'size': self.size,
+            'meta': self.meta,
+            'created_at': self.created_at,
+            'last_access': self.last_access,
+            'hits': self.hits,
+            'sha256': self.sha256,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['key'], data['filename'], data['size'], data.get('meta'),
+                   data.get('created_at'), data.get('last_access'), data.get('hits', 0),
+                   data.get('sha256'))
+
+
+class _Flight:
+    """An in-progress download that other requests for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class DownloadStore:
+    """Index of finished downloads keyed by content key
+
+    Requests for the same video/format/quality share one file. Concurrent
+    requests for a key that is still downloading wait for the first one
+    (single-flight) instead of starting their own download.
+
+    The index is a JSON snapshot plus an append-only journal: every change
+    appends one line after the in-memory lock is released, and compact()
+    folds the journal back into the snapshot from the evictor thread.
+    Several worker processes can share one folder; sync() replays what the
+    others appended.
+    """
+
+    def __init__(self, folder, index_name=INDEX_FILENAME):
+        self.folder = folder
+        self.index_path = os.path.join(folder, index_name)
+        self.journal_path = self.index_path + JOURNAL_SUFFIX
+        self._entries = {}
+        self._aliases = {}
+        self._aliases_of = {}
+        self._by_filename = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+        # Perubahan yang belum ditulis ke journal, dan posisi baca journal.
+        # _io_lock menjaga file index; _lock tidak pernah ditahan saat I/O.
+        self._pending = []
+        self._io_lock = threading.Lock()
+        self._journal_id = None
+        self._journal_offset = 0
+        self._journal_records = 0
+        # Statistik dijaga incremental supaya /api/health tidak perlu scan folder
+        self.total_bytes = 0
+        self._breakdown = {'by_platform': {}, 'by_format': {}}
+        self.untracked_files = 0
+        self.untracked_bytes = 0
+        self.last_reconcile = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        with self._io_lock:
+            self._reload()
+
+    def path_for(self, entry):
+        return os.path.join(self.folder, entry.filename)
+
+    def get(self, key):
+        """Return the finished entry for key (or an alias of it), or None"""
+        entry = self._lookup(key)
+        if entry is None or not os.path.exists(self.path_for(entry)):
+            if entry is not None:
+                self.remove(entry.key)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            entry.hits += 1
+            entry.last_access = time.time()
+        return entry
+
+    def peek(self, key):
+        """Like get(), without counting a hit/miss or touching the entry"""
+        entry = self._lookup(key)
+        if entry is None or not os.path.exists(self.path_for(entry)):
+            return None
+        return entry
+
+    def put(self, key, path, meta=None, aliases=(), content_keys=()):
+        """Index a finished file under key
+
+        aliases are other keys that should resolve to it. content_keys
+        identify the same content: an entry already stored under (or
+        aliased by) one of them is a duplicate and is replaced, its keys
+        taking over the new file. Replaced files are deleted unless in use
+        (reconcile() removes those later as orphans).
+        """
+        filename = os.path.basename(path)
+        entry = StoreEntry(key, filename, os.path.getsize(path), meta,
+                           sha256=file_sha256(path))
+        with self._lock:
+            replaced = [self._entries.get(key)]
+            for content_key in content_keys:
+                old_key = self._aliases.get(content_key, content_key)
+                if old_key != key and old_key in self._entries:
+                    replaced.append(self._entries[old_key])
+            replaced = [old for old in replaced if old is not None]
+            taken_over = set()
+            for old in replaced:
+                taken_over.add(old.key)
+                taken_over.update(self._aliases_of.get(old.key, ()))
+                self._drop(old.key)
+                if old.key != key:
+                    self._log('drop', key=old.key)
+            self._add(entry)
+            linked = []
+            for alias in tuple(taken_over) + tuple(aliases) + tuple(content_keys):
+                if alias and alias != key:
+                    self._alias(alias, key)
+                    linked.append(alias)
+            self._log('put', entry=entry.to_dict(), aliases=linked)
+            stale = [old for old in replaced
+                     if old.refcount == 0 and old.filename not in self._by_filename]
+        self._flush()
+        for old in stale:
+            try:
+                os.remove(self.path_for(old))
+            except FileNotFoundError:
+                pass
+        return entry
+
+    def link(self, key, aliases):
+        """Point extra aliases at an existing entry"""
+        with self._lock:
+            new = [alias for alias in aliases
+                   if alias and alias not in self._entries and self._aliases.get(alias) != key]
+            if not new or key not in self._entries:
+                return
+            for alias in new:
+                self._alias(alias, key)
+            self._log('alias', key=key, aliases=new)
+        self._flush()
+
+    def remove(self, key):
+        with self._lock:
+            entry = self._drop(key)
+            if entry is None:
+                return None
+            self._log('drop', key=key)
+        self._flush()
+        return entry
+
+    def evict(self, keys):
+        """Delete files for keys that are not in use; return the evicted entries"""
+        evicted = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or entry.refcount > 0:
+                    continue
+                self._drop(key)
+                self._log('drop', key=key)
+                evicted.append(entry)
+        if evicted:
+            self._flush()
+        for entry in evicted:
+            try:
+                os.remove(self.path_for(entry))
+            except FileNotFoundError:
+                pass
+        return evicted
+
+    def in_flight_prefixes(self):
+        """Filename prefixes of downloads that are still being written"""
+        with self._lock:
+            return {key[:16] for key in self._flights}
+
+    def run_once(self, key, fetch, aliases=()):
+        """Return the entry for key, running fetch() at most once concurrently
+
+        fetch() must return (path, meta, content_keys) for the finished file;
+        see put() for how content_keys replace duplicates.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            # Request key baru (mis. format_id lain) langsung menunjuk ke file ini
+            self.link(entry.key, aliases)
+            return entry
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry
+
+        try:
+            path, meta, content_keys = fetch()
+            flight.entry = self.put(key, path, meta, aliases, content_keys)
+            return flight.entry
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def by_filename(self, filename):
+        with self._lock:
+            return self._by_filename.get(filename)
+
+    def acquire(self, filename):
+        """Mark a file as in use (open transfer / running job)"""
+        with self._lock:
+            entry = self._by_filename.get(filename)
+            if entry is not None:
+                entry.refcount += 1
+                entry.last_access = time.time()
+            return entry
+
+    def etag_for(self, entry):
+        """Content-hash ETag; computed lazily for entries indexed before hashing"""
+        if entry.sha256 is None:
+            entry.sha256 = file_sha256(self.path_for(entry))
+            with self._lock:
+                self._log('sha256', key=entry.key, filename=entry.filename, sha256=entry.sha256)
+            self._flush()
+        return entry.sha256
+
+    def release(self, entry):
+        with self._lock:
+            entry.refcount = max(0, entry.refcount - 1)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    def reconcile(self, orphan_max_age=None):
+        """Re-sync the index with the folder contents
+
+        Drops entries whose file disappeared and counts files the index does
+        not know about (legacy downloads, leftover .part files). Untracked
+        files older than orphan_max_age seconds are deleted.
+        """
+        now = time.time()
+        index_name = os.path.basename(self.index_path)
+        journal_name = os.path.basename(self.journal_path)
+        skip = {index_name, index_name + '.tmp', index_name + LOCK_SUFFIX,
+                journal_name, journal_name + '.tmp'}
+        with self._lock:
+            tracked = set(self._by_filename)
+        seen = set()
+        untracked_files = untracked_bytes = orphans_removed = 0
+
+        with os.scandir(self.folder) as items:
+            for item in items:
+                if item.name in skip or not item.is_file():
+                    continue
+                if item.name in tracked:
+                    seen.add(item.name)
+                    continue
+                st = item.stat()
+                # st_ctime, bukan st_mtime: yt-dlp bisa set mtime dari header Last-Modified
+                if orphan_max_age is not None and now - st.st_ctime > orphan_max_age:
+                    with self._lock:
+                        in_use = (item.name in self._by_filename
+                                  or any(item.name.startswith(k[:16]) for k in self._flights))
+                        if not in_use:
+                            try:
+                                os.remove(item.path)
+                                orphans_removed += 1
+                                continue
+                            except OSError:
+                                pass
+                untracked_files += 1
+                untracked_bytes += st.st_size
+
+        with self._lock:
+            missing = [
+                self._by_filename[name].key for name in tracked - seen
+                if name in self._by_filename
+                and not os.path.exists(os.path.join(self.folder, name))
+            ]
+            for key in missing:
+                self._drop(key)
+                self._log('drop', key=key)
+            self.untracked_files = untracked_files
+            self.untracked_bytes = untracked_bytes
+            self.last_reconcile = now
+        if missing:
+            self._flush()
+
+        return {
+            'missing_dropped': len(missing),
+            'orphans_removed': orphans_removed,
+            'untracked_files': untracked_files,
+            'untracked_bytes': untracked_bytes,
+        }
+
+    def summary(self):
+        """O(1) folder totals for health probes"""
+        with self._lock:
+            return {
+                'files': len(self._entries) + self.untracked_files,
+                'bytes': self.total_bytes + self.untracked_bytes,
+            }
+
+    def stats(self):
+        with self._lock:
+            oldest = next(iter(self._entries.values()), None)
+            return {
+                'entries': len(self._entries),
+                'total_bytes': self.total_bytes,
+                'by_platform': {k: dict(v) for k, v in self._breakdown['by_platform'].items()},
+                'by_format': {k: dict(v) for k, v in self._breakdown['by_format'].items()},
+                'oldest_created_at': oldest.created_at if oldest else None,
+                'untracked_files': self.untracked_files,
+                'untracked_bytes': self.untracked_bytes,
+                'last_reconcile': self.last_reconcile,
+                'aliases': len(self._aliases),
+                'in_flight': len(self._flights),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'journal_records': self._journal_records,
+            }
+
+    def sync(self):
+        """Apply index changes other worker processes appended since the last read"""
+        with self._io_lock:
+            self._sync()
+
+    def compact(self, force=False):
+        """Fold the journal into a fresh snapshot once it has grown large
+
+        Called from the evictor thread, off the request path. Returns True
+        if the index was rewritten.
+        """
+        with self._io_lock:
+            with self._lock:
+                limit = max(COMPACT_MIN_RECORDS, len(self._entries))
+                if not force and self._journal_records <= limit:
+                    return False
+            with self._file_lock():
+                self._sync()
+                with self._lock:
+                    data = {
+                        'entries': [entry.to_dict() for entry in self._entries.values()],
+                        'aliases': dict(self._aliases),
+                    }
+                tmp_path = self.index_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.index_path)
+                # Journal baru yang kosong; worker lain melihat file-nya berganti lalu reload
+                tmp_path = self.journal_path + '.tmp'
+                open(tmp_path, 'wb').close()
+                os.replace(tmp_path, self.journal_path)
+                st = os.stat(self.journal_path)
+                self._journal_id = (st.st_dev, st.st_ino)
+                self._journal_offset = 0
+                self._journal_records = 0
+        return True
+
+    def _add(self, entry):
+        # Dipanggil dengan self._lock terkunci. Urutan dict = urutan dibuat,
+        # jadi entry pertama selalu file tertua.
+        self._entries[entry.key] = entry
+        self._by_filename[entry.filename] = entry
+        self._count(entry, 1)
+
+    def _drop(self, key):
+        # Dipanggil dengan self._lock terkunci
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._count(entry, -1)
+        self._by_filename.pop(entry.filename, None)
+        for alias in self._aliases_of.pop(key, ()):
+            if self._aliases.get(alias) == key:
+                del self._aliases[alias]
+        return entry
+
+    def _count(self, entry, sign):
+        self.total_bytes += sign * entry.size
+        ext = entry.meta.get('ext') or os.path.splitext(entry.filename)[1].lstrip('.')
+        labels = {
+            'by_platform': entry.meta.get('platform') or 'unknown',
+            'by_format': ext or 'unknown',
+        }
+        for name, label in labels.items():
+            buckets = self._breakdown[name]
+            bucket = buckets.setdefault(label, {'files': 0, 'bytes': 0})
+            bucket['files'] += sign
+            bucket['bytes'] += sign * entry.size
+            if bucket['files'] <= 0:
+                del buckets[label]
+
+    def _alias(self, alias, key):
+        # Dipanggil dengan self._lock terkunci
+        self._aliases[alias] = key
+        self._aliases_of.setdefault(key, set()).add(alias)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(self._aliases.get(key, key))
+        if entry is None:
+            # Mungkin sudah didownload worker lain
+            self.sync()
+            with self._lock:
+                entry = self._entries.get(self._aliases.get(key, key))
+        return entry
+
+    def _writer(self):
+        # Beda per proses (juga setelah fork) dan per instance
+        return '%d:%x' % (os.getpid(), id(self))
+
+    def _log(self, op, **fields):
+        # Dipanggil dengan self._lock terkunci; ditulis oleh _flush() setelah lock dilepas
+        self._pending.append({'op': op, **fields, 'writer': self._writer()})
+
+    def _apply(self, record, previous=None):
+        # Dipanggil dengan self._lock terkunci; satu record journal/snapshot
+        op = record.get('op')
+        key = record.get('key')
+        if op == 'put':
+            entry = StoreEntry.from_dict(record['entry'])
+            old = self._drop(entry.key) or (previous or {}).get(entry.key)
+            if old is not None and old.filename == entry.filename:
+                # Objek lama dipakai lagi: refcount transfer yang sedang jalan ada di sana
+                old.size, old.sha256, old.meta = entry.size, entry.sha256, entry.meta
+                old.created_at = entry.created_at
+                old.last_access = max(old.last_access, entry.last_access)
+                old.hits = max(old.hits, entry.hits)
+                entry = old
+            if not os.path.exists(self.path_for(entry)):
+                return
+            self._add(entry)
+            for alias in record.get('aliases', ()):
+                self._alias(alias, entry.key)
+        elif op == 'alias':
+            if key in self._entries:
+                for alias in record.get('aliases', ()):
+                    self._alias(alias, key)
+        elif op == 'drop':
+            self._drop(key)
+        elif op == 'sha256':
+            entry = self._entries.get(key)
+            if entry is not None and entry.filename == record.get('filename'):
+                entry.sha256 = record.get('sha256')
+
+    @contextmanager
+    def _file_lock(self):
+        # Serialisasi append/compact antar worker process
+        with open(self.index_path + LOCK_SUFFIX, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _read_journal(self, f, offset):
+        # Hanya sampai newline terakhir: baris yang sedang ditulis dibaca nanti
+        f.seek(offset)
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records, offset + end
+
+    def _reload(self, keep=()):
+        # Dipanggil dengan self._io_lock terkunci. Bangun ulang index dari
+        # snapshot + seluruh journal (saat start, atau setelah worker lain
+        # compact); keep = record proses ini yang belum ada di file.
+        try:
+            journal = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            journal = None
+        try:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                snapshot = {}
+            records = [{'op': 'put', 'entry': item} for item in snapshot.get('entries', [])]
+            records += [{'op': 'alias', 'key': key, 'aliases': [alias]}
+                        for alias, key in snapshot.get('aliases', {}).items()]
+            journal_id, offset, journal_records = None, 0, 0
+            if journal is not None:
+                st = os.fstat(journal.fileno())
+                journal_id = (st.st_dev, st.st_ino)
+                logged, offset = self._read_journal(journal, 0)
+                records += logged
+                journal_records = len(logged)
+        finally:
+            if journal is not None:
+                journal.close()
+
+        with self._lock:
+            previous = self._entries
+            self._entries = {}
+            self._aliases = {}
+            self._aliases_of = {}
+            self._by_filename = {}
+            self.total_bytes = 0
+            self._breakdown = {'by_platform': {}, 'by_format': {}}
+            for record in records + list(keep) + self._pending:
+                self._apply(record, previous)
+        self._journal_id = journal_id
+        self._journal_offset = offset
+        self._journal_records = journal_records
+
+    def _sync(self, keep=()):
+        # Dipanggil dengan self._io_lock terkunci
+        try:
+            journal = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            if self._journal_id is not None:
+                self._reload(keep)
+            return
+        with journal:
+            st = os.fstat(journal.fileno())
+            if (st.st_dev, st.st_ino) != self._journal_id:
+                journal.close()
+                self._reload(keep)
+                return
+            if st.st_size <= self._journal_offset:
+                return
+            records, self._journal_offset = self._read_journal(journal, self._journal_offset)
+        writer = self._writer()
+        with self._lock:
+            for record in records:
+                if record.get('writer') != writer:
+                    self._apply(record)
+        self._journal_records += len(records)
+
+    def _flush(self):
+        """Append pending index changes to the journal; called without self._lock"""
+        with self._io_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+            if not records:
+                return
+            data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+            with self._file_lock():
+                # Ambil dulu tulisan worker lain supaya offset baca tetap di akhir file
+                self._sync(records)
+                with open(self.journal_path, 'ab') as f:
+                    f.write(data.encode('utf-8'))
+                    f.flush()
+                    st = os.fstat(f.fileno())
+            self._journal_id = (st.st_dev, st.st_ino)
+            self._journal_offset = st.st_size
+            self._journal_records += len(records)
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from admission import DEFAULT_RETRY_AFTER, DOWNLOAD, EXTRACT, AdmissionController, Stage, StageBusy
+from jobs import JobManager
+
+
+def test_full_queue_is_rejected_at_once():
+    stage = Stage('extract', limit=1, max_queue=0, max_wait=5)
+    with stage.slot() as waited:
+        assert waited == 0.0
+        with pytest.raises(StageBusy) as busy:
+            stage.acquire()
+    assert busy.value.stage == 'extract'
+    assert busy.value.retry_after >= 1
+    stats = stage.stats()
+    assert stats['active'] == 0 and stats['rejected'] == 1 and stats['admitted'] == 1
+
+
+def test_waiter_times_out():
+    stage = Stage('serve', limit=1, max_queue=1, max_wait=0.05)
+    stage.acquire()
+    with pytest.raises(StageBusy):
+        stage.acquire()
+    assert stage.stats()['timeouts'] == 1
+    assert stage.stats()['waiting'] == 0
+
+
+def test_released_slots_go_to_waiters_in_order():
+    stage = Stage('extract', limit=1, max_queue=3, max_wait=5)
+    stage.acquire()
+    order = []
+
+    def wait_in_line(n):
+        stage.acquire()
+        order.append(n)
+        stage.release()
+
+    threads = []
+    for n in range(3):
+        thread = threading.Thread(target=wait_in_line, args=(n,))
+        thread.start()
+        threads.append(thread)
+        # Tunggu sampai thread ini benar-benar antri sebelum menambah yang berikutnya
+        deadline = time.monotonic() + 5
+        while stage.stats()['waiting'] < n + 1 and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    stage.release(held=2.0)
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1, 2]
+    stats = stage.stats()
+    assert stats['active'] == 0 and stats['admitted'] == 4 and stats['avg_service_time'] == 2.0
+
+
+def test_queue_stage_follows_job_manager():
+    controller = AdmissionController({EXTRACT: (1, 1, 1)})
+    manager = JobManager(max_workers=1, max_pending=0)
+    controller.add_queue(DOWNLOAD, manager)
+    release = threading.Event()
+
+    controller.check(DOWNLOAD)
+    job = manager.submit(lambda job: release.wait(5))
+    with pytest.raises(StageBusy) as busy:
+        controller.check(DOWNLOAD)
+    # Belum ada job selesai: Retry-After memakai nilai default
+    assert busy.value.retry_after == DEFAULT_RETRY_AFTER
+
+    release.set()
+    manager.wait(job, timeout=5)
+    controller.check(DOWNLOAD)
+    stats = controller.stats()[DOWNLOAD]
+    assert (stats['admitted'], stats['rejected'], stats['limit']) == (2, 1, 1)
+    assert set(controller.stats()) == {EXTRACT, DOWNLOAD}
@@ -0,0 +1,63 @@
+import io
+import logging
+
+import applog
+from applog import JsonFileHandler, LogQuery, read_logs, reverse_lines
+
+
+def write_records(path, count, max_bytes=0):
+    handler = JsonFileHandler(str(path), max_bytes=max_bytes, backup_count=5, rotate_interval=0)
+    records = []
+    for i in range(count):
+        level = logging.WARNING if i % 3 == 0 else logging.INFO
+        record = logging.LogRecord('app', level, __file__, 0, 'record %d', (i,), None)
+        record.created = 1760000000 + i
+        record.ip = f'10.0.0.{i % 2}'
+        records.append(record)
+    handler.emit_batch(records)
+    handler.close()
+
+
+def read_all(path, query=None, limit=4):
+    """All pages following the cursors; return (messages newest page first, number of pages)"""
+    messages, pages, cursor = [], 0, None
+    while True:
+        entries, cursor = read_logs(query, limit=limit, cursor=cursor, path=str(path), backup_count=5)
+        pages += 1
+        messages = [entry['msg'] for entry in entries] + messages
+        if cursor is None:
+            return messages, pages
+
+
+def test_cursor_pages_cover_every_record_once(tmp_path):
+    path = tmp_path / 'app.log'
+    write_records(path, 10)
+    messages, pages = read_all(path)
+    assert messages == [f'record {i}' for i in range(10)]
+    assert pages == 3
+
+
+def test_cursor_continues_into_rotated_files(tmp_path):
+    path = tmp_path / 'app.log'
+    # Sekitar tiga record per file
+    write_records(path, 12, max_bytes=400)
+    assert len(applog.log_files(str(path), 5)) > 2
+    messages, _ = read_all(path, limit=5)
+    assert messages == [f'record {i}' for i in range(12)]
+
+
+def test_filters(tmp_path):
+    path = tmp_path / 'app.log'
+    write_records(path, 10)
+    warnings, _ = read_all(path, LogQuery(level='warning'))
+    assert warnings == ['record 0', 'record 3', 'record 6', 'record 9']
+    by_ip, _ = read_all(path, LogQuery(ip='10.0.0.1', since=1760000004))
+    assert by_ip == ['record 5', 'record 7', 'record 9']
+
+
+def test_unfinished_last_line_is_skipped(monkeypatch):
+    monkeypatch.setattr(applog, 'READ_BLOCK', 8)
+    data = b'{"a": 1}\n{"b": 2}\n' + b'{"partial": "' + b'x' * 30
+    lines = list(reverse_lines(io.BytesIO(data), len(data)))
+    assert lines == [(9, b'{"b": 2}\n'), (0, b'{"a": 1}\n')]
+    assert list(reverse_lines(io.BytesIO(b'x' * 20), 20)) == []
@@ -0,0 +1,22 @@
+from cache import normalize_url
+
+
+def test_share_links_collapse_to_one_key():
+    assert normalize_url('https://youtu.be/abc123?si=xyz') == 'https://youtube.com/watch?v=abc123'
+    assert normalize_url('https://m.youtube.com/watch?v=abc123&feature=share&t=10') \
+        == 'https://youtube.com/watch?v=abc123'
+    assert normalize_url('https://www.tiktok.com/@u/video/1/?is_from_webapp=1') \
+        == 'https://tiktok.com/@u/video/1'
+
+
+def test_youtube_playlists_keep_list_param():
+    first = normalize_url('https://www.youtube.com/playlist?list=PLaaa&si=x')
+    second = normalize_url('https://www.youtube.com/playlist?list=PLbbb')
+    assert first == 'https://youtube.com/playlist?list=PLaaa'
+    assert first != second
+    assert normalize_url('https://youtube.com/watch?v=abc123&list=PLaaa&index=2') \
+        == 'https://youtube.com/watch?list=PLaaa&v=abc123'
+
+
+def test_other_hosts_keep_non_tracking_params():
+    assert normalize_url('https://example.com/video?id=7&utm_source=x') == 'https://example.com/video?id=7'
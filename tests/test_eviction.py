@@ -0,0 +1,60 @@
+import os
+import time
+
+from eviction import Evictor
+from store import DownloadStore
+
+
+def stored(store, key, size, last_access, hits=0):
+    path = os.path.join(store.folder, f'{key}.mp4')
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    entry = store.put(key, path, {'platform': 'youtube'})
+    # Dibuat jauh sebelum grace period supaya boleh dibuang
+    entry.created_at = time.time() - 3600
+    entry.last_access = last_access
+    entry.hits = hits
+    return entry
+
+
+def test_expired_entries_go_first(tmp_path):
+    store = DownloadStore(str(tmp_path))
+    now = time.time()
+    stored(store, 'old', 10, now - 7200)
+    stored(store, 'fresh', 10, now - 10)
+    evictor = Evictor(store, max_bytes=1000, max_age=3600, grace=300)
+
+    assert evictor.run_once() == (1, 10)
+    assert [entry.key for entry in store.entries()] == ['fresh']
+    assert not os.path.exists(os.path.join(str(tmp_path), 'old.mp4'))
+
+
+def test_quota_follows_policy(tmp_path):
+    now = time.time()
+    for policy, survivor in (('lru', 'recent'), ('lfu', 'popular')):
+        folder = tmp_path / policy
+        folder.mkdir()
+        store = DownloadStore(str(folder))
+        stored(store, 'popular', 40, now - 300, hits=50)
+        stored(store, 'recent', 40, now - 10, hits=1)
+        stored(store, 'stale', 40, now - 600, hits=2)
+        evictor = Evictor(store, max_bytes=50, max_age=3600, grace=300, policy=policy)
+
+        evictor.run_once()
+        assert [entry.key for entry in store.entries()] == [survivor]
+        assert store.total_bytes == 40
+
+
+def test_files_in_use_or_in_grace_are_kept(tmp_path):
+    store = DownloadStore(str(tmp_path))
+    now = time.time()
+    busy = stored(store, 'busy', 10, now - 7200)
+    new = stored(store, 'new', 10, now - 7200)
+    new.created_at = now
+    store.acquire(busy.filename)
+    evictor = Evictor(store, max_bytes=0, max_age=3600, grace=300)
+
+    assert evictor.run_once() == (0, 0)
+    store.release(busy)
+    assert evictor.run_once() == (1, 10)
+    assert [entry.key for entry in store.entries()] == ['new']
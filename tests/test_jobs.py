@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from jobs import FAILED, FINISHED, QUEUED, RUNNING, Job, JobError, JobManager, QueueFullError
+
+
+def test_job_result_and_phases():
+    manager = JobManager(max_workers=1, max_pending=1)
+
+    def work(job):
+        job.progress_hook({'status': 'downloading', 'filename': 'a.mp4',
+                           'downloaded_bytes': 5, 'total_bytes': 10})
+        job.postprocessor_hook({'status': 'started', 'postprocessor': 'Merger'})
+        return {'filename': 'a.mp4'}
+
+    job = manager.submit(work, {'url': 'https://example.com/v'})
+    assert manager.wait(job, timeout=5)
+    data = job.to_dict()
+    assert data['state'] == FINISHED
+    assert data['result'] == {'filename': 'a.mp4'}
+    assert [phase for phase, _ in job.phase_log] == [QUEUED, 'extracting', 'downloading', 'merging', FINISHED]
+    assert manager.get(job.id) is job
+    assert manager.stats()['active'] == 0
+
+
+def test_job_errors_keep_user_message():
+    manager = JobManager(max_workers=1, max_pending=1)
+
+    def rejected(job):
+        raise JobError('Format tidak tersedia')
+
+    def crashed(job):
+        raise RuntimeError('boom')
+
+    first = manager.submit(rejected)
+    second = manager.submit(crashed)
+    assert manager.wait(first, timeout=5) and manager.wait(second, timeout=5)
+    assert first.state == FAILED and first.error == 'Format tidak tersedia'
+    assert second.state == FAILED and second.error == 'Gagal mendownload: boom'
+
+
+def test_queue_full_after_workers_and_pending():
+    manager = JobManager(max_workers=1, max_pending=1)
+    started, release = threading.Event(), threading.Event()
+
+    def blocked(job):
+        started.set()
+        release.wait(5)
+
+    running = manager.submit(blocked)
+    assert started.wait(5)
+    waiting = manager.submit(blocked)
+    assert manager.saturated()
+    assert manager.queue_stats()['waiting'] == 1
+    with pytest.raises(QueueFullError):
+        manager.submit(blocked)
+
+    assert running.state == RUNNING and waiting.state == QUEUED
+    release.set()
+    assert manager.wait(running, timeout=5) and manager.wait(waiting, timeout=5)
+    assert not manager.saturated()
+    # Setelah job pertama selesai, Retry-After diperkirakan dari lama kerja rata-rata
+    assert manager.retry_after() is not None
+
+
+def test_add_finished_is_queryable():
+    manager = JobManager(max_workers=1, max_pending=1)
+    job = manager.add_finished({'filename': 'done.mp4'})
+    assert job.done.is_set()
+    assert manager.get(job.id).to_dict()['result'] == {'filename': 'done.mp4'}
+
+
+def test_progress_sums_all_files_and_notifies():
+    job = Job('job1')
+    version = job.to_dict()['version']
+    job.progress_hook({'status': 'downloading', 'filename': 'video', 'downloaded_bytes': 30, 'total_bytes': 100})
+    job.progress_hook({'status': 'finished', 'filename': 'audio', 'total_bytes': 50})
+    assert job.wait_for_update(version, timeout=1) > version
+    assert job.downloaded_bytes == 80
+    assert job.total_bytes == 150
+    assert job.to_dict()['progress'] == 53.3
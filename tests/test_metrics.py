@@ -0,0 +1,60 @@
+import threading
+
+from metrics import Registry
+
+
+def test_counter_sums_all_threads_including_finished_ones():
+    registry = Registry()
+    counter = registry.counter('vtmu_jobs_total', 'Jobs', ['state'])
+
+    def work():
+        for _ in range(100):
+            counter.inc('finished')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc('error', amount=2)
+
+    assert counter.expose() == ['vtmu_jobs_total{state="error"} 2', 'vtmu_jobs_total{state="finished"} 400']
+    # Shard thread yang sudah selesai dilipat, nilainya tetap ada di scrape berikutnya
+    assert len(counter._shards) == 1
+    assert 'vtmu_jobs_total{state="finished"} 400' in counter.expose()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('vtmu_stage_seconds', 'Stage time', ['stage'], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, 'extract')
+
+    assert histogram.expose() == [
+        'vtmu_stage_seconds_bucket{stage="extract",le="0.1"} 1',
+        'vtmu_stage_seconds_bucket{stage="extract",le="1"} 3',
+        'vtmu_stage_seconds_bucket{stage="extract",le="+Inf"} 4',
+        'vtmu_stage_seconds_sum{stage="extract"} 4.05',
+        'vtmu_stage_seconds_count{stage="extract"} 4',
+    ]
+
+
+def test_exposition_with_collectors_and_escaping():
+    registry = Registry()
+    registry.counter('vtmu_busy_total', 'Busy', ['stage']).inc('say "hi"\n')
+    registry.add_collector(lambda: [
+        ('vtmu_queue_depth', 'gauge', 'Queue depth', [({'stage': 'download'}, 3), ({'stage': 'x'}, None)]),
+        ('vtmu_up', 'gauge', 'Up', [({}, 1)]),
+    ])
+
+    assert registry.expose().splitlines() == [
+        '# HELP vtmu_busy_total Busy',
+        '# TYPE vtmu_busy_total counter',
+        'vtmu_busy_total{stage="say \\"hi\\"\\n"} 1',
+        '# HELP vtmu_queue_depth Queue depth',
+        '# TYPE vtmu_queue_depth gauge',
+        'vtmu_queue_depth{stage="download"} 3',
+        '# HELP vtmu_up Up',
+        '# TYPE vtmu_up gauge',
+        'vtmu_up 1',
+    ]
@@ -0,0 +1,55 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import postprocess
+from postprocess import AUDIO_EXT, NONE, REMUX, TRANSCODE, ffmpeg_command, plan, plan_for_info
+
+
+def test_mp4_with_compatible_codecs_is_left_alone():
+    result = plan('mp4', 'avc1.64001F', 'mp4a.40.2')
+    assert (result['action'], result['video'], result['audio']) == (NONE, 'copy', 'copy')
+
+
+def test_other_containers_are_remuxed():
+    assert plan('webm', 'vp9', 'opus')['action'] == REMUX
+    assert plan('mkv', 'h264', 'aac')['reason'] == 'container mkv -> mp4'
+    # Codec tidak dilaporkan: coba remux dulu, apply() transcode jika gagal
+    assert plan('flv')['action'] == REMUX
+
+
+def test_incompatible_codecs_are_transcoded():
+    result = plan_for_info({'ext': 'webm', 'vcodec': 'vp8', 'acodec': 'vorbis'})
+    assert (result['action'], result['video'], result['audio']) == (TRANSCODE, 'encode', 'encode')
+    # Hanya stream yang tidak cocok yang di-encode
+    assert plan('mkv', 'h264', 'vorbis')['video'] == 'copy'
+
+
+def test_audio_target():
+    assert plan('mp3', 'none', 'mp3', target=AUDIO_EXT)['action'] == NONE
+    assert plan('m4a', 'none', 'mp4a.40.2', target=AUDIO_EXT)['action'] == TRANSCODE
+    video = plan('mp4', 'avc1', 'mp3', target=AUDIO_EXT)
+    assert (video['action'], video['video']) == (REMUX, None)
+
+
+def test_ffmpeg_command_follows_plan():
+    cmd = ffmpeg_command('in.mkv', 'out.mp4', plan('mkv', 'h264', 'vorbis'), threads=2)
+    assert cmd[cmd.index('-c:v') + 1] == 'copy'
+    assert cmd[cmd.index('-c:a') + 1] == 'aac'
+    assert cmd[-4:] == ['+faststart', '-f', 'mp4', 'out.mp4']
+    assert '-vn' in ffmpeg_command('in.m4a', 'out.mp3', plan('m4a', 'none', 'aac', target=AUDIO_EXT))
+
+
+@pytest.mark.skipif(shutil.which(postprocess.FFMPEG_BIN) is None, reason='ffmpeg not installed')
+def test_apply_remuxes_and_removes_source(tmp_path):
+    src = str(tmp_path / 'clip.mkv')
+    subprocess.run([postprocess.FFMPEG_BIN, '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc=size=64x64:rate=10',
+                    '-f', 'lavfi', '-i', 'sine', '-t', '1', '-c:v', 'libx264', '-c:a', 'aac', src], check=True)
+
+    file_plan = plan('mkv', 'h264', 'aac')
+    result = postprocess.apply(src, file_plan, threads=1)
+    assert result == str(tmp_path / 'clip.mp4')
+    assert file_plan['action'] == REMUX
+    assert os.listdir(tmp_path) == ['clip.mp4']
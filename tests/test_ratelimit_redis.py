@@ -0,0 +1,285 @@
+"""RedisState against a minimal fake RESP server, and a real redis-server when installed"""
+import shutil
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+
+import pytest
+
+import ratelimit
+from ratelimit import Limit, RateLimiter, RedisState, StateError
+
+
+class RespError(Exception):
+    """Error reply, inside or outside EXEC"""
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.clients.add(self.connection)
+        queued = None
+        try:
+            while True:
+                command = self.read_command()
+                if command is None:
+                    return
+                name = command[0].upper()
+                if name == 'MULTI':
+                    queued = []
+                    reply = 'OK'
+                elif name == 'EXEC':
+                    reply = [self.run(queued_command) for queued_command in queued or ()]
+                    queued = None
+                elif queued is not None:
+                    queued.append(command)
+                    reply = 'QUEUED'
+                else:
+                    reply = self.run(command)
+                self.wfile.write(self.encode(reply))
+        except (OSError, ValueError):
+            pass
+        finally:
+            with server.lock:
+                server.clients.discard(self.connection)
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2].decode())
+        return args
+
+    def run(self, command):
+        try:
+            with self.server.lock:
+                return self.server.execute(command, self.connection)
+        except RespError as e:
+            return e
+
+    def encode(self, reply):
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, RespError):
+            return b'-%s\r\n' % str(reply).encode()
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, list):
+            return b'*%d\r\n' % len(reply) + b''.join(self.encode(item) for item in reply)
+        if reply in ('OK', 'QUEUED'):
+            return b'+%s\r\n' % reply.encode()
+        data = reply.encode()
+        return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """Just the commands RedisState sends, plus CLIENT KILL to drop connections"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(('127.0.0.1', 0), FakeRedisHandler)
+        self.password = password
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.data = {}
+
+    def execute(self, command, connection):
+        name, args = command[0].upper(), command[1:]
+        if name == 'AUTH':
+            if args[-1] != self.password:
+                raise RespError('WRONGPASS invalid username-password pair')
+            return 'OK'
+        if name == 'SELECT':
+            return 'OK'
+        if name == 'SET':
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            if 'NX' in options and self.get(key) is not None:
+                return None
+            expires_at = None
+            if 'PX' in options:
+                expires_at = time.time() + int(options[options.index('PX') + 1]) / 1000
+            self.data[key] = (value, expires_at)
+            return 'OK'
+        if name == 'INCRBYFLOAT':
+            key = args[0]
+            try:
+                value = float(self.get(key) or 0) + float(args[1])
+            except ValueError:
+                raise RespError('ERR value is not a valid float')
+            value = format(value, '.15g')
+            self.data[key] = (value, self.data.get(key, (None, None))[1])
+            return value
+        if name == 'MGET':
+            return [self.get(key) for key in args]
+        if name == 'PTTL':
+            if self.get(args[0]) is None:
+                return -2
+            expires_at = self.data[args[0]][1]
+            return -1 if expires_at is None else int((expires_at - time.time()) * 1000)
+        if name == 'CLIENT' and args[0].upper() == 'KILL':
+            for client in list(self.clients):
+                if client is not connection:
+                    client.shutdown(socket.SHUT_RDWR)
+            return 'OK'
+        raise RespError(f"ERR unknown command '{command[0]}'")
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry[0]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(params=['fake', 'redis-server'])
+def redis_url(request):
+    if request.param == 'fake':
+        server = FakeRedis()
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        yield 'redis://127.0.0.1:%d/0' % server.server_address[1]
+        server.shutdown()
+        server.server_close()
+        return
+
+    binary = shutil.which('redis-server')
+    if binary is None:
+        pytest.skip('redis-server not installed')
+    port = free_port()
+    process = subprocess.Popen([binary, '--port', str(port), '--save', '', '--appendonly', 'no'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 5
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            if time.time() > deadline:
+                process.kill()
+                pytest.fail('redis-server did not start')
+            time.sleep(0.05)
+    yield 'redis://127.0.0.1:%d/0' % port
+    process.terminate()
+    process.wait()
+
+
+def make_state(url):
+    # Prefix unik per test supaya redis-server sungguhan tidak perlu dikosongkan
+    return RedisState(url, prefix='test:%s:' % time.time_ns())
+
+
+def same_window(window=60, margin=2):
+    # Tunggu lewat batas window kalau sudah dekat, supaya semua hit satu test
+    # jatuh di window yang sama
+    left = window - time.time() % window
+    if left < margin:
+        time.sleep(left)
+
+
+def test_incr_parses_multi_exec_replies(redis_url):
+    state = make_state(redis_url)
+    # SET NX PX -> OK lalu nil di EXEC berikutnya; INCRBYFLOAT -> bulk string
+    assert state.incr('counter', 1, 60) == 1
+    assert state.incr('counter', 2.5, 60) == 3.5
+    assert state.get_many(['counter', 'missing']) == [3.5, 0]
+    assert 0 < state._call(('PTTL', state.prefix + 'counter'))[0] <= 60000
+
+
+def test_refund_with_negative_incrbyfloat(redis_url):
+    state = make_state(redis_url)
+    state.incr('counter', 3, 60)
+    assert state.incr('counter', -3, 60) == 0
+    assert state.get_many(['counter']) == [0]
+
+
+def test_error_reply_inside_exec(redis_url):
+    state = make_state(redis_url)
+    state._call(('SET', state.prefix + 'text', 'abc'))
+    with pytest.raises(StateError):
+        state.incr('text', 1, 60)
+    # Koneksi ditutup setelah error, request berikutnya tersambung ulang dengan bersih
+    assert state.incr('counter', 1, 60) == 1
+
+
+def test_reconnects_after_dropped_socket(redis_url):
+    state = make_state(redis_url)
+    assert state.incr('counter', 1, 60) == 1
+    make_state(redis_url)._call(('CLIENT', 'KILL', 'TYPE', 'normal', 'SKIPME', 'yes'))
+    time.sleep(0.05)
+    assert state.incr('counter', 1, 60) == 2
+
+
+def test_unreachable_server_fails_open():
+    limiter = RateLimiter(RedisState('redis://127.0.0.1:%d/0' % free_port(), timeout=0.2),
+                          limits={ratelimit.INFO: (Limit(1, 60),)}, global_limits={})
+    assert limiter.hit('1.2.3.4', ratelimit.INFO).allowed
+    assert limiter.stats()['state_errors'] == 1
+
+
+def test_limiter_allow_deny_refund_block(redis_url):
+    state = make_state(redis_url)
+    limiter = RateLimiter(state, limits={ratelimit.INFO: (Limit(3, 60),)},
+                          global_limits={ratelimit.INFO: (Limit(100, 60),)}, block_duration=30)
+    client = '1.2.3.4'
+    same_window()
+    assert all(limiter.hit(client, ratelimit.INFO).allowed for _ in range(3))
+
+    # Request ke-4 ditolak, jatahnya dikembalikan, dan IP diblokir
+    decision = limiter.hit(client, ratelimit.INFO)
+    assert not decision.allowed and decision.blocked
+    assert decision.retry_after >= 30
+    window = int(time.time() // 60)
+    assert state.get_many([f'rl:info:60:{client}:{window}']) == [3]
+    assert 0 < state.blocked_for(f'block:{client}') <= 30
+    assert not limiter.hit(client, ratelimit.INFO).allowed
+    assert limiter.stats()['blocks'] == 1
+
+
+def test_limiter_cost_overage_is_not_blocked(redis_url):
+    state = make_state(redis_url)
+    limiter = RateLimiter(state, limits={ratelimit.DOWNLOAD: (Limit(10, 60),)}, global_limits={})
+    client = '5.6.7.8'
+    same_window()
+    assert limiter.hit(client, ratelimit.DOWNLOAD, 10).allowed
+    decision = limiter.hit(client, ratelimit.DOWNLOAD, 2)
+    assert not decision.allowed and not decision.blocked
+    assert state.blocked_for(f'block:{client}') == 0
+
+
+def test_global_denial_refunds_client_budget(redis_url):
+    state = make_state(redis_url)
+    limiter = RateLimiter(state, limits={ratelimit.INFO: (Limit(10, 60),)},
+                          global_limits={ratelimit.INFO: (Limit(1, 60),)})
+    same_window()
+    assert limiter.hit('a', ratelimit.INFO).allowed
+    decision = limiter.hit('b', ratelimit.INFO)
+    assert not decision.allowed and decision.scope == ratelimit.GLOBAL
+    window = int(time.time() // 60)
+    assert state.get_many([f'rl:info:60:b:{window}']) == [0]
+
+
+def test_auth_and_select():
+    server = FakeRedis(password='s3cret')
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    try:
+        port = server.server_address[1]
+        assert RedisState(f'redis://:s3cret@127.0.0.1:{port}/2').incr('counter', 1, 60) == 1
+        with pytest.raises(StateError):
+            RedisState(f'redis://:wrong@127.0.0.1:{port}/2').incr('counter', 1, 60)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+import pytest
+
+from store import DownloadStore, make_key
+
+
+def write_file(folder, name, data=b'video'):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_run_once_is_single_flight(tmp_path):
+    store = DownloadStore(str(tmp_path))
+    key = make_key('https://example.com/v', 'best')
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return write_file(str(tmp_path), 'v.mp4'), {'platform': 'youtube'}, []
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.run_once(key, fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Semua thread harus sudah menunggu sebelum leader selesai
+    deadline = time.monotonic() + 5
+    while store.stats()['coalesced'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 5 and len({entry.key for entry in results}) == 1
+    assert store.stats()['coalesced'] == 4
+    # Request berikutnya langsung dari store, lewat alias juga
+    assert store.run_once(key, fetch, aliases=['other-format']).filename == 'v.mp4'
+    assert store.get('other-format').key == key
+    assert len(calls) == 1
+
+
+def test_run_once_failure_reaches_waiters_and_is_retried(tmp_path):
+    store = DownloadStore(str(tmp_path))
+
+    def broken():
+        raise RuntimeError('extractor failed')
+
+    with pytest.raises(RuntimeError):
+        store.run_once('key', broken)
+    assert store.stats()['in_flight'] == 0
+    entry = store.run_once('key', lambda: (write_file(str(tmp_path), 'k.mp4'), {}, []))
+    assert entry.filename == 'k.mp4'
+
+
+def test_refcount_protects_files_from_eviction(tmp_path):
+    store = DownloadStore(str(tmp_path))
+    path = write_file(str(tmp_path), 'a.mp4', b'x' * 10)
+    store.put('a', path, {'platform': 'tiktok'})
+
+    entry = store.acquire('a.mp4')
+    assert store.evict(['a']) == []
+    assert os.path.exists(path)
+
+    store.release(entry)
+    store.release(entry)
+    assert entry.refcount == 0
+    assert [e.key for e in store.evict(['a'])] == ['a']
+    assert not os.path.exists(path)
+    assert store.summary() == {'files': 0, 'bytes': 0}
+
+
+def test_content_keys_replace_duplicates(tmp_path):
+    store = DownloadStore(str(tmp_path))
+    first = write_file(str(tmp_path), 'first.mp4')
+    store.put('request-1', first, content_keys=['youtube:abc:137+140'])
+    second = write_file(str(tmp_path), 'second.mp4')
+    store.put('request-2', second, content_keys=['youtube:abc:137+140'])
+
+    assert not os.path.exists(first)
+    assert store.get('request-1').filename == 'second.mp4'
+    assert store.stats()['entries'] == 1
+
+
+def test_journal_is_shared_and_compacted(tmp_path):
+    folder = str(tmp_path)
+    writer = DownloadStore(folder)
+    reader = DownloadStore(folder)
+    writer.put('a', write_file(folder, 'a.mp4'), aliases=['a-alias'])
+    writer.put('b', write_file(folder, 'b.mp4'))
+    writer.remove('b')
+
+    # Worker lain melihat perubahan lewat journal tanpa menulis ulang index
+    assert reader.get('a-alias').filename == 'a.mp4'
+    reader.sync()
+    assert [entry.key for entry in reader.entries()] == ['a']
+    assert writer.stats()['journal_records'] == 3
+
+    assert writer.compact(force=True)
+    assert writer.stats()['journal_records'] == 0
+    assert os.path.getsize(writer.journal_path) == 0
+    writer.put('c', write_file(folder, 'c.mp4'))
+    reader.sync()
+    assert sorted(entry.key for entry in reader.entries()) == ['a', 'c']
+
+    reopened = DownloadStore(folder)
+    assert sorted(entry.key for entry in reopened.entries()) == ['a', 'c']
+    assert reopened.get('a-alias').key == 'a'
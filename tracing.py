@@ -0,0 +1,461 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+
+# ============================================
+# REQUEST TRACING (CHROME TRACE / OTLP)
+# ============================================
+
+TRACING_ENABLED = os.environ.get('TRACING', '1') != '0'
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0))  # porsi request yang selalu disimpan
+TRACE_SLOW_SECONDS = float(os.environ.get('TRACE_SLOW_SECONDS', 10))  # trace dengan span selama ini disimpan
+TRACE_BUFFER = int(os.environ.get('TRACE_BUFFER', 200))  # trace tersimpan di memori
+OTLP_ENDPOINT = os.environ.get('OTLP_ENDPOINT', '')  # mis. http://127.0.0.1:4318 (OTLP/HTTP JSON)
+TRACES_API_ENABLED = os.environ.get('TRACES_API', '0') == '1'  # /api/traces hanya aktif jika diizinkan
+TRACE_MAX_SPANS = 2000  # per trace
+TRACE_MAX_EVENTS = 500  # per span
+OTLP_BATCH_SIZE = 64
+SERVICE_NAME = 'vtmu'
+
+# Header request untuk memaksa trace disimpan (nilai "1")
+TRACE_HEADER = 'X-Trace'
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('vtmu_span', default=None)
+
+
+def _new_id(bits):
+    return f'{random.getrandbits(bits):0{bits // 4}x}'
+
+
+class Trace:
+    """Spans of one request, including the download job it started"""
+
+    __slots__ = ('trace_id', 'spans', 'forced', 'sampled', 'kept', 'dropped_spans', '__weakref__')
+
+    def __init__(self, forced=False, sampled=False):
+        self.trace_id = _new_id(128)
+        self.spans = []
+        self.forced = forced
+        self.sampled = sampled
+        self.kept = False
+        self.dropped_spans = 0
+
+    @property
+    def root(self):
+        return self.spans[0] if self.spans else None
+
+    def add(self, span):
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped_spans += 1
+            return False
+        self.spans.append(span)
+        return True
+
+    def summary(self):
+        root = self.root
+        end = max((span.end for span in self.spans if span.end), default=None)
+        return {
+            'trace_id': self.trace_id,
+            'name': root.name if root else None,
+            'start': root.start / 1e9 if root else None,
+            'duration': round((end - root.start) / 1e9, 6) if root and end else None,
+            'spans': len(self.spans),
+            'attributes': dict(root.attributes) if root else {},
+        }
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'events',
+                 'thread', 'error')
+
+    def __init__(self, trace, name, parent_id=None, start=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.start = start if start is not None else time.time_ns()
+        self.end = None
+        self.attributes = attributes or {}
+        self.events = []
+        self.thread = threading.current_thread().name
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.end - self.start) / 1e9 if self.end else None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name, **attributes):
+        if len(self.events) < TRACE_MAX_EVENTS:
+            self.events.append((time.time_ns(), name, attributes))
+
+    def finish(self, end=None):
+        self.end = end if end is not None else time.time_ns()
+        recorder.offer(self)
+
+
+class TraceRecorder:
+    """Keeps interesting traces and hands them to the OTLP exporter
+
+    A trace is kept when it was forced (X-Trace: 1), picked by
+    TRACE_SAMPLE_RATE, or when any of its spans took TRACE_SLOW_SECONDS.
+    Spans are recorded for every request (it is a few objects per step),
+    so a slow request can be kept after the fact.
+    """
+
+    def __init__(self, size=TRACE_BUFFER, slow_seconds=TRACE_SLOW_SECONDS, exporter=None):
+        self.slow_seconds = slow_seconds
+        self.exporter = exporter
+        self._traces = deque(maxlen=size)
+        self._by_id = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.kept = 0
+
+    def start(self):
+        if self.exporter is not None:
+            self.exporter.start()
+
+    def offer(self, span):
+        trace = span.trace
+        if not trace.kept:
+            if not (trace.forced or trace.sampled or span.duration >= self.slow_seconds):
+                return
+            with self._lock:
+                if not trace.kept:
+                    trace.kept = True
+                    self.kept += 1
+                    if len(self._traces) == self._traces.maxlen:
+                        self._by_id.pop(self._traces[0].trace_id, None)
+                    self._traces.append(trace)
+                    self._by_id[trace.trace_id] = trace
+        if self.exporter is not None:
+            self.exporter.submit(trace)
+
+    def count_started(self):
+        with self._lock:
+            self.started += 1
+
+    def get(self, trace_id):
+        with self._lock:
+            return self._by_id.get(trace_id)
+
+    def recent(self):
+        with self._lock:
+            traces = list(self._traces)
+        return [trace.summary() for trace in reversed(traces)]
+
+    def stats(self):
+        with self._lock:
+            data = {
+                'enabled': TRACING_ENABLED,
+                'api_enabled': TRACES_API_ENABLED,
+                'sample_rate': TRACE_SAMPLE_RATE,
+                'slow_seconds': self.slow_seconds,
+                'started': self.started,
+                'kept': self.kept,
+                'buffered': len(self._traces),
+            }
+        if self.exporter is not None:
+            data['otlp'] = self.exporter.stats()
+        return data
+
+
+# ============================================
+# RECORDING API
+# ============================================
+
+def begin(name, force=False, **attributes):
+    """Start the root span of a request in the current context; return (span, token)"""
+    if not TRACING_ENABLED:
+        return None, None
+    trace = Trace(forced=force, sampled=TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE)
+    recorder.count_started()
+    span = Span(trace, name, attributes=attributes)
+    trace.add(span)
+    return span, _current.set(span)
+
+
+def end(span, token, error=None, **attributes):
+    """Finish a root span started with begin()"""
+    if span is None:
+        return
+    span.set(**attributes)
+    if error is not None:
+        span.error = f'{type(error).__name__}: {error}'
+
+    span.finish()
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Context lain (mis. response streaming selesai di tempat berbeda)
+        _current.set(None)
+
+
+def current_span():
+    return _current.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Child span of the current span; a no-op outside a traced request"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes=attributes)
+    if not parent.trace.add(child):
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def add_span(name, start, end, parent=None, **attributes):
+    """Record an already finished step (times in epoch seconds) under `parent`"""
+    parent = parent or _current.get()
+    if parent is None:
+        return None
+    child = Span(parent.trace, name, parent.span_id, start=int(start * 1e9), attributes=attributes)
+    if parent.trace.add(child):
+        child.finish(int(end * 1e9))
+    return child
+
+
+def event(name, **attributes):
+    """Timestamped note on the current span (yt-dlp messages, retries, ...)"""
+    current = _current.get()
+    if current is not None:
+        current.event(name, **attributes)
+
+
+def propagate(fn):
+    """Wrap fn so it runs in the caller's context (trace) in another thread"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class YtdlLogger:
+    """yt-dlp `logger` option: messages become events of the span that started the call
+
+    Retry messages are also counted on the span ("retries"), so slow
+    extractions/downloads caused by retries stand out. Errors still go to
+    the normal log; debug/warning output stays out of it as before
+    (quiet/no_warnings).
+    """
+
+    def __init__(self, span):
+        self.span = span
+
+    def debug(self, message):
+        if not message.startswith('[debug] '):
+            self._event(message, 'debug')
+
+    def info(self, message):
+        self._event(message, 'info')
+
+    def warning(self, message):
+        self._event(message, 'warning')
+
+    def error(self, message):
+        self._event(message, 'error')
+        logging.getLogger('yt_dlp').error('%s', message)
+
+    def _event(self, message, level):
+        if 'Retrying' in message:
+            self.span.attributes['retries'] = self.span.attributes.get('retries', 0) + 1
+        self.span.event(message[:300], level=level)
+
+
+def ytdl_logger():
+    """YtdlLogger for the current span, or None (yt-dlp default output) when untraced"""
+    current = _current.get()
+    return YtdlLogger(current) if current is not None else None
+
+
+def progress_hooks():
+    """yt-dlp progress hooks recording one span per HLS/DASH fragment ([] when untraced)"""
+    parent = _current.get()
+    if parent is None:
+        return []
+    state = {'index': None, 'started': None}
+
+    def hook(d):
+        index = d.get('fragment_index')
+        if index == state['index'] and d.get('status') != 'finished':
+            return
+        now = time.time()
+        if state['index'] is not None:
+            add_span('fragment', state['started'], now, parent, index=state['index'],
+                     count=d.get('fragment_count'), filename=os.path.basename(d.get('filename') or ''))
+        state['index'], state['started'] = index, now
+        if d.get('status') == 'finished':
+            state['index'] = None
+    return [hook]
+
+
+# ============================================
+# EXPORT
+# ============================================
+
+def chrome_trace(trace):
+    """Trace as Chrome trace JSON (chrome://tracing, Perfetto, speedscope)"""
+    pid = os.getpid()
+    threads = {}
+    events = []
+    for span in list(trace.spans):
+        tid = threads.setdefault(span.thread, len(threads) + 1)
+        args = dict(span.attributes, span_id=span.span_id)
+        if span.error:
+            args['error'] = span.error
+        end = span.end or time.time_ns()
+        events.append({
+            'name': span.name, 'cat': 'span', 'ph': 'X', 'pid': pid, 'tid': tid,
+            'ts': span.start / 1000, 'dur': (end - span.start) / 1000, 'args': args,
+        })
+        for ts, name, attributes in list(span.events):
+            events.append({'name': name, 'cat': 'event', 'ph': 'i', 's': 't', 'pid': pid, 'tid': tid,
+                           'ts': ts / 1000, 'args': attributes})
+    for name, tid in threads.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms',
+            'otherData': {'trace_id': trace.trace_id, 'dropped_spans': trace.dropped_spans}}
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items()
+            if value is not None]
+
+
+def otlp_spans(spans):
+    """Spans in OTLP/JSON form (ids hex-encoded as the JSON mapping requires)"""
+    data = []
+    for span in spans:
+        item = {
+            'traceId': span.trace.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': 2 if span.parent_id is None else 1,  # SERVER untuk root, INTERNAL untuk step
+            'startTimeUnixNano': str(span.start),
+            'endTimeUnixNano': str(span.end or time.time_ns()),
+            'attributes': _otlp_attributes(dict(span.attributes, thread=span.thread)),
+            'events': [{'timeUnixNano': str(ts), 'name': name, 'attributes': _otlp_attributes(attributes)}
+                       for ts, name, attributes in list(span.events)],
+            'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+        }
+        if span.parent_id:
+            item['parentSpanId'] = span.parent_id
+        data.append(item)
+    return data
+
+
+def otlp_payload(spans):
+    return {'resourceSpans': [{
+        'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME})},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': otlp_spans(spans)}],
+    }]}
+
+
+class OtlpExporter:
+    """Background POST of finished spans to an OTLP/HTTP collector (/v1/traces)
+
+    Spans of a kept trace are sent once they are finished; spans that
+    finish later (the download job) go out in a later batch.
+    """
+
+    def __init__(self, endpoint, timeout=5):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.timeout = timeout
+        self._queue = queue.Queue(1000)
+        self._sent_ids = {}
+        self.exported = 0
+        self.errors = 0
+        self.dropped = 0
+        self._thread = None
+
+    def start(self):
+        """Start the export thread of this process; spans submitted before wait in the queue"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='otlp-export', daemon=True)
+        self._thread.start()
+
+    def submit(self, trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            traces = {}
+            trace = self._queue.get()
+            traces[trace.trace_id] = trace
+            while len(traces) < OTLP_BATCH_SIZE:
+                try:
+                    trace = self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    break
+                traces[trace.trace_id] = trace
+            spans = []
+            for trace in traces.values():
+                sent = self._sent_ids.setdefault(trace.trace_id, set())
+                for span in list(trace.spans):
+                    if span.end and span.span_id not in sent:
+                        sent.add(span.span_id)
+                        spans.append(span)
+            if len(self._sent_ids) > TRACE_BUFFER * 2:
+                # Trace lama sudah keluar dari buffer; id-nya tidak perlu diingat
+                for trace_id in list(self._sent_ids)[:len(self._sent_ids) - TRACE_BUFFER]:
+                    del self._sent_ids[trace_id]
+            if spans:
+                self._send(spans)
+
+    def _send(self, spans):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(otlp_payload(spans)).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+            self.exported += len(spans)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("OTLP export to %s failed: %s", self.url, e)
+
+    def stats(self):
+        return {'endpoint': self.url, 'exported_spans': self.exported, 'errors': self.errors,
+                'dropped': self.dropped}
+
+
+recorder = TraceRecorder(exporter=OtlpExporter(OTLP_ENDPOINT) if OTLP_ENDPOINT else None)
@@ -0,0 +1,256 @@
+import copy
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import yt_dlp
+
+# ============================================
+# SHARED YT-DLP OPTIONS AND INSTANCE POOL
+# ============================================
+
+YTDL_POOL_SIZE = int(os.environ.get('YTDL_POOL_SIZE', 4))  # idle instances per profile
+
+INFO = 'info'
+FLAT = 'flat'  # playlist/profil: hanya daftar entry, tanpa ekstraksi tiap video
+DOWNLOAD = 'download'
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+
+BASE_OPTIONS = {
+    'quiet': True,
+    'no_warnings': True,
+    'ignoreerrors': False,
+    # Force IPv4
+    'source_address': '0.0.0.0',
+    # Platform-specific configurations
+    'extractor_args': {
+        'youtube': {
+            'player_client': ['android', 'web', 'ios'],
+            'skip': ['hls', 'dash'],
+        },
+        'tiktok': {
+            'api_hostname': 'api16-normal-c-useast1a.tiktokv.com',
+            'app_version': '34.1.2',
+            'manifest_app_version': '341',
+            'webpage_download': True,
+        },
+        'instagram': {
+            'api': 'graphql',  # Use GraphQL API
+        },
+    },
+    # Retry and timeout settings
+    'retries': 15,
+    'fragment_retries': 15,
+    'socket_timeout': 30,
+    'nocheckcertificate': True,
+    'prefer_insecure': False,
+}
+
+INFO_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin',
+}
+
+PURPOSE_OPTIONS = {
+    INFO: {
+        'extract_flat': False,
+        'no_color': True,
+        'http_headers': INFO_HEADERS,
+    },
+    FLAT: {
+        'extract_flat': 'in_playlist',
+        'no_color': True,
+        'http_headers': INFO_HEADERS,
+    },
+    DOWNLOAD: {
+        'merge_output_format': 'mp4',
+        # Anti-403 measures - Enhanced
+        'http_headers': {
+            'User-Agent': USER_AGENT,
+            'Accept': '*/*',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Sec-Fetch-Dest': 'empty',
+            'Sec-Fetch-Mode': 'cors',
+            'Sec-Fetch-Site': 'same-origin',
+            'Cache-Control': 'max-age=0',
+        },
+        # Restrict filename untuk avoid nama terlalu panjang
+        'restrictfilenames': True,
+        'skip_unavailable_fragments': True,
+        'geo_bypass': True,
+        'age_limit': None,
+    },
+}
+
+PLATFORM_HEADERS = {
+    'instagram': {
+        'Referer': 'https://www.instagram.com/',
+        'X-IG-App-ID': '936619743392459',
+    },
+}
+
+# Extractor yang dimuat saat warm-up per platform
+PLATFORM_EXTRACTORS = {
+    'tiktok': ['TikTok'],
+    'instagram': ['Instagram'],
+    'youtube': ['Youtube'],
+    'unknown': ['Generic'],
+}
+
+logger = logging.getLogger(__name__)
+
+
+def build_options(platform, purpose=INFO, **overrides):
+    """yt-dlp options for a platform and purpose ('info', 'flat' or 'download')"""
+    options = copy.deepcopy(BASE_OPTIONS)
+    options.update(copy.deepcopy(PURPOSE_OPTIONS[purpose]))
+    options['http_headers'].update(PLATFORM_HEADERS.get(platform, {}))
+    options.update(overrides)
+    return options
+
+
+def downloaded_path(ydl, info):
+    """Final path of a finished download, or None if no file was found
+
+    prepare_filename() gives the name before merging/converting; when the
+    postprocessors produced another file its path is in requested_downloads.
+    """
+    filename = ydl.prepare_filename(info)
+    if os.path.exists(filename):
+        return filename
+    for download in reversed(info.get('requested_downloads') or []):
+        if download.get('filepath') and os.path.exists(download['filepath']):
+            return download['filepath']
+    return None
+
+
+class YtdlPool:
+    """Reusable YoutubeDL instances, one idle list per (platform, purpose)
+
+    Creating a YoutubeDL sets up HTTP handlers and the cookie jar, and
+    extractors are only instantiated on first use; reusing instances keeps
+    all of that warm. Per-request options (format, outtmpl, hooks) are
+    reset on every checkout. An instance that raised anything other than a
+    yt-dlp error is closed instead of going back to the pool.
+    """
+
+    def __init__(self, max_idle=YTDL_POOL_SIZE):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self._warmed_pid = None
+
+    def _create(self, platform, purpose):
+        with self._lock:
+            self.created += 1
+        return yt_dlp.YoutubeDL(build_options(platform, purpose))
+
+    @contextmanager
+    def session(self, platform, purpose=INFO, format=None, outtmpl=None,
+                progress_hooks=(), postprocessor_hooks=(), playlistend=None, logger=None):
+        """Check out a YoutubeDL configured for one request
+
+        `logger` replaces yt-dlp's screen/stderr output for this request
+        (see the YoutubeDL 'logger' option), e.g. tracing.YtdlLogger.
+        """
+        profile = (platform, purpose)
+        with self._lock:
+            idle = self._idle.get(profile)
+            ydl = idle.pop() if idle else None
+            if ydl is not None:
+                self.reused += 1
+        if ydl is None:
+            ydl = self._create(platform, purpose)
+
+        self._reset(ydl, format, outtmpl, progress_hooks, postprocessor_hooks, playlistend, logger)
+        try:
+            yield ydl
+        except (yt_dlp.utils.YoutubeDLError, OSError):
+            # Gagal di yt-dlp atau jaringan: state extractor/koneksi tidak bisa dipercaya lagi
+            self._discard(ydl)
+            raise
+        except Exception:
+            # Error milik pemanggil (JobError, validasi): instance tidak tersentuh
+            self._checkin(profile, ydl)
+            raise
+        except BaseException:
+            self._discard(ydl)
+            raise
+        self._checkin(profile, ydl)
+
+    def _reset(self, ydl, format, outtmpl, progress_hooks, postprocessor_hooks, playlistend, logger=None):
+        ydl.params['format'] = format
+        ydl.params['logger'] = logger
+        # Baris progress tidak dikirim ke logger (progress hooks tetap jalan)
+        ydl.params['noprogress'] = logger is not None
+        ydl.params['playlistend'] = playlistend
+        ydl.format_selector = ydl.build_format_selector(format) if format else None
+        ydl.params['outtmpl'] = {'default': outtmpl} if outtmpl else {}
+        ydl._parse_outtmpl()
+        ydl._progress_hooks = list(progress_hooks)
+        ydl._postprocessor_hooks = list(postprocessor_hooks)
+        ydl._download_retcode = 0
+        ydl._num_downloads = 0
+        # Cookie dari request sebelumnya (mis. sesi login/challenge) tidak boleh terbawa
+        ydl.cookiejar.clear()
+
+    def _discard(self, ydl):
+        with self._lock:
+            self.discarded += 1
+        ydl.close()
+
+    def _checkin(self, profile, ydl):
+        # Hook job tidak boleh tertahan di instance yang menganggur
+        ydl._progress_hooks = []
+        ydl._postprocessor_hooks = []
+        ydl.params['logger'] = None
+        with self._lock:
+            idle = self._idle.setdefault(profile, [])
+            if len(idle) < self.max_idle:
+                idle.append(ydl)
+                return
+        ydl.close()
+
+    def warm(self, platforms=tuple(PLATFORM_EXTRACTORS), purposes=(INFO, DOWNLOAD)):
+        """Pre-create one instance per profile with its extractors loaded"""
+        for platform in platforms:
+            for purpose in purposes:
+                try:
+                    ydl = self._create(platform, purpose)
+                    for ie_key in PLATFORM_EXTRACTORS.get(platform, []):
+                        ydl.get_info_extractor(ie_key)
+                    self._checkin((platform, purpose), ydl)
+                except Exception:
+                    logger.exception("Failed to warm yt-dlp profile %s/%s", platform, purpose)
+
+    def start_warmup(self):
+        """Warm this process's pool in the background, once per process"""
+        with self._lock:
+            if self._warmed_pid == os.getpid():
+                return
+            self._warmed_pid = os.getpid()
+        threading.Thread(target=self.warm, name='ytdl-warmup', daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'idle': {f'{p}/{u}': len(items) for (p, u), items in self._idle.items()},
+            }